@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+HTTP API服务 - 以编程接口提供合规检测、文本分析、模板分析与渲染
+
+用法:
+    python api_server.py --port 8600 --workers 4 --metrics
+
+接口（请求与响应均为JSON，图片使用base64编码）:
+    POST /api/compliance         {"text"}
+    POST /api/analyze/text       {"text", "title"?, "top_k"?}
+    POST /api/analyze/template   {"image", "reference_image"?}
+    POST /api/render             {"image", "texts", "style_config"?}
+    GET  /api/metrics            各接口请求数、错误数与延迟分位数，以及各阶段耗时统计
+    GET  /metrics                Prometheus 文本格式的指标（阶段耗时直方图、计数器、缓存命中率）
+    GET  /api/health
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from utils.text_processor import TextProcessor
+from utils.image_processor import ImageProcessor
+from utils.image_backends import LatencyTracker
+from utils.image_ingest import ingest_image
+from utils.instrumentation import instrumentation
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+class ServiceBusy(Exception):
+    """工作池和等待队列都已占满"""
+
+
+class EndpointMetrics:
+    """单个接口的请求计数与延迟统计"""
+
+    def __init__(self):
+        self.latency = LatencyTracker(window=2000)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def record(self, seconds: float, status: int):
+        self.latency.record(seconds)
+        with self._lock:
+            self.requests += 1
+            if status == 503:
+                self.rejected += 1
+            elif status >= 400:
+                self.errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = {"requests": self.requests, "errors": self.errors, "rejected": self.rejected}
+        for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            value = self.latency.quantile(q)
+            counts[name] = round(value * 1000, 2) if value is not None else None
+        return counts
+
+
+class GenerationService:
+    """
+    生成流水线服务：共享并预热的 TextProcessor / ImageProcessor，
+    所有计算在有界工作池中执行，超出容量的请求直接返回503
+    """
+
+    def __init__(self, max_workers: int = 4, queue_size: int = 16):
+        self.text_processor = TextProcessor()
+        self.image_processor = ImageProcessor()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api")
+        self._slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self._metrics: Dict[str, EndpointMetrics] = {}
+        self._metrics_lock = threading.Lock()
+        self.started_at = time.time()
+
+        self.routes: Dict[str, Callable[[Dict], Dict]] = {
+            "/api/compliance": self.compliance,
+            "/api/analyze/text": self.analyze_text,
+            "/api/analyze/template": self.analyze_template,
+            "/api/render": self.render,
+        }
+
+    def warm_up(self):
+        """预热：加载jieba词典、字体和OpenCV，避免首个请求承担冷启动开销"""
+        self.text_processor.check_forbidden_words("预热")
+        self.text_processor.extract_keywords("预热文本，加载分词词典", 3)
+        template = Image.new("RGB", (64, 64), color="white")
+        self.image_processor.analyze_template(template)
+        self.image_processor.render_text_on_template(template, {"title": "预热"}, {})
+
+    def metrics_for(self, route: str) -> EndpointMetrics:
+        with self._metrics_lock:
+            if route not in self._metrics:
+                self._metrics[route] = EndpointMetrics()
+                instrumentation.register_collector("api", self._metrics[route].snapshot, {"route": route})
+            return self._metrics[route]
+
+    def get_metrics(self) -> Dict:
+        with self._metrics_lock:
+            routes = dict(self._metrics)
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "workers": self.max_workers,
+            "queue_size": self.queue_size,
+            "endpoints": {route: metrics.snapshot() for route, metrics in routes.items()},
+            "instrumentation": instrumentation.snapshot(),
+        }
+
+    def execute(self, route: str, payload: Dict) -> Dict:
+        """在工作池中执行接口处理函数，池满时抛出 ServiceBusy"""
+        if not self._slots.acquire(blocking=False):
+            raise ServiceBusy()
+        try:
+            return self._executor.submit(self.routes[route], payload).result()
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _require(payload: Dict, field: str):
+        if field not in payload or payload[field] in (None, ""):
+            raise ValueError(f"缺少字段: {field}")
+        return payload[field]
+
+    def _decode_image(self, data: str) -> Image.Image:
+        try:
+            raw = base64.b64decode(data)
+        except Exception as e:
+            raise ValueError(f"图片解码失败: {e}")
+        # 超出字节或像素预算时 IngestError（ValueError）直接作为400返回
+        return ingest_image(raw)[0]
+
+    def compliance(self, payload: Dict) -> Dict:
+        return self.text_processor.check_forbidden_words(self._require(payload, "text"))
+
+    def analyze_text(self, payload: Dict) -> Dict:
+        text = self._require(payload, "text")
+        result = {
+            "keywords": self.text_processor.extract_keywords(text, int(payload.get("top_k", 10))),
+            "selling_points": self.text_processor.extract_selling_points(text),
+        }
+        if payload.get("title"):
+            result["title_variants"] = self.text_processor.generate_title_variants(payload["title"])
+        return result
+
+    def analyze_template(self, payload: Dict) -> Dict:
+        template = self._decode_image(self._require(payload, "image"))
+        reference = None
+        if payload.get("reference_image"):
+            reference = self._decode_image(payload["reference_image"])
+        return self.image_processor.analyze_template(template, reference)
+
+    def render(self, payload: Dict) -> Dict:
+        template = self._decode_image(self._require(payload, "image"))
+        texts = self._require(payload, "texts")
+        style_config = payload.get("style_config") or {}
+        layout = payload.get("layout")
+        if not isinstance(texts, dict):
+            raise ValueError("texts 必须是JSON对象")
+        if not isinstance(style_config, dict) or not isinstance(layout, (dict, type(None))):
+            raise ValueError("style_config 和 layout 必须是JSON对象")
+        image = self.image_processor.render_text_on_template(template, texts, style_config, layout)
+        return {"image": self.image_processor.image_to_base64(image), "width": image.width, "height": image.height}
+
+
+class _APIHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理器，server.service 上挂载了 GenerationService"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        self._send_bytes(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                         "application/json; charset=utf-8")
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/api/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/api/metrics":
+            self._send_json(200, service.get_metrics())
+        elif self.path == "/metrics":
+            self._send_bytes(200, instrumentation.to_prometheus().encode("utf-8"),
+                             "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": "接口不存在"})
+
+    def do_POST(self):
+        service = self.server.service
+        route = self.path.split("?", 1)[0]
+        if route not in service.routes:
+            return self._send_json(404, {"error": "接口不存在"})
+
+        start = time.perf_counter()
+        status, payload = self._dispatch(service, route)
+        service.metrics_for(route).record(time.perf_counter() - start, status)
+        self._send_json(status, payload)
+
+    def _dispatch(self, service: GenerationService, route: str) -> Tuple[int, Dict]:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # 无法确定请求体的边界，不读取，处理完后关闭连接
+            self.close_connection = True
+            return 400, {"error": "Content-Length 无效"}
+        if length > MAX_BODY_BYTES:
+            # 不读取请求体，处理完后关闭连接
+            self.close_connection = True
+            return 413, {"error": "请求体过大"}
+
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是JSON对象")
+            return 200, service.execute(route, payload)
+        except ServiceBusy:
+            return 503, {"error": "服务繁忙，请稍后重试"}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            print(f"接口处理失败 {route}: {str(e)}")
+            return 500, {"error": "服务内部错误"}
+
+
+class APIServer:
+    """HTTP服务封装，port=0 时自动选择空闲端口"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8600,
+                 max_workers: int = 4, queue_size: int = 16, warm_up: bool = True):
+        self.service = GenerationService(max_workers, queue_size)
+        if warm_up:
+            self.service.warm_up()
+        self._httpd = ThreadingHTTPServer((host, port), _APIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.service = self.service
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "APIServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="智能电商主图生成器 - HTTP API服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=4, help="工作线程数")
+    parser.add_argument("--queue-size", type=int, default=16, help="等待队列长度，超出返回503")
+    parser.add_argument("--metrics", action="store_true", help="打开各阶段耗时统计（/metrics 接口）")
+    parser.add_argument("--metrics-log", default=None, help="同时把每次计时写入该JSON日志（每行一个对象）")
+    args = parser.parse_args()
+
+    if args.metrics or args.metrics_log:
+        instrumentation.enable(args.metrics_log)
+
+    print("🔥 正在预热处理器...")
+    server = APIServer(args.host, args.port, args.workers, args.queue_size)
+    print(f"🚀 API服务已启动: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服务已关闭")
+        server.stop()
+        instrumentation.flush()
+
+
+if __name__ == "__main__":
+    main()
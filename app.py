@@ -1,17 +1,30 @@
 import streamlit as st
 import pandas as pd
-from PIL import Image
+from PIL import Image, ImageDraw
 import base64
-import io
+import copy
 import json
 import os
+import time
+import uuid
 from typing import Dict, List, Optional
 
 # 导入自定义工具类
 from utils.text_processor import TextProcessor
-from utils.image_processor import ImageProcessor
+from utils.process_offload import OffloadedImageProcessor
 from utils.ai_generator import AIGenerator
-from config import DEFAULT_FONT_CONFIG, IMAGE_SIZES, AI_MODELS
+from utils.image_backends import list_image_backends
+from utils.preview_render import RenderDebouncer, get_preview_renderer
+from utils.incremental_render import RenderSession
+from utils.analysis_cache import hash_inputs
+from utils.image_cache import ingest_upload, encode_image
+from utils.image_ingest import IngestError
+from utils.asset_store import get_asset_store
+from utils.generation_pipeline import build_generation_pipeline, RENDER_SESSION_KEY
+from utils.pipeline import Pipeline, format_timings
+from utils.instrumentation import instrumentation
+from utils.job_queue import get_job_queue, Job, JobContext, PENDING, RUNNING, DONE, FAILED
+from config import DEFAULT_FONT_CONFIG, IMAGE_SIZES, AI_MODELS, JOB_POLL_INTERVAL, INSTRUMENTATION_LOG
 
 # 页面配置
 st.set_page_config(
@@ -26,17 +39,27 @@ if 'text_processor' not in st.session_state:
     st.session_state.text_processor = TextProcessor()
 
 if 'image_processor' not in st.session_state:
-    st.session_state.image_processor = ImageProcessor()
+    # 模板分析与渲染放到共享进程池，不阻塞同一服务进程中的其他会话
+    st.session_state.image_processor = OffloadedImageProcessor()
 
 if 'ai_generator' not in st.session_state:
     st.session_state.ai_generator = AIGenerator()
 
-if 'generated_images' not in st.session_state:
-    st.session_state.generated_images = {}
+# 会话中只保存图片的资源键，图片由进程级资源仓库按内存预算统一管理
+if 'image_keys' not in st.session_state:
+    st.session_state.image_keys = {}
 
 if 'analysis_results' not in st.session_state:
     st.session_state.analysis_results = {}
 
+# 文章分析、模板分析、主图渲染和详情页导出按依赖关系组成流水线，输入没变的阶段直接使用缓存
+if 'pipeline' not in st.session_state:
+    st.session_state.pipeline = build_generation_pipeline(
+        st.session_state.text_processor,
+        st.session_state.image_processor,
+        st.session_state.ai_generator
+    )
+
 def main():
     """主函数"""
     st.title("🎨 智能电商主图与详情页生成器")
@@ -64,6 +87,11 @@ def main():
     
     with tab4:
         detail_page_generation_section()
+    
+    # 有未完成的后台任务时定时重跑，轮询进度
+    if st.session_state.pop('poll_jobs', False):
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
 
 def setup_sidebar():
     """设置侧边栏 - AI配置"""
@@ -80,16 +108,36 @@ def setup_sidebar():
     if openai_key:
         st.session_state.ai_generator.set_openai_key(openai_key)
         st.sidebar.success("✅ OpenAI API已连接")
-    
+
+        coalescing = st.session_state.ai_generator.get_coalescing_stats()
+        if coalescing["coalesced"]:
+            st.sidebar.caption(f"🔁 已合并重复请求 {coalescing['coalesced']} 次")
+
     # AI模型选择
     st.sidebar.subheader("生图模型选择")
     selected_model = st.sidebar.selectbox(
         "选择AI生图模型",
-        options=["dall-e-3", "dall-e-2"],
+        options=list_image_backends(),
         index=0
     )
     st.session_state.selected_model = selected_model
-    
+
+    enable_hedging = st.sidebar.checkbox(
+        "对冲请求",
+        value=False,
+        help="主模型超过p95延迟仍未返回时，同时请求备用模型，取先返回的结果"
+    )
+    hedge_model = None
+    if enable_hedging:
+        hedge_model = st.sidebar.selectbox(
+            "备用模型",
+            options=[m for m in list_image_backends() if m != selected_model]
+        )
+
+    generator = st.session_state.ai_generator
+    if (generator.image_model, generator.hedge_model) != (selected_model, hedge_model):
+        generator.set_image_backend(selected_model, hedge_model)
+
     # 图片参数配置
     st.sidebar.subheader("图片参数")
     image_size = st.sidebar.selectbox(
@@ -124,6 +172,50 @@ def setup_sidebar():
         "color_scheme": color_scheme,
         "style": style_preference
     }
+    
+    timing_panel()
+
+def timing_panel():
+    """侧边栏的性能统计面板：各阶段耗时和缓存命中率"""
+    st.sidebar.subheader("⏱️ 性能统计")
+    enabled = st.sidebar.checkbox(
+        "记录各阶段耗时",
+        value=instrumentation.enabled,
+        help="统计分词、k-means、字体加载、图片编码和AI请求等阶段的耗时（进程内所有会话共享）"
+    )
+    if enabled != instrumentation.enabled:
+        if enabled:
+            instrumentation.enable(INSTRUMENTATION_LOG)
+        else:
+            instrumentation.disable()
+    if not enabled:
+        return
+    
+    snapshot = instrumentation.snapshot()
+    if snapshot["spans"]:
+        rows = [
+            {"阶段": name, "次数": stats["count"], "平均ms": stats["mean_ms"],
+             "最大ms": stats["max_ms"], "总计s": round(stats["total_seconds"], 2)}
+            for name, stats in snapshot["spans"].items()
+        ]
+        st.sidebar.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    else:
+        st.sidebar.caption("还没有记录，操作页面后这里显示各阶段耗时")
+    
+    caches = [
+        f"{collector['labels']['cache']} {collector['values'].get('hit_rate', 0):.0%}"
+        for collector in snapshot["collectors"] if collector["name"] == "cache"
+    ]
+    if caches:
+        st.sidebar.caption("缓存命中率：" + "，".join(caches))
+    
+    col1, col2 = st.sidebar.columns(2)
+    if col1.button("📝 写入日志"):
+        path = instrumentation.flush()
+        if path:
+            st.sidebar.caption(f"已写入 {path}")
+    if col2.button("🧹 清空统计"):
+        instrumentation.reset()
 
 def article_input_section():
     """文章输入与分析部分"""
@@ -155,10 +247,12 @@ def article_input_section():
         st.subheader("📊 实时分析")
         
         if article_title and article_content:
-            # 违禁词检测
-            forbidden_check = st.session_state.text_processor.check_forbidden_words(
-                article_title + " " + article_content
+            # 违禁词检测、关键词和卖点提取互不依赖，并行执行
+            run = st.session_state.pipeline.run(
+                {"article_title": article_title, "article_content": article_content},
+                ["compliance", "keywords", "selling_points"]
             )
+            forbidden_check = run["compliance"]
             
             if forbidden_check["has_forbidden"]:
                 st.error("⚠️ 检测到违禁词")
@@ -169,17 +263,13 @@ def article_input_section():
                 st.success("✅ 文本合规")
             
             # 关键词提取
-            keywords = st.session_state.text_processor.extract_keywords(
-                article_content, 8
-            )
+            keywords = run["keywords"]
             st.subheader("🔑 关键词")
             for i, keyword in enumerate(keywords[:5], 1):
                 st.write(f"{i}. {keyword}")
             
             # 卖点提取
-            selling_points = st.session_state.text_processor.extract_selling_points(
-                article_content
-            )
+            selling_points = run["selling_points"]
             if selling_points:
                 st.subheader("💡 核心卖点")
                 for point in selling_points[:3]:
@@ -202,9 +292,15 @@ def template_upload_section():
         )
         
         if template_file:
-            template_image = Image.open(template_file)
-            st.image(template_image, caption="模板框架", use_column_width=True)
-            st.session_state.template_image = template_image
+            try:
+                template_image, report = ingest_upload(template_file.getvalue())
+            except IngestError as e:
+                st.error(f"模板图片无法使用: {str(e)}")
+            else:
+                # 直接展示原始文件字节，避免每次重跑都重新编码
+                st.image(template_file.getvalue(), caption="模板框架", use_column_width=True)
+                st.caption(format_ingest_report(report))
+                store_session_image('template_image', template_image)
     
     with col2:
         st.subheader("🎯 参考成品")
@@ -215,45 +311,96 @@ def template_upload_section():
         )
         
         if reference_file:
-            reference_image = Image.open(reference_file)
-            st.image(reference_image, caption="参考成品", use_column_width=True)
-            st.session_state.reference_image = reference_image
+            try:
+                reference_image, report = ingest_upload(reference_file.getvalue())
+            except IngestError as e:
+                st.error(f"参考图片无法使用: {str(e)}")
+            else:
+                st.image(reference_file.getvalue(), caption="参考成品", use_column_width=True)
+                st.caption(format_ingest_report(report))
+                store_session_image('reference_image', reference_image)
     
     # 模板分析
     if st.button("🔍 分析模板", type="primary"):
-        if 'template_image' in st.session_state:
+        template_key = st.session_state.image_keys.get('template_image')
+        if template_key is not None and get_asset_store().contains(template_key):
             with st.spinner("正在分析模板..."):
-                reference_img = st.session_state.get('reference_image', None)
-                analysis = st.session_state.image_processor.analyze_template(
-                    st.session_state.template_image,
-                    reference_img
+                run = st.session_state.pipeline.run(
+                    {"template_key": template_key,
+                     "reference_key": st.session_state.image_keys.get('reference_image')},
+                    ["template_analysis"]
                 )
-                st.session_state.template_analysis = analysis
+                st.session_state.template_analysis = run["template_analysis"]
                 
                 st.success("✅ 模板分析完成")
-                
-                # 显示分析结果
-                st.subheader("📊 分析结果")
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("图片尺寸", f"{analysis['width']}×{analysis['height']}")
-                
-                with col2:
-                    st.metric("宽高比", f"{analysis['aspect_ratio']:.2f}")
-                
-                with col3:
-                    st.metric("文本区域", len(analysis['text_regions']))
-                
-                # 显示颜色调色板
-                if analysis['color_palette']:
-                    st.subheader("🎨 主要颜色")
-                    colors_html = ""
-                    for color in analysis['color_palette'][:6]:
-                        colors_html += f'<div style="display:inline-block; width:50px; height:30px; background-color:{color}; margin:5px; border:1px solid #ccc;"></div>'
-                    st.markdown(colors_html, unsafe_allow_html=True)
+                show_stage_timings(run.timings)
         else:
             st.error("请先上传模板图片")
+    
+    # 分析结果保存在会话中，页面重跑（轮询后台任务、实时预览防抖）后仍然显示
+    if st.session_state.get('template_analysis'):
+        show_template_analysis(st.session_state.template_analysis, get_session_image('template_image'))
+
+def show_template_analysis(analysis: Dict, template_image: Optional[Image.Image]):
+    """
+    显示模板分析结果：基本信息、主要颜色、文字排版区域和参考样式
+    
+    Args:
+        analysis: 模板分析结果
+        template_image: 模板图片，用于标出排版区域（可选）
+    """
+    st.subheader("📊 分析结果")
+    if analysis.get('near_duplicate'):
+        st.caption(f"♻️ 与已分析过的模板近似重复（感知哈希距离 {analysis['near_duplicate']['distance']}），已复用其分析结果")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("图片尺寸", f"{analysis['width']}×{analysis['height']}")
+    
+    with col2:
+        st.metric("宽高比", f"{analysis['aspect_ratio']:.2f}")
+    
+    with col3:
+        st.metric("文本区域", len(analysis['text_regions']))
+    
+    # 显示颜色调色板
+    if analysis['color_palette']:
+        st.subheader("🎨 主要颜色")
+        colors_html = ""
+        for color in analysis['color_palette'][:6]:
+            colors_html += f'<div style="display:inline-block; width:50px; height:30px; background-color:{color}; margin:5px; border:1px solid #ccc;"></div>'
+        st.markdown(colors_html, unsafe_allow_html=True)
+    
+    # 在模板上标出按显著度选出的文字排版区域
+    if template_image is not None and template_image.size == (analysis['width'], analysis['height']):
+        zones_preview = template_image.convert("RGB")
+        zones_draw = ImageDraw.Draw(zones_preview)
+        zone_colors = {"header": "#FF6B35", "main": "#1E90FF", "footer": "#2E8B57"}
+        for name, zone in analysis['layout_zones'].items():
+            zones_draw.rectangle(
+                [zone['x'], zone['y'], zone['x'] + zone['width'] - 1, zone['y'] + zone['height'] - 1],
+                outline=zone_colors.get(name, "#FF0000"), width=max(2, analysis['width'] // 200)
+            )
+        st.subheader("📐 文字排版区域")
+        st.image(zones_preview, caption="橙色：标题　蓝色：副标题　绿色：卖点", use_column_width=True)
+    
+    # 显示从参考成品中提取的样式，主图生成时作为默认值
+    reference_style = analysis.get('reference_style')
+    if reference_style:
+        st.subheader("🎯 参考样式")
+        background_names = {"solid": "纯色", "gradient": "渐变", "image": "图片"}
+        for label, key in (("标题", "title_style"), ("副标题", "subtitle_style")):
+            style = reference_style[key]
+            st.markdown(
+                f'<span style="display:inline-block; width:16px; height:16px; background-color:{style["color"]}; '
+                f'border:1px solid #ccc; vertical-align:middle;"></span> '
+                f'{label}：{style["color"]}，约 {style["size"]}px，'
+                f'{"粗体" if style["weight"] == "bold" else "常规"}，位置 {style["position"]}',
+                unsafe_allow_html=True
+            )
+        st.caption(f"背景：{background_names.get(reference_style['background_style'], reference_style['background_style'])}"
+                   f"　强调色：{reference_style['highlight_color']}"
+                   + ("" if reference_style.get("complete", True) else "　（超出时间预算，部分为默认值）"))
 
 def main_image_generation_section():
     """主图生成部分"""
@@ -268,11 +415,33 @@ def main_image_generation_section():
     with col1:
         st.subheader("⚙️ 生成设置")
         
-        # 标题变体选择
-        title_variants = st.session_state.text_processor.generate_title_variants(
-            st.session_state.article_title
-        )
-        
+        # 标题变体选择，结果是共享的缓存，追加AI建议前先复制
+        title_variants = list(st.session_state.pipeline.run(
+            {"article_title": st.session_state.article_title}, ["title_variants"]
+        )["title_variants"])
+
+        # AI流式优化标题，生成过程中实时显示并增量检测违禁词
+        if st.session_state.ai_generator.openai_client:
+            if st.button("✨ AI优化标题"):
+                placeholder = st.empty()
+                stream = st.session_state.ai_generator.optimize_text_with_gpt_stream(
+                    st.session_state.article_title, "title"
+                )
+                for _ in stream:
+                    placeholder.markdown(f"🤖 {stream.text}▌")
+                placeholder.markdown(f"🤖 {stream.text}")
+
+                if stream.aborted:
+                    st.warning(f"⚠️ 检测到违禁词 {', '.join(stream.forbidden_words)}，已提前终止生成")
+                elif stream.error is not None:
+                    st.error("AI优化失败，请检查API配置或稍后重试")
+                elif stream.text.strip():
+                    st.session_state.ai_title_suggestion = stream.text.strip()
+
+            suggestion = st.session_state.get('ai_title_suggestion')
+            if suggestion and suggestion not in title_variants:
+                title_variants.append(suggestion)
+
         selected_title = st.selectbox(
             "选择标题变体",
             options=title_variants,
@@ -296,61 +465,57 @@ def main_image_generation_section():
         
         # 字体样式配置
         st.subheader("🔤 字体样式")
-        font_size_title = st.slider("标题字体大小", 20, 60, 36)
-        font_size_subtitle = st.slider("副标题字体大小", 14, 40, 24)
+        # 分析过参考成品时，默认值取自参考样式
+        defaults = reference_style_defaults(st.session_state.get('template_analysis'))
+        font_size_title = st.slider("标题字体大小", 20, 60, defaults["title_size"])
+        font_size_subtitle = st.slider("副标题字体大小", 14, 40, defaults["subtitle_size"])
         
-        title_color = st.color_picker("标题颜色", "#FF6B35")
-        subtitle_color = st.color_picker("副标题颜色", "#333333")
+        title_color = st.color_picker("标题颜色", defaults["title_color"])
+        subtitle_color = st.color_picker("副标题颜色", defaults["subtitle_color"])
+    
+        # 模板渲染时拖动滑块即可看到低分辨率预览，停止调整后自动渲染全分辨率
+        live_preview = st.checkbox("⚡ 实时预览", value=True, help="调整样式时先显示低分辨率预览")
+    
+    # 模板渲染的参数
+    style_config = {
+        "title": {
+            "size": font_size_title,
+            "color": title_color,
+            "weight": "bold"
+        },
+        "subtitle": {
+            "size": font_size_subtitle,
+            "color": subtitle_color,
+            "weight": "normal"
+        }
+    }
+    texts = {"title": selected_title}
+    if custom_subtitle:
+        texts["subtitle"] = custom_subtitle
+    template_key = st.session_state.image_keys.get('template_image')
+    previewing = live_preview and generation_method == "模板渲染" and template_key is not None
     
     with col2:
         st.subheader("🖼️ 生成结果")
         
+        signature = None
+        if previewing:
+            signature = hash_inputs(template_key, texts, style_config, st.session_state.get('template_analysis'))
+            debouncer = st.session_state.setdefault('render_debouncer', RenderDebouncer())
+            if debouncer.observe(signature):
+                submit_template_render(template_key, texts, style_config)
+                st.session_state.main_image_signature = signature
+            elif debouncer.waiting:
+                # 防抖等待中，稍后重跑脚本再检查
+                st.session_state.poll_jobs = True
+        
         if st.button("🚀 开始生成主图", type="primary"):
-            if generation_method == "模板渲染" and 'template_image' in st.session_state:
-                # 模板渲染方式
-                with st.spinner("正在渲染主图..."):
-                    style_config = {
-                        "title": {
-                            "size": font_size_title,
-                            "color": title_color,
-                            "weight": "bold"
-                        },
-                        "subtitle": {
-                            "size": font_size_subtitle,
-                            "color": subtitle_color,
-                            "weight": "normal"
-                        }
-                    }
-                    
-                    texts = {"title": selected_title}
-                    if custom_subtitle:
-                        texts["subtitle"] = custom_subtitle
-                    
-                    # 添加卖点
-                    selling_points = st.session_state.text_processor.extract_selling_points(
-                        st.session_state.article_content
-                    )
-                    if selling_points:
-                        texts["selling_points"] = selling_points[:3]
-                    
-                    generated_image = st.session_state.image_processor.render_text_on_template(
-                        st.session_state.template_image,
-                        texts,
-                        style_config
-                    )
-                    
-                    st.session_state.generated_main_image = generated_image
-                    st.image(generated_image, caption="生成的主图", use_column_width=True)
-                    
-                    # 提供下载按钮
-                    img_buffer = io.BytesIO()
-                    generated_image.save(img_buffer, format='PNG')
-                    st.download_button(
-                        label="💾 下载主图",
-                        data=img_buffer.getvalue(),
-                        file_name="main_image.png",
-                        mime="image/png"
-                    )
+            if generation_method == "模板渲染" and template_key is not None:
+                # 模板渲染方式，提交到后台任务队列
+                submit_template_render(template_key, texts, style_config)
+                st.session_state.main_image_signature = signature
+                if previewing:
+                    st.session_state.render_debouncer.mark_submitted(signature)
             
             elif generation_method == "AI生成":
                 # AI生成方式
@@ -358,41 +523,178 @@ def main_image_generation_section():
                     st.error("请先在侧边栏配置OpenAI API密钥")
                     return
                 
-                with st.spinner("正在使用AI生成主图..."):
-                    # 生成提示词
-                    prompt = st.session_state.ai_generator.generate_image_prompt(
-                        selected_title,
-                        st.session_state.article_content,
-                        st.session_state.style_preferences
-                    )
-                    
-                    st.write("🤖 生成提示词:", prompt)
-                    
-                    # 调用AI生成
-                    ai_image = st.session_state.ai_generator.generate_image_with_dalle(
-                        prompt,
-                        st.session_state.image_size,
-                        st.session_state.image_quality
-                    )
-                    
-                    if ai_image:
-                        st.session_state.generated_main_image = ai_image
-                        st.image(ai_image, caption="AI生成的主图", use_column_width=True)
-                        
-                        # 提供下载按钮
-                        img_buffer = io.BytesIO()
-                        ai_image.save(img_buffer, format='PNG')
-                        st.download_button(
-                            label="💾 下载主图",
-                            data=img_buffer.getvalue(),
-                            file_name="ai_main_image.png",
-                            mime="image/png"
-                        )
-                    else:
-                        st.error("AI生成失败，请检查API配置或稍后重试")
+                st.session_state.main_image_job = get_job_queue().submit(
+                    "ai_image",
+                    ai_main_image_job,
+                    st.session_state.ai_generator,
+                    selected_title,
+                    st.session_state.article_content,
+                    st.session_state.style_preferences,
+                    st.session_state.image_size,
+                    st.session_state.image_quality,
+                    owner=get_session_owner()
+                )
             
             else:
                 st.info("结合生成功能正在开发中...")
+        
+        # 显示后台任务进度与结果，重跑脚本不会中断任务
+        job = show_job_status('main_image_job', "正在生成主图...")
+        # 全分辨率结果还没有按当前参数渲染好时先显示预览，结果就绪后替换
+        is_current = not previewing or st.session_state.get('main_image_signature') == signature
+        if previewing and not (is_current and job and job.status == DONE):
+            show_main_image_preview(template_key, texts, style_config, signature)
+        if job and job.status == DONE and is_current:
+            result = job.result
+            image = get_asset_store().get(result["image_key"]) if result["image_key"] else None
+            if image is None:
+                st.error("AI生成失败，请检查API配置或稍后重试")
+            else:
+                if result.get("prompt"):
+                    st.write("🤖 生成提示词:", result["prompt"])
+                
+                st.session_state.image_keys['generated_main_image'] = result["image_key"]
+                image_bytes = encode_image(image)
+                st.image(image_bytes, caption=result["caption"], use_column_width=True)
+                if result.get("timings"):
+                    show_stage_timings(result["timings"])
+                
+                # 提供下载按钮，同一结果只编码一次
+                st.download_button(
+                    label="💾 下载主图",
+                    data=image_bytes,
+                    file_name=result["file_name"],
+                    mime="image/png"
+                )
+                
+                # 模板渲染的结果可以一次导出全部尺寸
+                request = st.session_state.get('main_image_request')
+                if result.get("template_key") and request:
+                    if st.button("📐 导出全部尺寸"):
+                        st.session_state.multi_size_job = get_job_queue().submit(
+                            "multi_size",
+                            multi_size_job,
+                            st.session_state.pipeline,
+                            request,
+                            owner=get_session_owner()
+                        )
+                    
+                    sizes_job = show_job_status('multi_size_job', "正在导出全部尺寸...")
+                    if sizes_job and sizes_job.status == DONE:
+                        show_stage_timings(sizes_job.result["timings"])
+                        st.download_button(
+                            label=f"💾 下载全部尺寸（{len(sizes_job.result['sizes'])} 张）",
+                            data=sizes_job.result["zip"],
+                            file_name="main_image_sizes.zip",
+                            mime="application/zip"
+                        )
+
+def reference_style_defaults(analysis: Optional[Dict]) -> Dict:
+    """
+    主图字体样式的默认值，有参考样式时按模板高度换算参考图中的文字高度
+    
+    Args:
+        analysis: 模板分析结果
+        
+    Returns:
+        标题、副标题的默认字号和颜色
+    """
+    defaults = {"title_size": 36, "subtitle_size": 24, "title_color": "#FF6B35", "subtitle_color": "#333333"}
+    reference_style = (analysis or {}).get('reference_style')
+    if not reference_style:
+        return defaults
+    
+    for key, limits in (("title", (20, 60)), ("subtitle", (14, 40))):
+        style = reference_style[f"{key}_style"]
+        size = style["size"]
+        if style.get("size_ratio"):
+            # 行高比例换算为模板上的字号，与提取时的系数一致
+            size = round(style["size_ratio"] * analysis["height"] / 0.85)
+        defaults[f"{key}_size"] = min(max(int(size), limits[0]), limits[1])
+        defaults[f"{key}_color"] = style["color"]
+    return defaults
+
+def submit_template_render(template_key: str, texts: Dict, style_config: Dict):
+    """提交全分辨率模板渲染任务"""
+    # 记下渲染参数，导出全部尺寸时复用
+    st.session_state.main_image_request = {
+        "template_key": template_key,
+        "texts": texts,
+        "style_config": style_config,
+        "layout": st.session_state.get('template_analysis'),
+        "article_content": st.session_state.article_content,
+    }
+    st.session_state.main_image_job = get_job_queue().submit(
+        "render",
+        render_main_image_job,
+        st.session_state.pipeline,
+        dict(st.session_state.main_image_request, render_session=get_render_session(template_key)),
+        owner=get_session_owner()
+    )
+
+def get_render_session(template_key: str) -> Optional[RenderSession]:
+    """当前会话在该模板上的增量渲染会话，换模板时重新创建"""
+    cached = st.session_state.get('render_session')
+    if cached and cached[0] == template_key:
+        return cached[1]
+    template = get_asset_store().get(template_key)
+    if template is None:
+        return None
+    session = RenderSession(template)
+    st.session_state.render_session = (template_key, session)
+    return session
+
+def show_main_image_preview(template_key: str, texts: Dict, style_config: Dict, signature: str):
+    """在缩小的模板上渲染并显示预览，同一组参数只渲染一次"""
+    cached = st.session_state.get('main_image_preview')
+    if not cached or cached[0] != signature:
+        template = get_asset_store().get(template_key)
+        if template is None:
+            return
+        texts = st.session_state.pipeline.run(
+            {"texts": texts, "article_content": st.session_state.article_content}, ["main_texts"]
+        )["main_texts"]
+        preview = get_preview_renderer().render(
+            template_key, template, texts, style_config, st.session_state.get('template_analysis')
+        )
+        cached = (signature, encode_image(preview))
+        st.session_state.main_image_preview = cached
+    st.image(cached[1], caption="预览（低分辨率，全分辨率渲染完成后自动替换）", use_column_width=True)
+
+def render_main_image_job(context: JobContext, pipeline: Pipeline, inputs: Dict) -> Dict:
+    """后台任务：运行流水线渲染主图，有增量渲染会话时只重画变化的区域"""
+    context.set_progress(0.1, "检查各阶段缓存")
+    run = pipeline.run(inputs, ["main_image"], keys={"render_session": RENDER_SESSION_KEY},
+                       progress=pipeline_progress(context))
+    return {"image_key": run["main_image"], "template_key": inputs["template_key"],
+            "caption": "生成的主图", "file_name": "main_image.png", "timings": run.timings}
+
+def multi_size_job(context: JobContext, pipeline: Pipeline, inputs: Dict) -> Dict:
+    """后台任务：渲染一次并导出 IMAGE_SIZES 中的全部尺寸"""
+    context.set_progress(0.1, "渲染并生成各尺寸")
+    run = pipeline.run(inputs, ["size_exports"], progress=pipeline_progress(context))
+    return dict(run["size_exports"], timings=run.timings)
+
+def pipeline_progress(context: JobContext):
+    """把流水线的阶段进度转发到后台任务"""
+    return lambda progress, stage: context.set_progress(0.1 + 0.9 * progress, f"已完成 {stage}")
+
+def show_stage_timings(timings: Dict):
+    """显示流水线各阶段的耗时，命中缓存的阶段标为缓存"""
+    st.caption(f"⏱️ {format_timings(timings)}")
+
+def ai_main_image_job(context: JobContext, ai_generator: AIGenerator, title: str,
+                      article_content: str, style_preferences: Dict,
+                      image_size: str, image_quality: str) -> Dict:
+    """后台任务：使用AI生成主图"""
+    context.set_progress(0.1, "生成提示词")
+    prompt = ai_generator.generate_image_prompt(title, article_content, style_preferences)
+    
+    context.set_progress(0.3, "等待AI生成图片")
+    image = ai_generator.generate_image_with_dalle(prompt, image_size, image_quality)
+    image_key = get_asset_store().put(image) if image is not None else None
+    
+    return {"image_key": image_key, "prompt": prompt, "caption": "AI生成的主图", "file_name": "ai_main_image.png"}
 
 def detail_page_generation_section():
     """详情页生成部分"""
@@ -424,36 +726,41 @@ def detail_page_generation_section():
         
         # 生成按钮
         if st.button("🚀 生成详情页", type="primary"):
-            with st.spinner("正在生成详情页布局..."):
-                # 生成详情页布局
-                layout = st.session_state.ai_generator.generate_detail_page_layout(
-                    st.session_state.article_content
-                )
-                
-                # 根据选择过滤章节
-                selected_sections = []
-                section_map = {
-                    "hero": include_hero,
-                    "features": include_features,
-                    "benefits": include_benefits,
-                    "process": include_process,
-                    "guarantee": include_guarantee
-                }
-                
-                for section in layout["sections"]:
-                    if section_map.get(section["type"], True):
-                        selected_sections.append(section)
-                
-                layout["sections"] = selected_sections
-                st.session_state.detail_layout = layout
-                
-                st.success("✅ 详情页布局生成完成")
+            section_map = {
+                "hero": include_hero,
+                "features": include_features,
+                "benefits": include_benefits,
+                "process": include_process,
+                "guarantee": include_guarantee
+            }
+            # 导出时用同一组输入，布局阶段直接命中缓存
+            st.session_state.detail_inputs = {
+                "article_content": st.session_state.article_content,
+                "section_map": section_map,
+            }
+            st.session_state.detail_layout_job = get_job_queue().submit(
+                "detail_layout",
+                detail_layout_job,
+                st.session_state.pipeline,
+                st.session_state.detail_inputs,
+                owner=get_session_owner()
+            )
+        
+        job = show_job_status('detail_layout_job', "正在生成详情页布局...")
+        if job and job.status == DONE:
+            # 每个任务的结果只写入一次，避免覆盖之后的修改
+            if st.session_state.get('detail_layout_source') != job.id:
+                st.session_state.detail_layout = job.result["layout"]
+                st.session_state.detail_layout_source = job.id
+            st.success("✅ 详情页布局生成完成")
+            show_stage_timings(job.result["timings"])
     
     with col2:
         st.subheader("📄 详情页预览")
         
         if 'detail_layout' in st.session_state:
             layout = st.session_state.detail_layout
+            detail_inputs = st.session_state.get('detail_inputs', {})
             
             # 显示每个章节
             for section in layout["sections"]:
@@ -495,11 +802,11 @@ def detail_page_generation_section():
             
             # 导出选项
             st.subheader("📤 导出选项")
-            export_col1, export_col2 = st.columns(2)
+            export_col1, export_col2, export_col3 = st.columns(3)
             
             with export_col1:
                 if st.button("📄 导出为HTML"):
-                    html_content = generate_html_detail_page(layout)
+                    html_content = st.session_state.pipeline.run(detail_inputs, ["detail_html"])["detail_html"]
                     st.download_button(
                         label="💾 下载HTML文件",
                         data=html_content,
@@ -509,89 +816,104 @@ def detail_page_generation_section():
             
             with export_col2:
                 if st.button("📊 导出配置JSON"):
-                    json_content = json.dumps(layout, ensure_ascii=False, indent=2)
+                    json_content = st.session_state.pipeline.run(detail_inputs, ["detail_json"])["detail_json"]
                     st.download_button(
                         label="💾 下载配置文件",
                         data=json_content,
                         file_name="layout_config.json",
                         mime="application/json"
                     )
+            
+            with export_col3:
+                if st.button("🖼️ 导出长图JPG"):
+                    st.session_state.detail_image_job = get_job_queue().submit(
+                        "detail_image",
+                        detail_image_job,
+                        st.session_state.pipeline,
+                        detail_inputs,
+                        owner=get_session_owner()
+                    )
+                
+                image_job = show_job_status('detail_image_job', "正在渲染长图...")
+                if image_job and image_job.status == DONE and os.path.exists(image_job.result["path"]):
+                    result = image_job.result
+                    st.caption(f"{result['width']}×{result['height']}，{result['tiles']} 个图块")
+                    show_stage_timings(result["timings"])
+                    with open(result["path"], "rb") as f:
+                        st.download_button(
+                            label="💾 下载长图",
+                            data=f.read(),
+                            file_name="detail_page.jpg",
+                            mime="image/jpeg"
+                        )
+
+def detail_layout_job(context: JobContext, pipeline: Pipeline, inputs: Dict) -> Dict:
+    """后台任务：运行流水线生成详情页布局并按选择过滤章节"""
+    context.set_progress(0.1, "分析文章内容")
+    run = pipeline.run(inputs, ["detail_layout"], progress=pipeline_progress(context))
+    # 缓存中的布局在会话之间共享，页面上保存一份副本
+    return {"layout": copy.deepcopy(run["detail_layout"]), "timings": run.timings}
 
-def generate_html_detail_page(layout: Dict) -> str:
-    """生成HTML详情页"""
-    html_template = """
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>产品详情页</title>
-        <style>
-            body {{ font-family: 'Microsoft YaHei', sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
-            .container {{ max-width: 750px; margin: 0 auto; background: white; }}
-            .section {{ padding: 20px; margin-bottom: 10px; }}
-            .hero {{ background: linear-gradient(135deg, {primary}, {secondary}); color: white; text-align: center; }}
-            .features {{ display: flex; flex-wrap: wrap; gap: 15px; }}
-            .feature-item {{ flex: 1; min-width: 200px; text-align: center; padding: 15px; background: #f9f9f9; border-radius: 8px; }}
-            .benefits {{ padding-left: 20px; }}
-            .process {{ display: flex; justify-content: space-between; }}
-            .process-step {{ text-align: center; flex: 1; }}
-            .guarantee {{ display: flex; justify-content: center; gap: 20px; }}
-            .guarantee-badge {{ padding: 10px 20px; background: {primary}; color: white; border-radius: 20px; }}
-            h2 {{ color: {primary}; border-bottom: 2px solid {primary}; padding-bottom: 10px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            {sections_html}
-        </div>
-    </body>
-    </html>
+def format_ingest_report(report: Dict) -> str:
+    """上传图片解码报告的简短说明"""
+    original = "×".join(map(str, report["original_size"]))
+    size = "×".join(map(str, report["size"]))
+    text = f"{report['format']} {original}"
+    if report["size"] != report["original_size"]:
+        text += f" → {size}"
+    if report["draft"]:
+        text += "（草稿解码 " + "×".join(map(str, report["decoded_size"])) + "）"
+    return f"{text}，解码内存峰值约 {report['peak_bytes'] / 1024 / 1024:.1f}MB，耗时 {report['seconds'] * 1000:.0f}ms"
+
+def store_session_image(name: str, image: Image.Image):
+    """把图片存入资源仓库，会话中只记录资源键"""
+    st.session_state.image_keys[name] = get_asset_store().put(image)
+
+def get_session_image(name: str) -> Optional[Image.Image]:
+    """按名称读取会话图片，不存在或已过期时返回None"""
+    key = st.session_state.image_keys.get(name)
+    return get_asset_store().get(key) if key else None
+
+def detail_image_job(context: JobContext, pipeline: Pipeline, inputs: Dict) -> Dict:
+    """后台任务：运行流水线把详情页布局渲染为JPEG长图，长图文件还在时直接复用"""
+    context.set_progress(0.1, "分块渲染长图")
+    run = pipeline.run(inputs, ["detail_image"], progress=pipeline_progress(context))
+    return dict(run["detail_image"], timings=run.timings)
+
+def get_session_owner() -> str:
+    """当前会话在任务队列中的标识"""
+    if 'session_owner' not in st.session_state:
+        st.session_state.session_owner = uuid.uuid4().hex
+    return st.session_state.session_owner
+
+def show_job_status(job_key: str, running_text: str) -> Optional[Job]:
     """
+    显示会话中某个后台任务的状态
     
-    sections_html = ""
-    colors = layout["color_scheme"]
-    
-    for section in layout["sections"]:
-        section_html = f'<div class="section {section["type"]}">'
-        section_html += f'<h2>{section["title"]}</h2>'
-        
-        if section["type"] == "hero":
-            for content in section["content"]:
-                section_html += f'<h3>🌟 {content}</h3>'
+    Args:
+        job_key: 保存任务ID的会话状态键
+        running_text: 任务进行中时的提示文字
         
-        elif section["type"] == "features":
-            section_html += '<div class="features">'
-            for content in section["content"]:
-                section_html += f'<div class="feature-item">🔥 <strong>{content}</strong></div>'
-            section_html += '</div>'
-        
-        elif section["type"] == "benefits":
-            section_html += '<ol class="benefits">'
-            for content in section["content"]:
-                section_html += f'<li>✅ {content}</li>'
-            section_html += '</ol>'
-        
-        elif section["type"] == "process":
-            section_html += '<div class="process">'
-            for i, content in enumerate(section["content"], 1):
-                section_html += f'<div class="process-step"><strong>步骤{i}</strong><br>🔄 {content}</div>'
-            section_html += '</div>'
-        
-        elif section["type"] == "guarantee":
-            section_html += '<div class="guarantee">'
-            for content in section["content"]:
-                section_html += f'<div class="guarantee-badge">🏆 {content}</div>'
-            section_html += '</div>'
-        
-        section_html += '</div>'
-        sections_html += section_html
-    
-    return html_template.format(
-        primary=colors["primary"],
-        secondary=colors["secondary"],
-        sections_html=sections_html
-    )
+    Returns:
+        任务快照，没有任务时返回None
+    """
+    job_id = st.session_state.get(job_key)
+    if not job_id:
+        return None
+    
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return None
+    
+    if job.status in (PENDING, RUNNING):
+        message = job.message or ("排队中..." if job.status == PENDING else running_text)
+        st.progress(job.progress, text=f"⏳ {message}（{job.elapsed:.1f}s）")
+        # 页面渲染完成后再重跑脚本以刷新进度
+        st.session_state.poll_jobs = True
+    elif job.status == FAILED:
+        st.error(f"任务失败: {job.error}")
+    
+    return job
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
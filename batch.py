@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+批量生成脚本 - 无界面地把文章目录或CSV清单批量生成为主图和详情页
+
+用法:
+    python batch.py --articles demo --templates templates --output outputs
+    python batch.py --manifest catalog.csv --workers 8 --detail-image
+    python batch.py --articles demo --templates templates --dedupe
+
+CSV清单列: article（文章路径，必填）、template（模板路径）、id、title、subtitle
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+PROGRESS_FILE = "batch_progress.jsonl"
+DUPLICATES_FILE = "duplicates.json"
+TEMPLATE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+# 每个工作进程各自持有一份处理器，jieba 只在进程启动时初始化一次
+_text_processor = None
+_image_processor = None
+_ai_generator = None
+
+
+def _init_worker():
+    """工作进程初始化"""
+    global _text_processor, _image_processor, _ai_generator
+    from utils.text_processor import TextProcessor
+    from utils.image_processor import ImageProcessor
+    from utils.ai_generator import AIGenerator
+
+    _text_processor = TextProcessor()
+    _image_processor = ImageProcessor()
+    _ai_generator = AIGenerator()
+
+
+def collect_items_from_directories(articles_dir: str, templates_dir: Optional[str]) -> List[Dict]:
+    """
+    从目录收集任务：每篇 .txt 文章优先使用同名模板，否则使用目录中的第一个模板
+
+    Args:
+        articles_dir: 文章目录
+        templates_dir: 模板目录（可选）
+
+    Returns:
+        任务列表
+    """
+    templates = {}
+    if templates_dir:
+        for name in sorted(os.listdir(templates_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in TEMPLATE_EXTENSIONS:
+                templates[stem] = os.path.join(templates_dir, name)
+    default_template = next(iter(templates.values()), None)
+
+    items = []
+    for name in sorted(os.listdir(articles_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() != ".txt":
+            continue
+        items.append({
+            "id": stem,
+            "article": os.path.join(articles_dir, name),
+            "template": templates.get(stem, default_template),
+        })
+    return items
+
+
+def _valid_item_id(item_id: str) -> bool:
+    """任务ID作为输出子目录名，不能包含路径分隔符或 .."""
+    return item_id not in ("", ".") and ".." not in item_id and "/" not in item_id and "\\" not in item_id
+
+
+def collect_items_from_manifest(manifest_path: str) -> List[Dict]:
+    """
+    从CSV清单收集任务，相对路径以清单所在目录为基准
+
+    任务ID用作输出子目录和进度记录的键：包含路径分隔符或 .. 的行跳过；
+    重复的ID（显式指定或由文章、模板文件名生成）加上行号后缀，每行各自输出、各自记录进度。
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path: str) -> Optional[str]:
+        if not path:
+            return None
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    items = []
+    seen_ids = set()
+    with open(manifest_path, "r", encoding="utf-8-sig", newline="") as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            line = index + 2
+            article = resolve((row.get("article") or "").strip())
+            if not article:
+                print(f"⚠️ 清单第{line}行缺少 article 列，已跳过")
+                continue
+            template = resolve((row.get("template") or "").strip())
+            default_id = os.path.splitext(os.path.basename(article))[0]
+            if template:
+                default_id += "__" + os.path.splitext(os.path.basename(template))[0]
+            item_id = (row.get("id") or "").strip() or default_id
+            if not _valid_item_id(item_id):
+                print(f"⚠️ 清单第{line}行的 id 无效（不能包含路径分隔符或 ..）: {item_id}，已跳过")
+                continue
+            if item_id in seen_ids:
+                unique_id = f"{item_id}__row{line}"
+                print(f"⚠️ 清单第{line}行的 id 重复: {item_id}，改为 {unique_id}")
+                item_id = unique_id
+            seen_ids.add(item_id)
+            items.append({
+                "id": item_id,
+                "article": article,
+                "template": template,
+                "title": (row.get("title") or "").strip(),
+                "subtitle": (row.get("subtitle") or "").strip(),
+            })
+    return items
+
+
+def process_item(item: Dict, output_dir: str, detail_image: bool = False, all_sizes: bool = False) -> Dict:
+    """
+    处理单个任务：合规检测、标题变体、模板渲染、详情页导出
+
+    Args:
+        item: 任务信息
+        output_dir: 输出根目录
+        detail_image: 是否同时导出详情页JPEG长图
+        all_sizes: 是否按 IMAGE_SIZES 导出主图的全部尺寸
+
+    Returns:
+        处理报告
+    """
+    from utils.text_processor import parse_article
+    from utils.detail_page_exporter import export_html_detail_page
+    from utils.image_ingest import ingest_image
+
+    timings = {}
+    started = time.perf_counter()
+
+    def lap(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[stage] = now - since
+        return now
+
+    item_dir = os.path.join(output_dir, item["id"])
+    os.makedirs(item_dir, exist_ok=True)
+
+    with open(item["article"], "r", encoding="utf-8") as f:
+        article = parse_article(f.read(), default_title=item["id"])
+    title = item.get("title") or article["title"]
+    content = article["content"]
+
+    # 合规检测与文本分析
+    t = time.perf_counter()
+    compliance = _text_processor.check_forbidden_words(title + " " + content)
+    title_variants = _text_processor.generate_title_variants(title)
+    keywords = _text_processor.extract_keywords(content, 8)
+    selling_points = _text_processor.extract_selling_points(content)
+    t = lap("analysis", t)
+
+    # 模板渲染，图片文字先去除违禁词
+    main_image = None
+    if item.get("template"):
+        with open(item["template"], "rb") as f:
+            template, _ = ingest_image(f.read())
+        texts = {"title": _text_processor.optimize_for_image_text(title)}
+        if item.get("subtitle"):
+            texts["subtitle"] = _text_processor.optimize_for_image_text(item["subtitle"])
+        if selling_points:
+            texts["selling_points"] = selling_points[:3]
+        if all_sizes:
+            # 只渲染一次最大图，各尺寸和原尺寸主图都由它缩小得到
+            from PIL import Image
+            from utils.multi_size_export import MultiSizeExporter
+            exporter = MultiSizeExporter()
+            master, images = exporter.render_all(_image_processor, template, texts, {})
+            for name, data in exporter.encode_all(images).items():
+                with open(os.path.join(item_dir, exporter.file_name(name)), "wb") as f:
+                    f.write(data)
+            rendered = master if master.size == template.size else master.resize(template.size, Image.LANCZOS)
+        else:
+            rendered = _image_processor.render_text_on_template(template, texts, {})
+        main_image = os.path.join(item_dir, "main_image.png")
+        rendered.save(main_image, format="PNG")
+        t = lap("render", t)
+
+    # 详情页布局与HTML导出
+    layout = _ai_generator.generate_detail_page_layout(content)
+    export_html_detail_page(layout, os.path.join(item_dir, "detail_page.html"))
+    if detail_image:
+        from utils.detail_page_rasterizer import export_detail_page_image
+        export_detail_page_image(layout, os.path.join(item_dir, "detail_page.jpg"))
+    with open(os.path.join(item_dir, "layout_config.json"), "w", encoding="utf-8") as f:
+        json.dump(layout, f, ensure_ascii=False, indent=2)
+    lap("export", t)
+
+    report = {
+        "id": item["id"],
+        "title": title,
+        "compliance": compliance,
+        "title_variants": title_variants,
+        "keywords": keywords,
+        "selling_points": selling_points,
+        "main_image": main_image,
+        "timings": timings,
+        "seconds": time.perf_counter() - started,
+    }
+    with open(os.path.join(item_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return report
+
+
+def load_progress(output_dir: str) -> Dict[str, Dict]:
+    """读取已完成的任务记录，用于断点续跑"""
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 上次中断时可能留下半行记录
+                continue
+            if record.get("status") == "ok":
+                done[record["id"]] = record
+    return done
+
+
+def run_batch(items: List[Dict], output_dir: str, workers: int, force: bool = False,
+              detail_image: bool = False, all_sizes: bool = False) -> Dict:
+    """
+    在进程池上批量处理任务，逐条追加进度记录
+
+    Returns:
+        吞吐量汇总
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = {} if force else load_progress(output_dir)
+    pending = [item for item in items if item["id"] not in done]
+    if done:
+        print(f"⏭️ 跳过已完成任务 {len(items) - len(pending)} 个")
+
+    stage_totals: Dict[str, float] = {}
+    failures = 0
+    completed = 0
+    started = time.perf_counter()
+
+    with open(os.path.join(output_dir, PROGRESS_FILE), "a", encoding="utf-8") as progress, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(process_item, item, output_dir, detail_image, all_sizes): item for item in pending}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"❌ {item['id']}: {e}")
+                record = {"id": item["id"], "status": "failed", "error": str(e)}
+            else:
+                completed += 1
+                for stage, seconds in report["timings"].items():
+                    stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+                flag = "⚠️" if report["compliance"]["has_forbidden"] else "✅"
+                print(f"{flag} [{completed + failures}/{len(pending)}] {item['id']} ({report['seconds']:.2f}s)")
+                record = {"id": item["id"], "status": "ok", "seconds": report["seconds"]}
+            progress.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.flush()
+
+    wall = time.perf_counter() - started
+    return {
+        "total": len(items),
+        "skipped": len(items) - len(pending),
+        "completed": completed,
+        "failed": failures,
+        "wall_seconds": wall,
+        "throughput": completed / wall if wall > 0 else 0.0,
+        "stage_seconds": stage_totals,
+    }
+
+
+def find_duplicate_outputs(items: List[Dict], output_dir: str) -> List[Dict]:
+    """
+    按感知哈希把近似重复的主图分组，写入 duplicates.json；包含之前运行中已完成的任务
+
+    Returns:
+        分组列表，每组 keep 为保留的任务，duplicates 为与之近似重复的任务
+    """
+    from config import NEAR_DUPLICATE_MAX_DISTANCE
+    from utils.perceptual_hash import group_near_duplicates, hash_files
+
+    ids, paths = [], []
+    for item in items:
+        path = os.path.join(output_dir, item["id"], "main_image.png")
+        if os.path.exists(path):
+            ids.append(item["id"])
+            paths.append(path)
+
+    hashes = hash_files(paths)
+    readable = [index for index, value in enumerate(hashes) if value is not None]
+    groups = []
+    for group in group_near_duplicates([hashes[index] for index in readable], NEAR_DUPLICATE_MAX_DISTANCE):
+        members = [ids[readable[index]] for index in group]
+        groups.append({"keep": members[0], "duplicates": members[1:]})
+
+    with open(os.path.join(output_dir, DUPLICATES_FILE), "w", encoding="utf-8") as f:
+        json.dump(groups, f, ensure_ascii=False, indent=2)
+    return groups
+
+
+def print_summary(summary: Dict):
+    """打印吞吐量汇总"""
+    print("=" * 50)
+    print(f"📊 共 {summary['total']} 个任务: 完成 {summary['completed']}, "
+          f"失败 {summary['failed']}, 跳过 {summary['skipped']}")
+    print(f"⏱️ 耗时 {summary['wall_seconds']:.2f}s, 吞吐量 {summary['throughput']:.2f} 个/秒")
+    if summary["completed"]:
+        for stage, seconds in summary["stage_seconds"].items():
+            print(f"   {stage}: 平均 {seconds / summary['completed'] * 1000:.1f}ms")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="智能电商主图生成器 - 批量生成")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--articles", help="文章目录（*.txt）")
+    source.add_argument("--manifest", help="CSV清单路径")
+    parser.add_argument("--templates", help="模板目录，与 --articles 一起使用")
+    parser.add_argument("--output", default="outputs", help="输出目录")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--force", action="store_true", help="忽略进度记录，全部重新生成")
+    parser.add_argument("--detail-image", action="store_true", help="同时导出详情页JPEG长图")
+    parser.add_argument("--all-sizes", action="store_true", help="按 IMAGE_SIZES 导出主图的全部尺寸")
+    parser.add_argument("--dedupe", action="store_true", help=f"完成后找出近似重复的主图，写入 {DUPLICATES_FILE}")
+    return parser
+
+
+def main():
+    """主函数"""
+    args = build_parser().parse_args()
+
+    if args.manifest:
+        items = collect_items_from_manifest(args.manifest)
+    else:
+        items = collect_items_from_directories(args.articles, args.templates)
+
+    if not items:
+        print("⚠️ 没有找到需要处理的文章")
+        return
+
+    print(f"🚀 批量生成 {len(items)} 个任务，{args.workers} 个工作进程")
+    summary = run_batch(items, args.output, args.workers, args.force, args.detail_image, args.all_sizes)
+    print_summary(summary)
+
+    if args.dedupe:
+        groups = find_duplicate_outputs(items, args.output)
+        duplicates = sum(len(group["duplicates"]) for group in groups)
+        print(f"🔁 近似重复主图 {duplicates} 张，分为 {len(groups)} 组，详见 {os.path.join(args.output, DUPLICATES_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
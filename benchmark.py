@@ -0,0 +1,1035 @@
+#!/usr/bin/env python3
+"""
+性能基准脚本 - 离线压测各条生成路径
+
+用法:
+    python benchmark.py ai --requests 40 --concurrency 8 --error-rate 0.05
+    python benchmark.py api --requests 200 --concurrency 16
+    python benchmark.py export --layouts 5000
+    python benchmark.py ui --sessions 4 --duration 10
+    python benchmark.py raster --repeat 14
+    python benchmark.py sizes --rounds 10
+    python benchmark.py layout --texts 200
+    python benchmark.py rerender --edits 50
+    python benchmark.py ingest --width 6000 --height 4000
+    python benchmark.py zones --size 1200
+    python benchmark.py dedupe --hashes 100000
+    python benchmark.py memory --entries 2000
+    python benchmark.py pipeline --rounds 5
+    python benchmark.py metrics --calls 1000000
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_sample_article(path: str = "demo/sample_article.txt") -> Dict[str, str]:
+    """读取示例文章，返回标题和内容"""
+    from utils.text_processor import parse_article
+
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_article(f.read(), default_title="示例文章")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """计算分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_load(task: Callable[[int], bool], requests: int, concurrency: int) -> Dict:
+    """
+    并发执行 task(i)，统计吞吐量与延迟分位数
+
+    Args:
+        task: 单次请求函数，返回是否成功
+        requests: 请求总数
+        concurrency: 并发数
+
+    Returns:
+        统计结果字典
+    """
+    latencies = []
+    failures = 0
+
+    def timed(i: int):
+        start = time.perf_counter()
+        try:
+            ok = task(i)
+        except Exception as e:
+            print(f"   请求{i}异常: {e}")
+            ok = False
+        return ok, time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, elapsed in pool.map(timed, range(requests)):
+            latencies.append(elapsed)
+            if not ok:
+                failures += 1
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "requests": requests,
+        "failures": failures,
+        "wall_seconds": wall,
+        "throughput": requests / wall if wall > 0 else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def print_report(name: str, stats: Dict):
+    """打印单项压测结果"""
+    print(f"📊 {name}")
+    print(f"   请求数: {stats['requests']}  失败: {stats['failures']}  耗时: {stats['wall_seconds']:.2f}s")
+    print(f"   吞吐量: {stats['throughput']:.2f} req/s")
+    print(f"   p50: {stats['p50'] * 1000:.1f}ms  p99: {stats['p99'] * 1000:.1f}ms")
+
+
+def rss_anon_mb() -> float:
+    """当前进程的匿名内存（MB），非Linux系统返回0"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class RssPeak:
+    """在后台线程中采样匿名内存，统计代码块执行期间相对开始时的增长峰值"""
+
+    def __enter__(self) -> "RssPeak":
+        self.baseline = self.peak = rss_anon_mb()
+        self._stop = threading.Event()
+
+        def sample():
+            while not self._stop.is_set():
+                self.peak = max(self.peak, rss_anon_mb())
+                time.sleep(0.005)
+
+        self._sampler = threading.Thread(target=sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._sampler.join()
+        self.peak = max(self.peak, rss_anon_mb())
+
+    @property
+    def growth_mb(self) -> float:
+        return self.peak - self.baseline
+
+
+def bench_ai(args):
+    """使用本地模拟OpenAI服务压测主图与详情页的AI生成路径"""
+    from utils.ai_generator import AIGenerator
+    from utils.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+
+    config = FakeOpenAIConfig(
+        image_latency=args.image_latency,
+        chat_latency=args.chat_latency,
+        download_latency=args.download_latency,
+        error_rate=args.error_rate,
+        image_pixels=args.image_pixels,
+        seed=args.seed,
+    )
+    article = load_sample_article()
+
+    with FakeOpenAIServer(config) as server:
+        print(f"🌐 模拟服务: {server.base_url}  单图下载 {server.payload_bytes / 1024:.0f}KB")
+
+        generator = AIGenerator()
+        generator.set_openai_key("sk-fake-benchmark", base_url=server.base_url, max_retries=args.max_retries)
+
+        def main_image(i: int) -> bool:
+            # 默认给每个请求加上序号，避免请求合并掩盖真实负载
+            title = article["title"] if args.same_prompt else f"{article['title']} #{i}"
+            prompt = generator.generate_image_prompt(title, article["content"], {"style": "现代简约"})
+            return generator.generate_image(prompt) is not None
+
+        def detail_page(i: int) -> bool:
+            layout = generator.generate_detail_page_layout(article["content"])
+            base_prompt = article["title"] if args.same_prompt else f"{article['title']} #{i}"
+            images = generator.create_detail_page_images(layout, base_prompt)
+            return len(images) == len(layout["sections"])
+
+        print_report("主图生成", run_load(main_image, args.requests, args.concurrency))
+        print_report("详情页生成", run_load(detail_page, max(1, args.requests // 5), args.concurrency))
+
+        print(f"🔁 请求合并: {generator.get_coalescing_stats()}")
+        print(f"📈 服务端统计: {server.get_stats()}")
+
+
+def bench_api(args):
+    """压测HTTP API服务，未指定 --url 时在本进程内启动服务"""
+    import base64
+    import io
+    import random
+    import requests
+    from PIL import Image
+
+    article = load_sample_article()
+    buffer = io.BytesIO()
+    Image.new("RGB", (args.template_size, args.template_size), color="white").save(buffer, format="PNG")
+    template_b64 = base64.b64encode(buffer.getvalue()).decode()
+
+    server = None
+    url = args.url
+    if not url:
+        from api_server import APIServer
+        server = APIServer(port=0, max_workers=args.workers, queue_size=args.queue_size).start()
+        url = server.url
+    print(f"🌐 API服务: {url}")
+
+    session = requests.Session()
+    rng = random.Random(args.seed)
+
+    def post(path: str, payload: Dict) -> bool:
+        response = session.post(url + path, json=payload, timeout=60)
+        return response.status_code == 200
+
+    def text_payload(i: int) -> Dict:
+        # 文本加上序号，避免分析缓存掩盖真实开销（--cached 时复用）
+        suffix = "" if args.cached else f"（第{i}篇）"
+        return {"text": article["content"] + suffix, "title": article["title"] + suffix}
+
+    scenarios = {
+        "/api/compliance": lambda i: post("/api/compliance", text_payload(i)),
+        "/api/analyze/text": lambda i: post("/api/analyze/text", text_payload(i)),
+        "/api/analyze/template": lambda i: post("/api/analyze/template", {"image": template_b64}),
+        "/api/render": lambda i: post("/api/render", {
+            "image": template_b64, "texts": {"title": f"{article['title'][:12]}{i}"}
+        }),
+    }
+
+    try:
+        for name, task in scenarios.items():
+            print_report(name, run_load(task, args.requests, args.concurrency))
+
+        def mixed(i: int) -> bool:
+            return rng.choice(list(scenarios.values()))(i)
+
+        print_report("混合负载", run_load(mixed, args.requests, args.concurrency))
+
+        metrics = session.get(url + "/api/metrics", timeout=10).json()
+        print("📈 服务端延迟统计:")
+        for route, stats in metrics["endpoints"].items():
+            print(f"   {route}: {stats}")
+    finally:
+        if server:
+            server.stop()
+
+
+def legacy_generate_html_detail_page(layout: Dict) -> str:
+    """旧版详情页导出（字符串拼接 + 整页format），仅用于对比基准"""
+    html_template = """
+    <!DOCTYPE html>
+    <html lang="zh-CN">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>产品详情页</title>
+        <style>
+            body {{ font-family: 'Microsoft YaHei', sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
+            .container {{ max-width: 750px; margin: 0 auto; background: white; }}
+            .section {{ padding: 20px; margin-bottom: 10px; }}
+            .hero {{ background: linear-gradient(135deg, {primary}, {secondary}); color: white; text-align: center; }}
+            .features {{ display: flex; flex-wrap: wrap; gap: 15px; }}
+            .feature-item {{ flex: 1; min-width: 200px; text-align: center; padding: 15px; background: #f9f9f9; border-radius: 8px; }}
+            .benefits {{ padding-left: 20px; }}
+            .process {{ display: flex; justify-content: space-between; }}
+            .process-step {{ text-align: center; flex: 1; }}
+            .guarantee {{ display: flex; justify-content: center; gap: 20px; }}
+            .guarantee-badge {{ padding: 10px 20px; background: {primary}; color: white; border-radius: 20px; }}
+            h2 {{ color: {primary}; border-bottom: 2px solid {primary}; padding-bottom: 10px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            {sections_html}
+        </div>
+    </body>
+    </html>
+    """
+    
+    sections_html = ""
+    colors = layout["color_scheme"]
+    
+    for section in layout["sections"]:
+        section_html = f'<div class="section {section["type"]}">'
+        section_html += f'<h2>{section["title"]}</h2>'
+        
+        if section["type"] == "hero":
+            for content in section["content"]:
+                section_html += f'<h3>🌟 {content}</h3>'
+        
+        elif section["type"] == "features":
+            section_html += '<div class="features">'
+            for content in section["content"]:
+                section_html += f'<div class="feature-item">🔥 <strong>{content}</strong></div>'
+            section_html += '</div>'
+        
+        elif section["type"] == "benefits":
+            section_html += '<ol class="benefits">'
+            for content in section["content"]:
+                section_html += f'<li>✅ {content}</li>'
+            section_html += '</ol>'
+        
+        elif section["type"] == "process":
+            section_html += '<div class="process">'
+            for i, content in enumerate(section["content"], 1):
+                section_html += f'<div class="process-step"><strong>步骤{i}</strong><br>🔄 {content}</div>'
+            section_html += '</div>'
+        
+        elif section["type"] == "guarantee":
+            section_html += '<div class="guarantee">'
+            for content in section["content"]:
+                section_html += f'<div class="guarantee-badge">🏆 {content}</div>'
+            section_html += '</div>'
+        
+        section_html += '</div>'
+        sections_html += section_html
+    
+    return html_template.format(
+        primary=colors["primary"],
+        secondary=colors["secondary"],
+        sections_html=sections_html
+    )
+
+
+def bench_export(args):
+    """对比旧版字符串拼接与编译式流式导出器的批量导出耗时和内存峰值"""
+    import shutil
+    import tempfile
+    import tracemalloc
+    from utils.ai_generator import AIGenerator
+    from utils.detail_page_exporter import DetailPageExporter
+
+    article = load_sample_article()
+    base_layout = AIGenerator().generate_detail_page_layout(article["content"])
+
+    def layouts():
+        # 逐个生成布局，模拟从数据源流式读取
+        for i in range(args.layouts):
+            layout = dict(base_layout)
+            layout["sections"] = [
+                dict(section, content=[f"{item} #{i}" for item in section["content"]])
+                for section in base_layout["sections"]
+            ]
+            yield f"page_{i:06d}", layout
+
+    def legacy_export(output_dir: str) -> int:
+        count = 0
+        for name, layout in layouts():
+            with open(os.path.join(output_dir, f"{name}.html"), "w", encoding="utf-8") as f:
+                f.write(legacy_generate_html_detail_page(layout))
+            count += 1
+        return count
+
+    exporter = DetailPageExporter()
+    candidates = {
+        "旧版 generate_html_detail_page": legacy_export,
+        "DetailPageExporter": lambda output_dir: exporter.export_many(layouts(), output_dir),
+    }
+
+    for name, export in candidates.items():
+        output_dir = tempfile.mkdtemp()
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = export(output_dir)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        print(f"📊 {name}")
+        print(f"   导出 {count} 页, 耗时 {elapsed:.2f}s, {count / elapsed:.0f} 页/秒")
+        print(f"   内存峰值: {peak / 1024:.1f}KB")
+
+
+def bench_ui(args):
+    """
+    模拟多个会话同时分析大模板，测量同进程内轻量请求（脚本重跑）的响应延迟，
+    对比在线程中直接计算与放到进程池计算两种方式
+    """
+    import threading
+    import numpy as np
+    from PIL import Image
+    from utils.text_processor import TextProcessor
+    from utils.image_processor import ImageProcessor
+    from utils.process_offload import OffloadedImageProcessor, get_process_pool
+
+    article = load_sample_article()
+    text_processor = TextProcessor()
+    text_processor.extract_keywords.uncached(text_processor, article["content"], 10)
+    # 预热进程池，避免把工作进程的启动时间算进第一轮
+    get_process_pool().submit(int).result()
+
+    def run(processor: ImageProcessor) -> Dict:
+        stop = threading.Event()
+        heavy_done = []
+
+        def heavy_session(session: int):
+            rng = np.random.RandomState(args.seed + session)
+            while not stop.is_set():
+                # 每次使用不同的模板，避免分析缓存命中
+                pixels = rng.randint(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+                template = Image.fromarray(pixels)
+                processor.analyze_template(template)
+                processor.render_text_on_template(template, {"title": article["title"][:12]}, {})
+                heavy_done.append(1)
+
+        threads = [threading.Thread(target=heavy_session, args=(i,), daemon=True) for i in range(args.sessions)]
+        for thread in threads:
+            thread.start()
+
+        # 轻量请求：一次违禁词检测加关键词提取，相当于一次普通的页面重跑
+        latencies = []
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            text_processor.check_forbidden_words.uncached(text_processor, article["content"])
+            text_processor.extract_keywords.uncached(text_processor, article["content"], 10)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(args.interval)
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return {
+            "probes": len(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p99": percentile(latencies, 0.99),
+            "heavy": len(heavy_done),
+        }
+
+    for name, processor in (("线程内计算", ImageProcessor()), ("进程池计算", OffloadedImageProcessor())):
+        stats = run(processor)
+        print(f"📊 {name}（{args.sessions} 个会话, 模板 {args.size}x{args.size}）")
+        print(f"   轻量请求 {stats['probes']} 次  p50: {stats['p50'] * 1000:.2f}ms  p99: {stats['p99'] * 1000:.2f}ms")
+        print(f"   完成模板分析+渲染 {stats['heavy']} 次, {stats['heavy'] / args.duration:.2f} 次/秒")
+
+
+def bench_raster(args):
+    """渲染超长详情页，统计耗时与匿名内存峰值（磁盘映射的画布不计入）"""
+    import tempfile
+    from utils.ai_generator import AIGenerator
+    from utils.detail_page_rasterizer import DetailPageRasterizer
+
+    article = load_sample_article()
+    layout = AIGenerator().generate_detail_page_layout(article["content"])
+    layout["sections"] = layout["sections"] * args.repeat
+    rasterizer = DetailPageRasterizer(max_workers=args.workers)
+
+    with RssPeak() as peak, tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "detail_page.jpg")
+        result = rasterizer.render_to_file(layout, path, quality=args.quality)
+        file_size = os.path.getsize(path)
+
+    canvas_mb = result["width"] * result["height"] * 3 / 1024 / 1024
+    print(f"📊 详情页长图 {result['width']}x{result['height']}（{result['tiles']} 个图块）")
+    print(f"   耗时: {result['seconds']:.2f}s  文件: {file_size / 1024:.0f}KB")
+    print(f"   匿名内存增长峰值: {peak.growth_mb:.1f}MB（完整RGB画布为 {canvas_mb:.1f}MB）")
+
+
+def bench_sizes(args):
+    """对比逐个尺寸分别渲染与一次渲染、逐级缩小、并行编码的多尺寸导出"""
+    import io
+    import numpy as np
+    from PIL import Image, ImageOps
+    from utils.image_processor import ImageProcessor
+    from utils.multi_size_export import MultiSizeExporter
+
+    article = load_sample_article()
+    processor = ImageProcessor()
+    exporter = MultiSizeExporter(format=args.format)
+    # 带渐变和噪声的模板，编码开销接近真实图片
+    rng = np.random.RandomState(0)
+    gradient = np.linspace(0, 255, args.template_size, dtype=np.float32)
+    pixels = np.stack([
+        np.tile(gradient, (args.template_size, 1)),
+        np.tile(gradient[:, None], (1, args.template_size)),
+        np.full((args.template_size, args.template_size), 128, np.float32),
+    ], axis=-1) + rng.normal(0, 6, (args.template_size, args.template_size, 3))
+    template = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    texts = {"title": article["title"][:12], "subtitle": "副标题", "selling_points": ["卖点一", "卖点二"]}
+    style = {"title": {"size": 48}, "subtitle": {"size": 28}, "content": {"size": 20}}
+
+    def separate() -> int:
+        total = 0
+        for width, height in exporter.sizes.values():
+            sized = ImageOps.fit(template, (width, height), Image.LANCZOS)
+            scale = width / template.width
+            sized_style = {key: {"size": round(value["size"] * scale)} for key, value in style.items()}
+            buffer = io.BytesIO()
+            processor.render_text_on_template(sized, texts, sized_style).save(buffer, format=args.format)
+            total += len(buffer.getvalue())
+        return total
+
+    def pyramid() -> int:
+        return sum(len(data) for data in exporter.export(processor, template, texts, style).values())
+
+    for name, run in (("逐个尺寸分别渲染", separate), ("一次渲染+逐级缩小+并行编码", pyramid)):
+        run()
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            size = run()
+        elapsed = (time.perf_counter() - start) / args.rounds
+        print(f"📊 {name}")
+        print(f"   {len(exporter.sizes)} 个尺寸  每轮 {elapsed * 1000:.1f}ms  输出 {size / 1024:.0f}KB")
+
+
+def bench_layout(args):
+    """对比用 textbbox 逐字试排与使用字形宽度缓存的二分查找字号"""
+    from PIL import Image, ImageDraw
+    from utils.text_layout import MIN_FONT_SIZE, fit_text, get_glyph_metrics, load_font
+
+    article = load_sample_article()
+    content = article["content"].replace("\n", "")
+    # 不同长度的标题，从几个字到整段
+    texts = [content[i % len(content):][: 8 + (i * 7) % 120] for i in range(args.texts)]
+    box_width, box_height, max_size = args.box_width, args.box_height, args.max_size
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+    def textbbox_fit(text: str) -> int:
+        best = MIN_FONT_SIZE
+        low, high = MIN_FONT_SIZE + 1, max_size
+        while low <= high:
+            size = (low + high) // 2
+            font = load_font(size)
+            lines, current = [], ""
+            for char in text:
+                bbox = draw.textbbox((0, 0), current + char, font=font)
+                if current and bbox[2] - bbox[0] > box_width:
+                    lines.append(current)
+                    current = char
+                else:
+                    current += char
+            lines.append(current)
+            ascent, descent = font.getmetrics()
+            if len(lines) * round((ascent + descent) * 1.2) <= box_height:
+                best, low = size, size + 1
+            else:
+                high = size - 1
+        return best
+
+    def cached_fit(text: str) -> int:
+        return fit_text([text], box_width, box_height, max_size, metrics=get_glyph_metrics()).size
+
+    for name, fit in (("textbbox逐字试排", textbbox_fit), ("字形宽度缓存+二分查找", cached_fit)):
+        fit(texts[0])
+        start = time.perf_counter()
+        sizes = [fit(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        print(f"📊 {name}")
+        print(f"   {len(texts)} 段文字  平均 {elapsed / len(texts) * 1000:.2f}ms  平均字号 {sum(sizes) / len(sizes):.1f}")
+
+
+def bench_rerender(args):
+    """对比每次修改文字后整张重新渲染与增量渲染会话只重画脏矩形"""
+    import numpy as np
+    from PIL import Image
+    from utils.image_processor import ImageProcessor
+    from utils.incremental_render import RenderSession
+
+    rng = np.random.RandomState(0)
+    template = Image.fromarray(rng.randint(0, 256, (args.template_size, args.template_size, 3), dtype=np.uint8))
+    style = {"title": {"size": 72}, "subtitle": {"size": 36}, "content": {"size": 28}}
+    # 模拟反复修改副标题和其中一个卖点
+    edits = []
+    for i in range(args.edits):
+        texts = {"title": "夏季新品限时特惠", "subtitle": f"第{i % 7 + 1}批次到货",
+                 "selling_points": ["品质保证", f"满{(i % 5 + 1) * 100}减{(i % 5 + 1) * 20}", "极速发货"]}
+        edits.append(texts)
+
+    processor = ImageProcessor()
+    start = time.perf_counter()
+    for texts in edits:
+        processor.render_text_on_template(template, texts, style)
+    full = (time.perf_counter() - start) / len(edits)
+
+    session = RenderSession(template)
+    session.update(edits[0], style)
+    pixels = 0
+    start = time.perf_counter()
+    for texts in edits:
+        pixels += session.update(texts, style)["pixels"]
+    incremental = (time.perf_counter() - start) / len(edits)
+    same = np.array_equal(np.asarray(session.image), np.asarray(processor.render_text_on_template(template, edits[-1], style)))
+
+    total = template.width * template.height
+    print(f"📊 {len(edits)} 次修改  模板 {template.width}×{template.height}")
+    print(f"   整张重新渲染: 每次 {full * 1000:.2f}ms  改动像素 100%")
+    print(f"   增量渲染:     每次 {incremental * 1000:.2f}ms  改动像素 {pixels / len(edits) / total * 100:.2f}%")
+    print(f"   与整张渲染结果一致: {'✅' if same else '❌'}")
+
+
+def bench_ingest(args):
+    """对比直接解码大图与按预算草稿解码的耗时和内存峰值"""
+    import io
+    import numpy as np
+    from PIL import Image
+    from utils.image_ingest import ingest_image
+
+    # 带渐变和噪声的大照片，手机原图的典型尺寸
+    rng = np.random.RandomState(0)
+    x = np.linspace(0, 255, args.width, dtype=np.float32)
+    y = np.linspace(0, 255, args.height, dtype=np.float32)[:, None]
+    pixels = np.stack([np.broadcast_to(x, (args.height, args.width)),
+                       np.broadcast_to(y, (args.height, args.width)),
+                       (x + y) / 2], axis=-1) + rng.normal(0, 4, (args.height, args.width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format=args.format, quality=90)
+    data = buffer.getvalue()
+    del pixels
+    print(f"📊 {args.format} {args.width}×{args.height}  文件 {len(data) / 1024 / 1024:.1f}MB")
+
+    # 先测按预算解码，避免直接解码释放的内存被复用而低估增长
+    with RssPeak() as peak:
+        start = time.perf_counter()
+        image, report = ingest_image(data)
+        np.asarray(image)
+        elapsed = time.perf_counter() - start
+    print(f"   按预算解码:   {elapsed * 1000:.0f}ms  匿名内存增长峰值 {peak.growth_mb:.1f}MB"
+          f"（报告 {report['peak_bytes'] / 1024 / 1024:.1f}MB）  "
+          f"草稿解码 {'是' if report['draft'] else '否'} {report['decoded_size']} → {report['size']}")
+    del image
+
+    with RssPeak() as peak:
+        start = time.perf_counter()
+        with Image.open(io.BytesIO(data)) as source:
+            image = source.convert("RGB")
+        np.array(image)
+        elapsed = time.perf_counter() - start
+    print(f"   直接解码:     {elapsed * 1000:.0f}ms  匿名内存增长峰值 {peak.growth_mb:.1f}MB  {image.size}")
+
+
+def bench_zones(args):
+    """测量显著度布局区域检测：积分图批量评分与逐个切片求和的对比"""
+    import cv2
+    import numpy as np
+    from utils.layout_zones import ZONE_SPECS, SaliencyMap, _candidates, detect_layout_zones
+
+    # 白底模板中间偏上放一个带纹理的商品
+    rng = np.random.RandomState(0)
+    template = np.full((args.size, args.size, 3), 245, np.uint8)
+    cv2.circle(template, (args.size // 2, args.size * 2 // 5), args.size // 4, (180, 70, 50), -1)
+    template[args.size // 4:args.size // 2, args.size // 3:args.size * 2 // 3] += \
+        rng.randint(0, 40, (args.size // 2 - args.size // 4, args.size * 2 // 3 - args.size // 3, 3)).astype(np.uint8)
+    detect_layout_zones(template)
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        saliency, _ = SaliencyMap.from_image(template)
+    map_ms = (time.perf_counter() - start) / args.repeat * 1000
+
+    stride = max(1, min(saliency.width, saliency.height) // 32)
+    boxes = [_candidates(saliency.width, saliency.height, spec, stride) for spec in ZONE_SPECS.values()]
+    count = sum(len(x0) for x0, _, _, _ in boxes)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for x0, y0, x1, y1 in boxes:
+            saliency.box_means(x0, y0, x1, y1)
+    integral_ms = (time.perf_counter() - start) / args.repeat * 1000
+
+    start = time.perf_counter()
+    for x0, y0, x1, y1 in boxes:
+        for i in range(len(x0)):
+            saliency.saliency[y0[i]:y1[i], x0[i]:x1[i]].mean()
+    naive_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        zones = detect_layout_zones(template)
+    total_ms = (time.perf_counter() - start) / args.repeat * 1000
+
+    print(f"📊 模板 {args.size}×{args.size}  显著度图 {saliency.width}×{saliency.height}  候选框 {count}")
+    print(f"   显著度图+积分图: {map_ms:.2f}ms")
+    print(f"   积分图批量评分:  {integral_ms:.2f}ms（每个候选框 {integral_ms / count * 1e6:.0f}ns）")
+    print(f"   逐个切片求均值:  {naive_ms:.1f}ms")
+    print(f"   完整区域检测:    {total_ms:.2f}ms")
+    for name, zone in zones.items():
+        print(f"   {name:7s} ({zone['x']}, {zone['y']}, {zone['width']}, {zone['height']})  显著度 {zone['saliency']:.3f}")
+
+
+def bench_dedupe(args):
+    """测量感知哈希：批量计算、多索引查找与线性扫描，以及近似重复模板复用分析"""
+    import io
+    import numpy as np
+    from PIL import Image
+    from utils.image_processor import ImageProcessor
+    from utils.perceptual_hash import MultiIndexHash, hamming_many, phash, phash_thumbnails, thumbnail
+
+    rng = np.random.RandomState(0)
+    images = [Image.fromarray(rng.randint(0, 255, (64, 64, 3), dtype=np.uint8)).resize((800, 800))
+              for _ in range(args.images)]
+    start = time.perf_counter()
+    for image in images:
+        phash(image)
+    single_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    thumbnails = np.stack([thumbnail(image) for image in images])
+    thumbnail_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    phash_thumbnails(thumbnails)
+    batch_ms = (time.perf_counter() - start) * 1000
+    print(f"📊 {args.images} 张 800×800 图片的pHash")
+    print(f"   逐张计算: {single_ms:.1f}ms  缩略图 {thumbnail_ms:.1f}ms + 批量DCT {batch_ms:.2f}ms")
+
+    hashes = rng.randint(0, 2 ** 63, args.hashes, dtype=np.int64).astype(np.uint64)
+    index = MultiIndexHash(args.distance)
+    start = time.perf_counter()
+    for position, value in enumerate(hashes):
+        index.add(int(value), position)
+    build_ms = (time.perf_counter() - start) * 1000
+    queries = [int(hashes[i]) ^ (1 << (i % 64)) for i in range(args.queries)]
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query)
+    index_ms = (time.perf_counter() - start) / len(queries) * 1000
+    start = time.perf_counter()
+    for query in queries:
+        np.flatnonzero(hamming_many(query, hashes) <= args.distance)
+    scan_ms = (time.perf_counter() - start) / len(queries) * 1000
+    print(f"📊 {args.hashes} 个哈希，汉明距离 ≤ {args.distance}")
+    print(f"   多索引哈希: 建索引 {build_ms:.0f}ms，每次查询 {index_ms:.3f}ms")
+    print(f"   向量化线性扫描: 每次查询 {scan_ms:.3f}ms")
+
+    template = Image.fromarray(rng.randint(0, 255, (16, 16, 3), dtype=np.uint8)).resize((1200, 1200), Image.NEAREST)
+    buffer = io.BytesIO()
+    template.resize((900, 900)).save(buffer, format="JPEG", quality=70)
+    copy = Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+    processor = ImageProcessor()
+    start = time.perf_counter()
+    processor.analyze_template(template)
+    full_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    analysis = processor.analyze_template(copy)
+    reuse_ms = (time.perf_counter() - start) * 1000
+    print(f"📊 模板分析 1200×1200: 完整 {full_ms:.0f}ms，"
+          f"重新压缩的 900×900 副本 {reuse_ms:.1f}ms（{'复用' if analysis.get('near_duplicate') else '未复用'}）")
+
+
+def bench_memory(args):
+    """测量缓存条目的内存：嵌套字典与紧凑结果类型对比"""
+    import copy
+    import json
+    import tracemalloc
+    from PIL import Image, ImageDraw
+    from utils.ai_generator import AIGenerator
+    from utils.image_processor import ImageProcessor
+    from utils.result_types import ComplianceResult, DetailPageLayout, TemplateAnalysis
+    from utils.text_processor import TextProcessor
+
+    # 各取一个真实结果作为样本，再改动数值和文字生成互不相同的条目
+    template = Image.new("RGB", (800, 800), (240, 240, 240))
+    draw = ImageDraw.Draw(template)
+    for i in range(6):
+        draw.rectangle([50 + i * 100, 100 + i * 60, 180 + i * 100, 150 + i * 60], fill=(i * 40, 20, 20))
+    analysis = ImageProcessor.analyze_template.uncached(ImageProcessor(), template, template)
+    compliance = TextProcessor.check_forbidden_words.uncached(TextProcessor(), "最好的第一选择，100%有效")
+    article = load_sample_article()["content"]
+    layout = AIGenerator.generate_detail_page_layout.uncached(AIGenerator(), article)
+
+    def analysis_variant(i):
+        value = copy.deepcopy(analysis)
+        value["width"] = value["height"] = 800 + i
+        for region in value["text_regions"]:
+            region["x"] += i
+            region["area"] = region["width"] * region["height"]
+        for zone in value["layout_zones"].values():
+            zone["y"] += i
+            zone["saliency"] += i * 1e-6
+        return value
+
+    def compliance_variant(i):
+        value = copy.deepcopy(compliance)
+        value["forbidden_words"] = value["forbidden_words"] + [f"词{i}"]
+        return value
+
+    def layout_variant(i):
+        value = copy.deepcopy(layout)
+        for section in value["sections"][:3]:
+            section["content"] = [f"{item}{i}" for item in section["content"]]
+        return value
+
+    # 缓存中的真实结果由计算新建，字符串和浮点数不与其他条目共享；
+    # 这里从JSON重新解析得到同样互不共享的字典，紧凑形式在解析后立即转换
+    def measure(build) -> float:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        entries = [build(i) for i in range(args.entries)]
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del entries
+        return used / args.entries
+
+    print(f"📊 每个缓存条目的内存（{args.entries} 个条目的平均值）")
+    for name, variant, result_type in (("模板分析", analysis_variant, TemplateAnalysis),
+                                       ("违禁词检测", compliance_variant, ComplianceResult),
+                                       ("详情页布局", layout_variant, DetailPageLayout)):
+        samples = [json.dumps(variant(i), ensure_ascii=False) for i in range(args.entries)]
+        as_dict = measure(lambda i: json.loads(samples[i]))
+        compact = measure(lambda i: result_type.pack(json.loads(samples[i])))
+        assert all(result_type.pack(json.loads(sample)).to_dict() == json.loads(sample) for sample in samples[:50])
+        print(f"   {name}: 字典 {as_dict:.0f}B → 紧凑 {compact:.0f}B（{compact / as_dict:.0%}）")
+
+    sample = TemplateAnalysis.pack(analysis)
+    start = time.perf_counter()
+    for _ in range(1000):
+        sample.to_dict()
+    to_dict_us = (time.perf_counter() - start) / 1000 * 1e6
+    start = time.perf_counter()
+    for _ in range(1000):
+        copy.deepcopy(analysis)
+    deepcopy_us = (time.perf_counter() - start) / 1000 * 1e6
+    print(f"   缓存命中时还原模板分析: to_dict {to_dict_us:.0f}µs，原来的深拷贝 {deepcopy_us:.0f}µs")
+
+
+def bench_pipeline(args):
+    """对比手工串联各步骤与生成流水线：冷启动、输入不变重跑和只改副标题时的耗时"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+    from utils.ai_generator import AIGenerator
+    from utils.analysis_cache import shared_analysis_cache
+    from utils.asset_store import get_asset_store
+    from utils.detail_page_exporter import generate_html_detail_page
+    from utils.generation_pipeline import build_generation_pipeline, compose_main_texts, filter_sections
+    from utils.image_processor import ImageProcessor, template_index
+    from utils.multi_size_export import MultiSizeExporter
+    from utils.pipeline import format_timings, shared_pipeline_cache
+    from utils.text_processor import TextProcessor
+
+    article = load_sample_article()
+    rng = np.random.RandomState(0)
+    template = Image.fromarray(rng.randint(200, 255, (args.size, args.size, 3), dtype=np.uint8))
+    ImageDraw.Draw(template).ellipse([args.size // 4, args.size // 3, args.size * 3 // 4, args.size * 5 // 6],
+                                     fill=(190, 80, 60))
+    template_key = get_asset_store().put(template)
+    text_processor, image_processor, ai_generator = TextProcessor(), ImageProcessor(), AIGenerator()
+    style_config = {"title": {"size": 48, "color": "#FF6B35", "weight": "bold"},
+                    "subtitle": {"size": 28, "color": "#333333", "weight": "normal"}}
+    section_map = {"process": False}
+    targets = ["compliance", "keywords", "selling_points", "title_variants", "template_analysis",
+               "main_image", "size_exports", "detail_layout", "detail_html", "detail_json"]
+
+    def hand_wired(subtitle: str):
+        """原来在页面中逐步调用的流程，每次都全部重新执行"""
+        title, content = article["title"], article["content"]
+        text_processor.check_forbidden_words(title + " " + content)
+        text_processor.extract_keywords(content, 8)
+        selling_points = text_processor.extract_selling_points(content)
+        text_processor.generate_title_variants(title)
+        layout = image_processor.analyze_template(template, None)
+        texts = compose_main_texts({"title": title, "subtitle": subtitle}, selling_points)
+        get_asset_store().put(image_processor.render_text_on_template(template, texts, style_config, layout))
+        exporter = MultiSizeExporter()
+        exporter.to_zip(exporter.export(image_processor, template, texts, style_config, layout))
+        detail = filter_sections(ai_generator.generate_detail_page_layout(content), section_map)
+        generate_html_detail_page(detail)
+
+    pipeline = build_generation_pipeline(text_processor, image_processor, ai_generator)
+
+    def piped(subtitle: str):
+        layout = pipeline.run({"template_key": template_key, "reference_key": None},
+                              ["template_analysis"])["template_analysis"]
+        inputs = {"article_title": article["title"], "article_content": article["content"],
+                  "template_key": template_key, "reference_key": None, "layout": layout,
+                  "texts": {"title": article["title"], "subtitle": subtitle}, "style_config": style_config,
+                  "render_session": None, "section_map": section_map}
+        return pipeline.run(inputs, targets, keys={"render_session": "none"})
+
+    def timed(func, *func_args) -> float:
+        start = time.perf_counter()
+        func(*func_args)
+        return (time.perf_counter() - start) * 1000
+
+    print(f"📊 模板 {args.size}×{args.size}  改副标题 {args.rounds} 次")
+    for label, func in (("手工串联", hand_wired), ("流水线", piped)):
+        shared_analysis_cache.clear()
+        shared_pipeline_cache.clear()
+        template_index.clear()
+        cold = timed(func, "副标题")
+        same = [timed(func, "副标题") for _ in range(args.rounds)]
+        edits = [timed(func, f"副标题 {i}") for i in range(args.rounds)]
+        print(f"   {label}: 冷启动 {cold:.0f}ms  输入不变 {sum(same) / len(same):.1f}ms"
+              f"  只改副标题 {sum(edits) / len(edits):.1f}ms")
+
+    run = piped("副标题 最后一次")
+    print(f"   流水线各阶段（只改副标题）: {format_timings(run.timings)}")
+
+def bench_metrics(args):
+    """测量性能统计的开销：关闭与打开时每次计时的额外耗时，以及对文本分析的影响"""
+    from utils.instrumentation import Instrumentation, instrumentation
+    from utils.text_processor import TextProcessor
+
+    stats = Instrumentation()
+
+    def noop():
+        return None
+
+    wrapped = stats.timed("bench.noop")(noop)
+
+    def per_call(func) -> float:
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            func()
+        return (time.perf_counter() - start) / args.calls * 1e9
+
+    def with_span():
+        with stats.span("bench.span"):
+            pass
+
+    baseline = per_call(noop)
+    off = (per_call(wrapped), per_call(with_span))
+    stats.enable()
+    on = (per_call(wrapped), per_call(with_span))
+    stats.disable()
+
+    print(f"📊 每次调用（{args.calls} 次取平均）  空函数 {baseline:.0f}ns")
+    print(f"   关闭: timed 装饰器 +{off[0] - baseline:.0f}ns  span 上下文 {off[1]:.0f}ns")
+    print(f"   打开: timed 装饰器 +{on[0] - baseline:.0f}ns  span 上下文 {on[1]:.0f}ns")
+
+    # 不经过缓存直接执行文本分析，对比关闭和打开统计时的耗时
+    article = load_sample_article()
+    processor = TextProcessor()
+    steps = [
+        lambda: TextProcessor.check_forbidden_words.uncached(processor, article["content"]),
+        lambda: TextProcessor.extract_keywords.uncached(processor, article["content"], 8),
+        lambda: TextProcessor.extract_selling_points.uncached(processor, article["content"]),
+    ]
+    results = {}
+    for label, enabled in (("关闭", False), ("打开", True), ("关闭", False)):
+        instrumentation.enabled = enabled
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for step in steps:
+                step()
+        results.setdefault(label, []).append((time.perf_counter() - start) / args.rounds * 1000)
+    instrumentation.enabled = False
+    print(f"   文本分析（{args.rounds} 轮）: 关闭 {min(results['关闭']):.2f}ms  打开 {results['打开'][0]:.2f}ms")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="智能电商主图生成器 - 性能基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ai = subparsers.add_parser("ai", help="离线压测AI生图与文本路径")
+    ai.add_argument("--requests", type=int, default=40, help="主图请求数，详情页为其1/5")
+    ai.add_argument("--concurrency", type=int, default=8)
+    ai.add_argument("--image-latency", default="lognormal:0.8:0.3", help="生图延迟分布")
+    ai.add_argument("--chat-latency", default="lognormal:0.4:0.3", help="文本补全延迟分布")
+    ai.add_argument("--download-latency", default="fixed:0.02", help="图片下载延迟分布")
+    ai.add_argument("--error-rate", type=float, default=0.0, help="模拟的服务端错误率")
+    ai.add_argument("--image-pixels", type=int, default=1024, help="下载图片边长（决定载荷大小）")
+    ai.add_argument("--max-retries", type=int, default=0, help="OpenAI客户端重试次数")
+    ai.add_argument("--same-prompt", action="store_true", help="所有请求使用相同提示词（测试请求合并）")
+    ai.add_argument("--seed", type=int, default=None)
+    ai.set_defaults(func=bench_ai)
+
+    api = subparsers.add_parser("api", help="压测HTTP API服务")
+    api.add_argument("--url", default=None, help="已运行的服务地址，不指定时在本进程内启动")
+    api.add_argument("--requests", type=int, default=200, help="每个接口的请求数")
+    api.add_argument("--concurrency", type=int, default=16)
+    api.add_argument("--workers", type=int, default=4, help="内置服务的工作线程数")
+    api.add_argument("--queue-size", type=int, default=16, help="内置服务的等待队列长度")
+    api.add_argument("--template-size", type=int, default=800, help="模板边长")
+    api.add_argument("--cached", action="store_true", help="文本请求使用相同内容，测试缓存命中")
+    api.add_argument("--seed", type=int, default=None)
+    api.set_defaults(func=bench_api)
+
+    export = subparsers.add_parser("export", help="对比详情页HTML导出器")
+    export.add_argument("--layouts", type=int, default=5000, help="导出的布局数量")
+    export.set_defaults(func=bench_export)
+
+    ui = subparsers.add_parser("ui", help="测量并发模板分析时的界面响应延迟")
+    ui.add_argument("--sessions", type=int, default=4, help="同时分析模板的会话数")
+    ui.add_argument("--duration", type=float, default=10.0, help="每种方式的测量时长（秒）")
+    ui.add_argument("--size", type=int, default=600, help="模板边长")
+    ui.add_argument("--interval", type=float, default=0.05, help="轻量请求间隔（秒）")
+    ui.add_argument("--seed", type=int, default=0)
+    ui.set_defaults(func=bench_ui)
+
+    raster = subparsers.add_parser("raster", help="渲染超长详情页JPEG长图")
+    raster.add_argument("--repeat", type=int, default=14, help="章节重复次数，决定长图高度")
+    raster.add_argument("--workers", type=int, default=4, help="图块渲染线程数")
+    raster.add_argument("--quality", type=int, default=90)
+    raster.set_defaults(func=bench_raster)
+
+    sizes = subparsers.add_parser("sizes", help="对比多尺寸导出与分别渲染")
+    sizes.add_argument("--rounds", type=int, default=10)
+    sizes.add_argument("--template-size", type=int, default=800, help="模板边长")
+    sizes.add_argument("--format", default="PNG", choices=["PNG", "JPEG", "WEBP"])
+    sizes.set_defaults(func=bench_sizes)
+
+    layout = subparsers.add_parser("layout", help="对比文字自动排版的字号查找")
+    layout.add_argument("--texts", type=int, default=200, help="排版的文字段数")
+    layout.add_argument("--box-width", type=int, default=720)
+    layout.add_argument("--box-height", type=int, default=160)
+    layout.add_argument("--max-size", type=int, default=72, help="字号上限")
+    layout.set_defaults(func=bench_layout)
+
+    rerender = subparsers.add_parser("rerender", help="对比整张重新渲染与增量渲染")
+    rerender.add_argument("--edits", type=int, default=50, help="修改次数")
+    rerender.add_argument("--template-size", type=int, default=1600, help="模板边长")
+    rerender.set_defaults(func=bench_rerender)
+
+    ingest = subparsers.add_parser("ingest", help="对比大图直接解码与按预算解码")
+    ingest.add_argument("--width", type=int, default=6000)
+    ingest.add_argument("--height", type=int, default=4000)
+    ingest.add_argument("--format", default="JPEG", choices=["JPEG", "PNG"])
+    ingest.set_defaults(func=bench_ingest)
+
+    zones = subparsers.add_parser("zones", help="测量显著度布局区域检测")
+    zones.add_argument("--size", type=int, default=1200, help="模板边长")
+    zones.add_argument("--repeat", type=int, default=20)
+    zones.set_defaults(func=bench_zones)
+
+    dedupe = subparsers.add_parser("dedupe", help="测量感知哈希索引与近似重复复用")
+    dedupe.add_argument("--images", type=int, default=200, help="计算哈希的图片数")
+    dedupe.add_argument("--hashes", type=int, default=100000, help="索引中的哈希数")
+    dedupe.add_argument("--queries", type=int, default=200)
+    dedupe.add_argument("--distance", type=int, default=6, help="最大汉明距离")
+    dedupe.set_defaults(func=bench_dedupe)
+
+    memory = subparsers.add_parser("memory", help="对比缓存条目用字典与紧凑结果类型的内存")
+    memory.add_argument("--entries", type=int, default=2000)
+    memory.set_defaults(func=bench_memory)
+
+    pipeline = subparsers.add_parser("pipeline", help="对比手工串联与生成流水线的重复执行耗时")
+    pipeline.add_argument("--size", type=int, default=1200, help="模板边长")
+    pipeline.add_argument("--rounds", type=int, default=5)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    metrics = subparsers.add_parser("metrics", help="测量性能统计关闭和打开时的开销")
+    metrics.add_argument("--calls", type=int, default=1000000)
+    metrics.add_argument("--rounds", type=int, default=50)
+    metrics.set_defaults(func=bench_metrics)
+
+    return parser
+
+
+def main():
+    """主函数"""
+    args = build_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -72,4 +72,58 @@ IMAGE_SIZES = {
     "main_image": (800, 800),
     "detail_banner": (750, 1334),
     "thumbnail": (300, 300)
-}
\ No newline at end of file
+}
+
+# 分析结果缓存条目上限（进程级，所有会话共享），设为0关闭缓存
+ANALYSIS_CACHE_SIZE = 256
+# 上传图片解码缓存条目上限，按文件内容哈希复用解码结果
+UPLOAD_CACHE_SIZE = 32
+# 会话图片仓库：所有会话共享的内存预算（MB），超出后写入磁盘目录，磁盘资源的保留时间（秒）
+ASSET_MEMORY_BUDGET_MB = 256
+ASSET_SPILL_DIR = os.path.join("temp", "assets")
+ASSET_RETENTION_SECONDS = 24 * 3600
+# 对冲生图请求的共享线程数，每次请求最多同时占用两个线程（主后端和备用后端）
+HEDGE_WORKERS = 16
+# 后台任务队列：工作线程数、已完成任务的保留时间（秒）、页面轮询间隔（秒）
+JOB_WORKERS = 4
+JOB_RETENTION_SECONDS = 3600
+JOB_POLL_INTERVAL = 0.5
+# 详情页长图的输出目录
+DETAIL_IMAGE_DIR = os.path.join("temp", "detail_pages")
+# 模板分析与渲染使用的计算进程数
+PROCESS_POOL_WORKERS = 2
+# 文字排版：按顺序查找可用字体（优先支持中文的字体），以及自动缩小字号的下限
+FONT_CANDIDATES = [
+    "msyh.ttc",
+    "simhei.ttf",
+    "PingFang.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc",
+    "arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+MIN_FONT_SIZE = 12
+# 主图实时预览：预览图的最长边，以及参数停止变化多久后在后台渲染全分辨率（秒）
+PREVIEW_MAX_SIDE = 320
+PREVIEW_DEBOUNCE_SECONDS = 0.8
+# 上传图片的解码预算：文件字节数上限、像素数上限（按文件头判断，超出直接拒绝），
+# 以及工作图片的最长边（更大的模板解码时缩小，JPEG 使用缩小比例的草稿解码）
+UPLOAD_MAX_BYTES = 30 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 60_000_000
+TEMPLATE_MAX_SIDE = 2048
+# 参考成品样式提取：分析用缩略图的最长边，以及每张图片的时间预算（秒）
+STYLE_ANALYSIS_MAX_SIDE = 320
+STYLE_EXTRACTION_BUDGET = 0.25
+# 布局区域检测：计算显著度图时的最长边
+ZONE_ANALYSIS_MAX_SIDE = 256
+# 近似重复图片：pHash 汉明距离不超过该值视为同一张图（重新压缩、缩放后的模板复用分析结果，批量输出去重）
+NEAR_DUPLICATE_MAX_DISTANCE = 6
+# 生成流水线：阶段输出缓存的条目数，以及同一层级并行执行的阶段数
+PIPELINE_CACHE_SIZE = 128
+PIPELINE_WORKERS = 4
+# 性能统计：是否默认打开（页面侧边栏和API服务的 --metrics 参数也可以打开）、JSON日志路径，以及攒多少条计时写一次日志
+INSTRUMENTATION_ENABLED = False
+INSTRUMENTATION_LOG = os.path.join("temp", "metrics.jsonl")
+INSTRUMENTATION_FLUSH_EVENTS = 200
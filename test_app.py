@@ -106,6 +106,1186 @@ def test_ai_generator():
     
     return True
 
+def test_request_coalescing():
+    """测试相同请求的合并"""
+    print("🧪 测试请求合并...")
+    
+    import threading
+    import time
+    from utils.single_flight import SingleFlight
+    
+    flight = SingleFlight()
+    executions = []
+    
+    def slow_call():
+        executions.append(1)
+        time.sleep(0.2)
+        return "result"
+    
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("same-prompt", slow_call)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    stats = flight.get_stats()
+    ok = (
+        len(executions) == 1
+        and all(r[0] == "result" for r in results)
+        and stats["coalesced"] == 4
+        and stats["in_flight"] == 0
+    )
+    print(f"   请求合并: {'✅' if ok else '❌'}")
+    print(f"   调用 {stats['calls']} 次, 实际执行 {stats['executions']} 次, 合并 {stats['coalesced']} 次")
+    
+    return ok
+
+def test_hedged_image_backend():
+    """测试对冲请求：慢的主后端超过截止时间后由备用后端返回"""
+    print("🧪 测试对冲生图后端...")
+    
+    import time
+    from utils.image_backends import ImageBackend, HedgedImageBackend, LatencyTracker
+    
+    class StubBackend(ImageBackend):
+        def __init__(self, name, delay, color):
+            self.name = name
+            self.delay = delay
+            self.color = color
+        
+        def generate(self, prompt, size="1024x1024", quality="standard"):
+            time.sleep(self.delay)
+            return Image.new('RGB', (8, 8), color=self.color)
+    
+    tracker = LatencyTracker()
+    for _ in range(20):
+        tracker.record(0.05)
+    
+    slow = StubBackend("slow", 1.0, "red")
+    fast = StubBackend("fast", 0.05, "blue")
+    hedged = HedgedImageBackend(slow, fast, min_samples=20, tracker=tracker)
+    
+    start = time.perf_counter()
+    image = hedged.generate("prompt")
+    elapsed = time.perf_counter() - start
+    
+    stats = hedged.get_stats()
+    ok = (
+        image is not None
+        and image.getpixel((0, 0)) == (0, 0, 255)
+        and elapsed < 0.5
+        and stats["hedged"] == 1
+        and stats["secondary_wins"] == 1
+    )
+    print(f"   对冲请求: {'✅' if ok else '❌'}")
+    print(f"   截止时间: {hedged.hedge_deadline():.3f}s, 实际耗时: {elapsed:.3f}s")
+    
+    # 主后端足够快时不应触发对冲
+    quick = HedgedImageBackend(fast, slow, min_samples=1, default_deadline=0.5)
+    image = quick.generate("prompt")
+    ok = ok and image is not None and quick.get_stats()["hedged"] == 0
+    
+    # 主后端失败时同样记录延迟，线程池可以单独指定
+    from concurrent.futures import ThreadPoolExecutor
+    
+    class FailingBackend(StubBackend):
+        def generate(self, prompt, size="1024x1024", quality="standard"):
+            time.sleep(self.delay)
+            return None
+    
+    failing_tracker = LatencyTracker()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        failing = HedgedImageBackend(FailingBackend("failing", 0.05, "red"), fast, tracker=failing_tracker,
+                                     executor=executor)
+        image = failing.generate("prompt")
+    recorded = image is not None and failing_tracker.count() == 1 and failing_tracker.quantile(0.5) >= 0.05
+    print(f"   失败请求计入延迟: {'✅' if recorded else '❌'}")
+    
+    return ok and recorded
+
+def test_fake_openai_server():
+    """测试AIGenerator对接本地模拟OpenAI服务"""
+    print("🧪 测试模拟OpenAI服务...")
+    
+    from utils.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+    
+    config = FakeOpenAIConfig(
+        image_latency="fixed:0.01", chat_latency="fixed:0.01",
+        download_latency="fixed:0", image_pixels=64
+    )
+    
+    try:
+        with FakeOpenAIServer(config) as server:
+            generator = AIGenerator()
+            generator.set_openai_key("sk-fake", base_url=server.base_url, max_retries=0)
+            
+            image = generator.generate_image_with_dalle("测试提示词")
+            text = generator.optimize_text_with_gpt("网络创业指南", "title")
+            stats = server.get_stats()
+    except Exception as e:
+        print(f"   模拟服务: ❌ - {e}")
+        return False
+    
+    ok = (
+        image is not None
+        and image.size == (64, 64)
+        and text == config.chat_reply
+        and stats["images"] == 1
+        and stats["downloads"] == 1
+    )
+    print(f"   模拟服务: {'✅' if ok else '❌'}")
+    print(f"   服务端统计: {stats}")
+    
+    return ok
+
+def test_streaming_text_optimization():
+    """测试流式文本优化在出现违禁词时提前终止"""
+    print("🧪 测试流式文本优化...")
+    
+    from utils.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+    
+    # 违禁词跨越两个分片，验证增量检测能发现
+    scanner = TextProcessor().create_forbidden_scanner()
+    found = scanner.feed("这个方法绝") + scanner.feed("对有用")
+    ok = found == ["绝对"]
+    
+    config = FakeOpenAIConfig(
+        chat_latency="fixed:0", chat_token_latency="fixed:0.01",
+        chat_reply="轻松学会网络创业，" + "这是最好的选择" + "，后续内容" * 20
+    )
+    
+    try:
+        with FakeOpenAIServer(config) as server:
+            generator = AIGenerator()
+            generator.set_openai_key("sk-fake", base_url=server.base_url, max_retries=0)
+            
+            stream = generator.optimize_text_with_gpt_stream("网络创业指南", "title")
+            chunks = list(stream)
+    except Exception as e:
+        print(f"   流式优化: ❌ - {e}")
+        return False
+    
+    ok = (
+        ok
+        and stream.aborted
+        and stream.forbidden_words == ["最好"]
+        and "".join(chunks) == stream.text
+        and len(stream.text) < len(config.chat_reply)
+        and stream.text == "轻松学会网络创业，这是"
+    )
+    print(f"   流式优化: {'✅' if ok else '❌'}")
+    print(f"   已接收 {len(stream.text)}/{len(config.chat_reply)} 字符后终止")
+    
+    return ok
+
+def test_analysis_cache():
+    """测试分析结果的进程级记忆化"""
+    print("🧪 测试分析缓存...")
+    
+    from utils.analysis_cache import shared_analysis_cache
+    
+    content = "网络创业是当今时代的新机遇，每天投入2小时，30天可以提升收入"
+    
+    # 不同实例（模拟不同会话）共享缓存
+    first = TextProcessor().extract_keywords(content, 5)
+    before = shared_analysis_cache.get_stats()
+    second = TextProcessor().extract_keywords(content, 5)
+    after = shared_analysis_cache.get_stats()
+    
+    # 修改返回值不应影响缓存
+    second.append("被修改")
+    third = TextProcessor().extract_keywords(content, 5)
+    
+    template = Image.new('RGB', (200, 200), color='white')
+    processor = ImageProcessor()
+    analysis = processor.analyze_template(template)
+    hits = shared_analysis_cache.get_stats()["hits"]
+    cached = processor.analyze_template(template.copy())
+    
+    ok = (
+        first == third
+        and after["hits"] == before["hits"] + 1
+        and cached == analysis
+        and shared_analysis_cache.get_stats()["hits"] == hits + 1
+    )
+    print(f"   分析缓存: {'✅' if ok else '❌'}")
+    print(f"   缓存统计: {shared_analysis_cache.get_stats()}")
+    
+    return ok
+
+def test_job_queue():
+    """测试后台任务队列"""
+    print("🧪 测试后台任务队列...")
+    
+    import time
+    from utils.job_queue import JobQueue, DONE, FAILED, CANCELLED
+    
+    queue = JobQueue(max_workers=1)
+    processor = ImageProcessor()
+    template = Image.new('RGB', (400, 400), color='white')
+    
+    def render_job(context, texts):
+        context.set_progress(0.5, "渲染中")
+        return processor.render_text_on_template(template, texts, {})
+    
+    def failing_job(context):
+        raise RuntimeError("boom")
+    
+    render_id = queue.submit("render", render_job, {"title": "测试标题"}, owner="session-a")
+    failing_id = queue.submit("render", failing_job, owner="session-b")
+    cancelled_id = queue.submit("render", render_job, {"title": "取消"}, owner="session-a")
+    queue.cancel(cancelled_id)
+    
+    deadline = time.time() + 10
+    while time.time() < deadline and not all(
+        queue.get(job_id).finished for job_id in (render_id, failing_id, cancelled_id)
+    ):
+        time.sleep(0.05)
+    
+    render, failing, cancelled = (queue.get(j) for j in (render_id, failing_id, cancelled_id))
+    ok = (
+        render.status == DONE
+        and render.result.size == (400, 400)
+        and failing.status == FAILED
+        and "boom" in failing.error
+        and cancelled.status == CANCELLED
+        and len(queue.list_jobs(owner="session-a")) == 2
+    )
+    print(f"   任务队列: {'✅' if ok else '❌'}")
+    print(f"   任务状态: {render.status}, {failing.status}, {cancelled.status}")
+    
+    return ok
+
+def test_batch_pipeline():
+    """测试批量生成与断点续跑"""
+    print("🧪 测试批量生成...")
+    
+    import shutil
+    import tempfile
+    from batch import collect_items_from_directories, run_batch
+    
+    workdir = tempfile.mkdtemp()
+    try:
+        articles_dir = os.path.join(workdir, "articles")
+        templates_dir = os.path.join(workdir, "templates")
+        output_dir = os.path.join(workdir, "outputs")
+        os.makedirs(articles_dir)
+        os.makedirs(templates_dir)
+        
+        for name in ("a", "b"):
+            shutil.copy("demo/sample_article.txt", os.path.join(articles_dir, f"{name}.txt"))
+        Image.new('RGB', (400, 400), color='white').save(os.path.join(templates_dir, "a.png"))
+        
+        items = collect_items_from_directories(articles_dir, templates_dir)
+        first = run_batch(items, output_dir, workers=1)
+        second = run_batch(items, output_dir, workers=1)
+        
+        ok = (
+            first["completed"] == 2
+            and second["skipped"] == 2
+            and second["completed"] == 0
+            and os.path.exists(os.path.join(output_dir, "a", "main_image.png"))
+            and os.path.exists(os.path.join(output_dir, "b", "detail_page.html"))
+        )
+    except Exception as e:
+        print(f"   批量生成: ❌ - {e}")
+        return False
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print(f"   批量生成: {'✅' if ok else '❌'}")
+    print(f"   吞吐量: {first['throughput']:.2f} 个/秒")
+    
+    # 清单中重复的ID加行号区分，越出输出目录的ID跳过
+    from batch import collect_items_from_manifest
+    
+    manifest_dir = tempfile.mkdtemp()
+    try:
+        manifest = os.path.join(manifest_dir, "catalog.csv")
+        with open(manifest, "w", encoding="utf-8") as f:
+            f.write("article,template,id,title\n"
+                    "a.txt,t.png,,标题一\n"
+                    "a.txt,t.png,,标题二\n"
+                    "b.txt,,shared,\n"
+                    "c.txt,,shared,\n"
+                    "d.txt,,../x,\n"
+                    "e.txt,,sub/x,\n")
+        ids = [item["id"] for item in collect_items_from_manifest(manifest)]
+    finally:
+        shutil.rmtree(manifest_dir, ignore_errors=True)
+    ids_ok = ids == ["a__t", "a__t__row3", "shared", "shared__row5"]
+    print(f"   清单ID去重与校验: {'✅' if ids_ok else '❌'} {ids}")
+    
+    return ok and ids_ok
+
+def test_api_server():
+    """测试HTTP API服务"""
+    print("🧪 测试HTTP API服务...")
+    
+    import http.client
+    import requests
+    from api_server import APIServer
+    
+    processor = ImageProcessor()
+    template_b64 = processor.image_to_base64(Image.new('RGB', (300, 300), color='white'))
+    
+    try:
+        with APIServer(port=0, max_workers=2, queue_size=2) as server:
+            compliance = requests.post(server.url + "/api/compliance",
+                                       json={"text": "这是最好的产品"}, timeout=30)
+            render = requests.post(server.url + "/api/render",
+                                   json={"image": template_b64, "texts": {"title": "测试标题"}}, timeout=30)
+            bad = requests.post(server.url + "/api/analyze/text", json={}, timeout=30)
+            metrics = requests.get(server.url + "/api/metrics", timeout=30).json()
+            
+            # 字段类型错误、Content-Length 无效都返回400
+            bad_texts = requests.post(server.url + "/api/render",
+                                      json={"image": template_b64, "texts": ["测试标题"]}, timeout=30)
+            connection = http.client.HTTPConnection(*server._httpd.server_address[:2], timeout=30)
+            connection.putrequest("POST", "/api/compliance")
+            connection.putheader("Content-Length", "abc")
+            connection.endheaders()
+            bad_length = connection.getresponse().status
+            connection.close()
+    except Exception as e:
+        print(f"   API服务: ❌ - {e}")
+        return False
+    
+    rendered = processor.base64_to_image(render.json()["image"]) if render.status_code == 200 else None
+    ok = (
+        compliance.status_code == 200
+        and compliance.json()["has_forbidden"]
+        and rendered is not None
+        and rendered.size == (300, 300)
+        and bad.status_code == 400
+        and metrics["endpoints"]["/api/render"]["requests"] == 1
+        and metrics["endpoints"]["/api/analyze/text"]["errors"] == 1
+        and bad_texts.status_code == 400
+        and bad_length == 400
+    )
+    print(f"   API服务: {'✅' if ok else '❌'}")
+    print(f"   渲染接口延迟: {metrics['endpoints']['/api/render']['p50_ms']}ms")
+    
+    return ok
+
+def test_detail_page_exporter():
+    """测试详情页HTML导出器"""
+    print("🧪 测试详情页HTML导出器...")
+    
+    import tempfile
+    from utils.detail_page_exporter import DetailPageExporter
+    
+    layout = AIGenerator().generate_detail_page_layout("这是一个测试产品，具有优秀的性能")
+    exporter = DetailPageExporter()
+    page = exporter.render(layout)
+    ok = all(section["title"] in page for section in layout["sections"])
+    print(f"   章节导出: {'✅' if ok else '❌'}")
+    
+    # 内容中的标签必须被转义，颜色只接受十六进制值
+    unsafe = dict(layout, color_scheme={"primary": "red;}</style><script>", "secondary": "#333"})
+    unsafe["sections"] = [{"type": "features", "title": "<b>标题</b>", "content": ["<script>alert(1)</script>"]}]
+    unsafe_page = exporter.render(unsafe)
+    escaped = "<script>" not in unsafe_page and "&lt;script&gt;" in unsafe_page and "&lt;b&gt;" in unsafe_page
+    print(f"   内容转义: {'✅' if escaped else '❌'}")
+    
+    layouts = ((f"page_{i}", layout) for i in range(20))
+    with tempfile.TemporaryDirectory() as output_dir:
+        count = exporter.export_many(layouts, output_dir)
+        with open(os.path.join(output_dir, "page_19.html"), "r", encoding="utf-8") as f:
+            streamed = f.read() == page
+    print(f"   批量导出: {'✅' if count == 20 and streamed else '❌'}")
+    
+    return ok and escaped and count == 20 and streamed
+
+def test_image_cache():
+    """测试上传解码与下载编码缓存"""
+    print("🧪 测试图片编解码缓存...")
+    
+    import io
+    from utils.image_cache import decode_image, encode_image, get_image_cache_stats
+    
+    buffer = io.BytesIO()
+    Image.new('RGBA', (120, 80), color=(255, 0, 0, 0)).save(buffer, format='PNG')
+    data = buffer.getvalue()
+    
+    first = decode_image(data)
+    second = decode_image(data)
+    decoded_ok = first is second and first.mode == 'RGB' and first.getpixel((0, 0)) == (255, 255, 255)
+    print(f"   上传解码复用: {'✅' if decoded_ok else '❌'}")
+    
+    image = Image.new('RGB', (120, 80), color='blue')
+    before = get_image_cache_stats()["encoded"]
+    encoded = encode_image(image)
+    encoded_again = encode_image(image)
+    after = get_image_cache_stats()["encoded"]
+    encoded_ok = (
+        encoded is encoded_again
+        and after["misses"] - before["misses"] == 1
+        and after["hits"] - before["hits"] == 1
+        and Image.open(io.BytesIO(encoded)).size == (120, 80)
+    )
+    print(f"   下载编码复用: {'✅' if encoded_ok else '❌'}")
+    
+    # 图片被回收后编码条目随之释放
+    entries = after["entries"]
+    del image
+    released = get_image_cache_stats()["encoded"]["entries"] == entries - 1
+    print(f"   随图片释放: {'✅' if released else '❌'}")
+    
+    return decoded_ok and encoded_ok and released
+
+def test_asset_store():
+    """测试会话图片仓库"""
+    print("🧪 测试会话图片仓库...")
+    
+    import shutil
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.asset_store import AssetStore
+    
+    spill_dir = tempfile.mkdtemp()
+    try:
+        # 预算只够两张 100x100 的RGB图片
+        store = AssetStore(memory_budget=2 * 100 * 100 * 3, spill_dir=spill_dir)
+        colors = [(i * 20, 255 - i * 20, 128) for i in range(8)]
+        images = [Image.new('RGB', (100, 100), color=color) for color in colors]
+        
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            keys = list(pool.map(store.put, images))
+        stats = store.get_stats()
+        bounded = stats["memory_bytes"] <= stats["memory_budget"] and stats["spills"] >= 6
+        print(f"   内存预算: {'✅' if bounded else '❌'} ({stats['memory_entries']} 张在内存, {stats['spills']} 张写盘)")
+        
+        reloaded = [store.get(key) for key in keys]
+        restored = all(image is not None and image.getpixel((0, 0)) == color
+                       for image, color in zip(reloaded, colors))
+        stats = store.get_stats()
+        restored = restored and stats["disk_loads"] >= 6 and stats["memory_bytes"] <= stats["memory_budget"]
+        print(f"   懒加载还原: {'✅' if restored else '❌'}")
+        
+        same_key = store.put(images[0].copy()) == keys[0] and store.get("0" * 40) is None
+        print(f"   内容寻址: {'✅' if same_key else '❌'}")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    
+    return bounded and restored and same_key
+
+def test_process_offload():
+    """测试进程池模板分析与渲染"""
+    print("🧪 测试进程池计算...")
+    
+    from utils.process_offload import OffloadedImageProcessor
+    
+    rng = np.random.RandomState(7)
+    template = Image.fromarray(rng.randint(0, 256, (240, 320, 3), dtype=np.uint8))
+    local = ImageProcessor()
+    offloaded = OffloadedImageProcessor()
+    
+    analysis = offloaded.analyze_template(template)
+    expected = ImageProcessor.analyze_template.uncached(local, template)
+    analysis_ok = (
+        analysis["width"] == 320 and analysis["height"] == 240
+        and analysis["text_regions"] == expected["text_regions"]
+        and len(analysis["color_palette"]) == len(expected["color_palette"])
+    )
+    print(f"   进程池分析: {'✅' if analysis_ok else '❌'}")
+    
+    texts = {"title": "测试标题", "subtitle": "副标题"}
+    rendered = offloaded.render_text_on_template(template, texts, {})
+    render_ok = np.array_equal(np.asarray(rendered), np.asarray(local.render_text_on_template(template, texts, {})))
+    print(f"   进程池渲染: {'✅' if render_ok else '❌'}")
+    
+    # 灰度模板先转为RGB；进程池损坏时退回本地分析
+    from concurrent.futures.process import BrokenProcessPool
+    from utils import process_offload
+    
+    class BrokenPool:
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("测试")
+    
+    gray = Image.fromarray(rng.randint(0, 256, (120, 160), dtype=np.uint8), "L")
+    gray_ok = offloaded.analyze_template(gray)["width"] == 160
+    original_pool = process_offload.get_process_pool
+    process_offload.get_process_pool = lambda: BrokenPool()
+    try:
+        fallback = offloaded.analyze_template(Image.fromarray(rng.randint(0, 256, (90, 130), dtype=np.uint8), "L"))
+        fallback_ok = fallback["width"] == 130 and fallback["height"] == 90
+    except Exception as e:
+        print(f"   退回本地分析出错: {e}")
+        fallback_ok = False
+    finally:
+        process_offload.get_process_pool = original_pool
+    print(f"   灰度模板与本地退回: {'✅' if gray_ok and fallback_ok else '❌'}")
+    
+    return analysis_ok and render_ok and gray_ok and fallback_ok
+
+def test_shm_transport():
+    """测试共享内存图片传输"""
+    print("🧪 测试共享内存传输...")
+    
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    from multiprocessing import shared_memory
+    from utils.shm_transport import SEGMENT_PREFIX, SharedImage, attach, sweep_orphaned_segments
+    
+    image = Image.fromarray(np.random.RandomState(3).randint(0, 256, (60, 90, 3), dtype=np.uint8))
+    with SharedImage.from_image(image) as shared:
+        roundtrip = np.array_equal(np.asarray(shared.to_image()), np.asarray(image))
+        # 挂载后直接在共享内存上绘制，创建方无需拷贝即可看到
+        with attach(shared.descriptor, writable=True) as attached:
+            attached.image.putpixel((0, 0), (1, 2, 3))
+        in_place = shared.to_image().getpixel((0, 0)) == (1, 2, 3)
+    print(f"   描述信息往返: {'✅' if roundtrip and in_place else '❌'}")
+    
+    # 工作进程崩溃后，创建方仍能释放共享内存段
+    context = multiprocessing.get_context("spawn")
+    crashed = False
+    with SharedImage((32, 32), "RGB") as shared:
+        name = shared.descriptor.name
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                pool.submit(os._exit, 1).result()
+            except BrokenProcessPool:
+                crashed = True
+    try:
+        shared_memory.SharedMemory(name=name).close()
+        released = False
+    except FileNotFoundError:
+        released = True
+    print(f"   崩溃后释放: {'✅' if crashed and released else '❌'}")
+    
+    # 创建进程已不存在的遗留段会被清理
+    swept = True
+    if os.path.isdir("/dev/shm"):
+        probe = context.Process(target=int)
+        probe.start()
+        probe.join()
+        orphan = os.path.join("/dev/shm", f"{SEGMENT_PREFIX}{probe.pid}_orphan")
+        with open(orphan, "wb") as f:
+            f.write(b"\0" * 16)
+        swept = sweep_orphaned_segments() >= 1 and not os.path.exists(orphan)
+    print(f"   遗留段清理: {'✅' if swept else '❌'}")
+    
+    return roundtrip and in_place and crashed and released and swept
+
+def test_detail_page_rasterizer():
+    """测试详情页长图渲染"""
+    print("🧪 测试详情页长图...")
+    
+    import tempfile
+    from utils.detail_page_rasterizer import DetailPageRasterizer
+    
+    layout = AIGenerator().generate_detail_page_layout("这是一个测试产品，具有优秀的性能和专业的服务")
+    long_layout = dict(layout, sections=layout["sections"] * 6)
+    
+    with tempfile.TemporaryDirectory() as output_dir:
+        tiled_path = os.path.join(output_dir, "tiled.jpg")
+        single_path = os.path.join(output_dir, "single.jpg")
+        tiled = DetailPageRasterizer(max_tile_height=600).render_to_file(long_layout, tiled_path)
+        single = DetailPageRasterizer(max_tile_height=10 ** 6).render_to_file(long_layout, single_path)
+        
+        with Image.open(tiled_path) as image:
+            size_ok = image.size == (750, tiled["height"]) and image.format == "JPEG"
+        print(f"   长图尺寸: {'✅' if size_ok else '❌'} ({tiled['width']}×{tiled['height']}, {tiled['tiles']} 个图块)")
+        
+        # 分块渲染与整页渲染的像素完全一致
+        with open(tiled_path, "rb") as a, open(single_path, "rb") as b:
+            stitched = tiled["tiles"] > 1 and single["tiles"] == 1 and a.read() == b.read()
+        print(f"   分块拼接: {'✅' if stitched else '❌'}")
+        
+        # 比图块还高的章节切成多段，拼接结果与整页渲染一致
+        tall_layout = {"sections": [{"type": "hero", "title": "标题", "content": ["很长的内容" * 40] * 12}]}
+        split = DetailPageRasterizer(max_tile_height=300)
+        tile_heights = [sum(height for height, _ in tile) for tile in split._pack_tiles(split.plan(tall_layout))]
+        split.render_to_file(tall_layout, os.path.join(output_dir, "split.jpg"))
+        DetailPageRasterizer(max_tile_height=10 ** 6).render_to_file(tall_layout, os.path.join(output_dir, "whole.jpg"))
+        with open(os.path.join(output_dir, "split.jpg"), "rb") as a, open(os.path.join(output_dir, "whole.jpg"), "rb") as b:
+            split_ok = max(tile_heights) <= 300 and len(tile_heights) > 2 and a.read() == b.read()
+        print(f"   超高章节切分: {'✅' if split_ok else '❌'} ({len(tile_heights)} 个图块)")
+        stitched = stitched and split_ok
+        
+        leftover = [name for name in os.listdir(output_dir) if not name.endswith(".jpg")]
+        print(f"   临时画布清理: {'✅' if not leftover else '❌'}")
+    
+    # 流水线导出：相同布局写入同一个文件，过期的长图被清理
+    from utils import generation_pipeline
+    original_dir = generation_pipeline.DETAIL_IMAGE_DIR
+    with tempfile.TemporaryDirectory() as output_dir:
+        generation_pipeline.DETAIL_IMAGE_DIR = output_dir
+        try:
+            stale_path = os.path.join(output_dir, "stale.jpg")
+            open(stale_path, "wb").close()
+            os.utime(stale_path, (0, 0))
+            first = generation_pipeline.render_detail_image(layout)
+            second = generation_pipeline.render_detail_image(layout)
+            files = os.listdir(output_dir)
+        finally:
+            generation_pipeline.DETAIL_IMAGE_DIR = original_dir
+    reused = first["path"] == second["path"] and files == [os.path.basename(first["path"])]
+    print(f"   长图文件复用与清理: {'✅' if reused else '❌'} ({len(files)} 个文件)")
+    
+    return size_ok and stitched and not leftover and reused
+
+def test_multi_size_export():
+    """测试多尺寸导出"""
+    print("🧪 测试多尺寸导出...")
+    
+    import io
+    from utils.multi_size_export import MultiSizeExporter
+    
+    class CountingProcessor(ImageProcessor):
+        renders = 0
+        
+        def render_text_on_template(self, template, texts, style_config, layout=None):
+            CountingProcessor.renders += 1
+            return super().render_text_on_template(template, texts, style_config, layout)
+    
+    sizes = {"main_image": (800, 800), "detail_banner": (750, 1334), "thumbnail": (300, 300)}
+    exporter = MultiSizeExporter(sizes)
+    template = Image.new('RGB', (400, 400), color='white')
+    files = exporter.export(CountingProcessor(), template, {"title": "测试标题"}, {"title": {"size": 36}})
+    
+    decoded = {name: Image.open(io.BytesIO(data)).size for name, data in files.items()}
+    sizes_ok = decoded == sizes
+    print(f"   全部尺寸: {'✅' if sizes_ok else '❌'} {decoded}")
+    
+    render_once = CountingProcessor.renders == 1 and exporter.master_size((400, 400)) == (1334, 1334)
+    # render_all 同时返回最大图，批量导出的原尺寸主图由它缩小，不再单独渲染
+    master, images = exporter.render_all(CountingProcessor(), template, {"title": "测试标题"}, {"title": {"size": 36}})
+    render_once = render_once and CountingProcessor.renders == 2 and master.size == (1334, 1334) and set(images) == set(sizes)
+    print(f"   只渲染一次: {'✅' if render_once else '❌'}")
+    
+    # 宽标题：竖版居中裁剪会切掉标题两端，应改为补边；横幅裁剪窗口平移到包含标题
+    def edge_ink(image):
+        pixels = np.asarray(image.convert("RGB")).astype(int)
+        ink = np.abs(pixels - 255).sum(axis=2) > 60
+        return bool(ink[:, 0].any() or ink[:, -1].any() or ink[0].any() or ink[-1].any()), int(ink.sum())
+    
+    wide_sizes = dict(sizes, strip=(1334, 400))
+    wide = MultiSizeExporter(wide_sizes)
+    wide_texts = {"title": "宽标题一二三四五六七八九十"}
+    master, images = wide.render_all(ImageProcessor(), template, wide_texts, {"title": {"size": 36}})
+    master_ink = edge_ink(master.resize((750, 750), Image.LANCZOS))[1]
+    banner_cut, banner_ink = edge_ink(images["detail_banner"])
+    strip_cut, strip_ink = edge_ink(images["strip"])
+    wide_ok = (not banner_cut and not strip_cut and abs(banner_ink - master_ink) < master_ink * 0.05
+               and strip_ink > 0 and all(images[name].size == size for name, size in wide_sizes.items()))
+    print(f"   宽标题不被裁切: {'✅' if wide_ok else '❌'}")
+    
+    return sizes_ok and render_once and wide_ok
+
+def test_text_layout():
+    """测试文字自动排版"""
+    print("🧪 测试文字自动排版...")
+    
+    from utils.text_layout import TextLayoutEngine, fit_text, get_glyph_metrics, load_font
+    
+    metrics = get_glyph_metrics()
+    engine = TextLayoutEngine(metrics)
+    long_title = "超长标题" * 30
+    placed = {p.key: p for p in engine.layout({"title": long_title, "subtitle": "短"}, {"title": {"size": 60}}, (800, 800))}
+    
+    title = placed["title"]
+    font = load_font(title.block.size, metrics.font_path)
+    box_width, box_height = title.box[2], title.box[3]
+    fits = (title.block.height <= box_height
+            and all(font.getlength(line) <= box_width for line in title.block.lines))
+    shrunk = len(title.block.lines) > 1 and title.block.size < 60
+    print(f"   长标题换行缩小: {'✅' if fits and shrunk else '❌'} 字号 {title.block.size}，{len(title.block.lines)} 行")
+    
+    kept = placed["subtitle"].block.size == 24
+    words = fit_text(["hello wonderful world"], 120, 200, 24, metrics=metrics).lines
+    words_ok = len(words) > 1 and " ".join(words).split() == ["hello", "wonderful", "world"]
+    print(f"   短文字保持字号、英文不拆词: {'✅' if kept and words_ok else '❌'} {words}")
+    
+    # 标题区内检测到的文字区域优先于整个标题区
+    analysis = {"width": 400, "height": 400, "text_regions": [{"x": 100, "y": 20, "width": 200, "height": 60}],
+                "layout_zones": {"header": {"x": 0, "y": 0, "width": 400, "height": 100}}}
+    box = engine.boxes((800, 800), analysis)["title"]
+    region_ok = 200 <= box[0] and box[0] + box[2] <= 600 and 40 <= box[1]
+    print(f"   使用检测到的文字区域: {'✅' if region_ok else '❌'} {box}")
+    
+    return fits and shrunk and kept and words_ok and region_ok
+
+def test_preview_render():
+    """测试主图实时预览与防抖"""
+    print("🧪 测试主图实时预览...")
+    
+    from utils.preview_render import PreviewRenderer, RenderDebouncer
+    
+    renderer = PreviewRenderer(max_side=200)
+    template = Image.new('RGB', (1000, 800), color='white')
+    texts = {"title": "测试标题", "subtitle": "副标题"}
+    preview = renderer.render("template-a", template, texts, {"title": {"size": 50}})
+    size_ok = preview.size == (200, 160)
+    # 同一模板只缩小一次
+    cached_ok = renderer.prepare("template-a", template)[0] is renderer.prepare("template-a", template)[0]
+    changed = np.asarray(preview).min() < 255
+    print(f"   预览尺寸与缓存: {'✅' if size_ok and cached_ok and changed else '❌'} {preview.size}")
+    
+    debouncer = RenderDebouncer(delay=1.0)
+    steps = [
+        debouncer.observe("a", now=0.0),   # 新参数，开始计时
+        debouncer.observe("b", now=0.5),   # 参数仍在变化
+        debouncer.observe("b", now=1.0),   # 未满1秒
+        debouncer.observe("b", now=1.6),   # 稳定1秒，提交
+        debouncer.observe("b", now=3.0),   # 同一参数不重复提交
+    ]
+    debounce_ok = steps == [False, False, False, True, False] and not debouncer.waiting
+    print(f"   参数稳定后提交一次: {'✅' if debounce_ok else '❌'} {steps}")
+    
+    return size_ok and cached_ok and changed and debounce_ok
+
+def test_incremental_render():
+    """测试增量渲染"""
+    print("🧪 测试增量渲染...")
+    
+    from utils.incremental_render import RenderSession
+    
+    rng = np.random.RandomState(1)
+    template = Image.fromarray(rng.randint(0, 256, (600, 600, 3), dtype=np.uint8))
+    processor = ImageProcessor()
+    style = {"title": {"size": 40}, "subtitle": {"size": 24}}
+    session = RenderSession(template)
+    
+    steps = [
+        {"title": "测试标题", "subtitle": "副标题", "selling_points": ["卖点一", "卖点二", "卖点三"]},
+        {"title": "测试标题", "subtitle": "新的副标题", "selling_points": ["卖点一", "卖点二", "卖点三"]},
+        {"title": "测试标题", "subtitle": "新的副标题", "selling_points": ["卖点一", "改过的卖点", "卖点三"]},
+        {"title": "测试标题", "selling_points": ["卖点一", "改过的卖点", "卖点三"]},
+    ]
+    changed = []
+    all_equal = True
+    for texts in steps:
+        stats = session.update(texts, style)
+        changed.append((stats["changed"], len(stats["dirty_rects"]), stats["pixels"]))
+        expected = processor.render_text_on_template(template, texts, style)
+        all_equal = all_equal and np.array_equal(np.asarray(session.image), np.asarray(expected))
+    print(f"   与整张渲染逐像素一致: {'✅' if all_equal else '❌'}")
+    
+    # 只改一个卖点时只有那一行是脏的
+    only_changed = ([c[0] for c in changed[1:]] == [["subtitle"], ["selling_points"], ["subtitle"]]
+                    and changed[2][1] == 1 and changed[2][2] < 600 * 600 * 0.02)
+    unchanged = session.update(steps[-1], style)["pixels"] == 0
+    print(f"   只重画变化的区域: {'✅' if only_changed and unchanged else '❌'} {changed[1:]}")
+    
+    return all_equal and only_changed and unchanged
+
+def test_image_ingest():
+    """测试上传图片的安全解码"""
+    print("🧪 测试上传图片解码...")
+    
+    import io
+    from utils.image_ingest import IngestError, ingest_image
+    
+    def encode(image, format, **params):
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, **params)
+        return buffer.getvalue()
+    
+    photo = encode(Image.new('RGB', (3000, 2000), color=(200, 50, 50)), "JPEG")
+    image, report = ingest_image(photo, max_side=500)
+    draft_ok = (report["draft"] and image.size == (500, 333) and image.mode == "RGB"
+                and report["decoded_size"][0] < 3000 and report["peak_bytes"] < 3000 * 2000 * 4)
+    print(f"   JPEG草稿解码: {'✅' if draft_ok else '❌'} {report['decoded_size']} → {image.size}")
+    
+    # 手机照片：文件中横放，EXIF方向为6（需要顺时针旋转90度）
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    rotated, _ = ingest_image(encode(Image.new('RGB', (400, 200)), "JPEG", exif=exif), max_side=1000)
+    transparent, _ = ingest_image(encode(Image.new('RGBA', (50, 50), (0, 0, 0, 0)), "PNG"))
+    modes_ok = rotated.size == (200, 400) and transparent.mode == "RGB" and transparent.getpixel((0, 0)) == (255, 255, 255)
+    print(f"   方向摆正与透明背景: {'✅' if modes_ok else '❌'}")
+    
+    rejected = []
+    for kwargs in ({"max_pixels": 1000}, {"max_bytes": 100}):
+        try:
+            ingest_image(photo, **kwargs)
+        except IngestError:
+            rejected.append(True)
+    try:
+        ingest_image(b"not an image")
+    except IngestError:
+        rejected.append(True)
+    budget_ok = rejected == [True, True, True]
+    print(f"   超出预算或无法识别时拒绝: {'✅' if budget_ok else '❌'}")
+    
+    return draft_ok and modes_ok and budget_ok
+
+def test_reference_style():
+    """测试参考成品样式提取"""
+    print("🧪 测试参考样式提取...")
+    
+    import time
+    import numpy as np
+    from PIL import ImageDraw, ImageFont
+    from utils.reference_style import extract_reference_style
+    
+    def reference(background):
+        if background == "gradient":
+            pixels = np.linspace(230, 120, 800)[:, None, None] * np.ones((800, 800, 3))
+            pixels[..., 2] = 200
+            image = Image.fromarray(pixels.astype(np.uint8))
+        else:
+            image = Image.new('RGB', (800, 800), color=(250, 250, 250))
+        draw = ImageDraw.Draw(image)
+        bold = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 72)
+        regular = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 32)
+        draw.text((400, 130), "SUMMER SALE", font=bold, fill="#e0301e", anchor="mt")
+        draw.text((400, 400), "limited time offer today", font=regular, fill="#333333", anchor="mt")
+        return image
+    
+    def close(color, expected, tolerance=24):
+        return all(abs(int(color[i:i + 2], 16) - int(expected[i:i + 2], 16)) <= tolerance for i in (1, 3, 5))
+    
+    try:
+        ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 10)
+    except OSError:
+        print("   未找到测试字体，跳过")
+        return True
+    
+    image = reference("gradient")
+    start = time.perf_counter()
+    style = extract_reference_style(image, budget=5.0)
+    elapsed = time.perf_counter() - start
+    title, subtitle = style["title_style"], style["subtitle_style"]
+    text_ok = (style["complete"] and close(title["color"], "#e0301e") and title["weight"] == "bold"
+               and title["position"] == "top_center" and close(subtitle["color"], "#333333")
+               and subtitle["weight"] == "normal" and subtitle["size"] < title["size"])
+    print(f"   文字样式: {'✅' if text_ok else '❌'} 标题 {title['color']} {title['weight']}，"
+          f"副标题 {subtitle['color']} {subtitle['weight']}，{elapsed * 1000:.0f}ms")
+    
+    noise = Image.fromarray(np.random.default_rng(0).integers(0, 256, (400, 400, 3), dtype=np.uint8))
+    backgrounds = [extract_reference_style(img)["background_style"] for img in (image, reference("solid"), noise)]
+    background_ok = backgrounds == ["gradient", "solid", "image"]
+    print(f"   背景类型: {'✅' if background_ok else '❌'} {backgrounds}")
+    
+    start = time.perf_counter()
+    cached = extract_reference_style(image)
+    cache_ok = cached == style and time.perf_counter() - start < elapsed
+    timeout = extract_reference_style(Image.new('RGB', (300, 300), color=(1, 2, 3)), budget=0)
+    budget_ok = timeout["complete"] is False and "title_style" in timeout
+    
+    # 文字行检测超出预算：返回不完整的结果且不缓存
+    from utils import reference_style
+    original_text_lines = reference_style._text_lines
+    calls = []
+    
+    def slow_text_lines(pixels):
+        calls.append(1)
+        time.sleep(0.05)
+        return original_text_lines(pixels)
+    
+    reference_style._text_lines = slow_text_lines
+    try:
+        slow_image = reference("solid").rotate(90)
+        slow = [extract_reference_style(slow_image, budget=0.02) for _ in range(2)]
+    finally:
+        reference_style._text_lines = original_text_lines
+    budget_ok = budget_ok and all(result["complete"] is False for result in slow) and len(calls) == 2
+    print(f"   缓存与时间预算: {'✅' if cache_ok and budget_ok else '❌'}")
+    
+    return text_ok and background_ok and cache_ok and budget_ok
+
+def test_layout_zones():
+    """测试显著度布局区域检测"""
+    print("🧪 测试布局区域检测...")
+    
+    from PIL import ImageDraw
+    from utils.layout_zones import SaliencyMap, detect_layout_zones
+    from utils.text_layout import TextLayoutEngine
+    
+    rng = np.random.default_rng(0)
+    saliency = SaliencyMap(rng.random((60, 80)).astype(np.float32))
+    x0, y0 = rng.integers(0, 40, 50), rng.integers(0, 30, 50)
+    x1, y1 = x0 + rng.integers(1, 40, 50), y0 + rng.integers(1, 30, 50)
+    expected = [saliency.saliency[b:d, a:c].mean() for a, b, c, d in zip(x0, y0, x1, y1)]
+    integral_ok = np.allclose(saliency.box_means(x0, y0, x1, y1), expected, atol=1e-5)
+    print(f"   积分图求均值: {'✅' if integral_ok else '❌'}")
+    
+    plain = detect_layout_zones(np.full((800, 600, 3), 255, np.uint8))
+    thirds = {name: (zone["x"], zone["y"], zone["width"], zone["height"]) for name, zone in plain.items()}
+    plain_ok = thirds == {"header": (0, 0, 600, 200), "main": (0, 200, 600, 400), "footer": (0, 600, 600, 200)}
+    print(f"   纯色模板: {'✅' if plain_ok else '❌'} {thirds}")
+    
+    # 上半部分放商品，标题区应避开商品
+    template = Image.new('RGB', (800, 800), color=(245, 245, 245))
+    ImageDraw.Draw(template).rectangle([100, 0, 700, 320], fill=(30, 120, 200))
+    analysis = ImageProcessor().analyze_template(template)
+    zones = analysis["layout_zones"]
+    header = zones["header"]
+    avoid_ok = (header["y"] >= 320 and zones["main"]["y"] >= header["y"] + header["height"]
+                and zones["footer"]["y"] >= zones["main"]["y"] + zones["main"]["height"])
+    print(f"   避开商品: {'✅' if avoid_ok else '❌'} 标题区 y={header['y']}")
+    
+    box = TextLayoutEngine().boxes(template.size, analysis)["title"]
+    render_ok = box[1] >= header["y"] and box[1] + box[3] <= header["y"] + header["height"]
+    print(f"   排版使用检测出的区域: {'✅' if render_ok else '❌'} {box}")
+    
+    return integral_ok and plain_ok and avoid_ok and render_ok
+
+def test_perceptual_hash():
+    """测试感知哈希索引与近似重复复用"""
+    print("🧪 测试感知哈希...")
+    
+    import io
+    import shutil
+    import tempfile
+    from PIL import ImageDraw
+    from batch import find_duplicate_outputs
+    from utils.perceptual_hash import MultiIndexHash, dhash, hamming, hamming_many, phash
+    
+    def template(seed, size=(800, 800)):
+        rng = np.random.default_rng(seed)
+        image = Image.new('RGB', (800, 800), color=tuple(int(c) for c in rng.integers(150, 255, 3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            x, y = rng.integers(0, 700, 2)
+            draw.rectangle([x, y, x + rng.integers(50, 300), y + rng.integers(50, 300)],
+                           fill=tuple(int(c) for c in rng.integers(0, 255, 3)))
+        return image.resize(size)
+    
+    def recompress(image, size):
+        buffer = io.BytesIO()
+        image.resize(size).save(buffer, format="JPEG", quality=60)
+        return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+    
+    original = template(0)
+    resized = recompress(original, (600, 600))
+    others = [template(seed) for seed in range(1, 8)]
+    hash_ok = (hamming(phash(original), phash(resized)) <= 2 and hamming(dhash(original), dhash(resized)) <= 4
+               and min(hamming(phash(original), phash(other)) for other in others) > 10)
+    print(f"   重新压缩、缩放后哈希接近: {'✅' if hash_ok else '❌'}")
+    
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 63, 5000, dtype=np.int64).astype(np.uint64)
+    index = MultiIndexHash(6)
+    for position, value in enumerate(hashes):
+        index.add(int(value), position)
+    query = int(hashes[42]) ^ 0b1011
+    found = [value for _, _, value in index.search(query)]
+    expected = list(np.flatnonzero(hamming_many(query, hashes) <= 6))
+    index_ok = found == expected == [42]
+    print(f"   多索引哈希与线性扫描一致: {'✅' if index_ok else '❌'}")
+    
+    processor = ImageProcessor()
+    first = processor.analyze_template(original)
+    reused = processor.analyze_template(resized)
+    different = processor.analyze_template(others[0])
+    reuse_ok = (reused.get("near_duplicate") is not None and "near_duplicate" not in different
+                and reused["width"] == 600
+                and reused["layout_zones"]["footer"]["y"] == round(first["layout_zones"]["footer"]["y"] * 0.75))
+    print(f"   近似重复模板复用分析: {'✅' if reuse_ok else '❌'}")
+    
+    workdir = tempfile.mkdtemp()
+    try:
+        items = []
+        for name, image in (("a", original), ("b", others[1]), ("c", recompress(original, (800, 800)))):
+            os.makedirs(os.path.join(workdir, name))
+            image.save(os.path.join(workdir, name, "main_image.png"))
+            items.append({"id": name})
+        groups = find_duplicate_outputs(items, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    dedupe_ok = groups == [{"keep": "a", "duplicates": ["c"]}]
+    print(f"   批量输出去重: {'✅' if dedupe_ok else '❌'} {groups}")
+    
+    return hash_ok and index_ok and reuse_ok and dedupe_ok
+
+def test_result_types():
+    """测试紧凑结果类型"""
+    print("🧪 测试紧凑结果类型...")
+    
+    from PIL import ImageDraw
+    from utils.analysis_cache import shared_analysis_cache
+    from utils.result_types import ComplianceResult, DetailPageLayout, TemplateAnalysis
+    
+    template = Image.new('RGB', (600, 400), color=(235, 235, 235))
+    draw = ImageDraw.Draw(template)
+    for i in range(4):
+        draw.rectangle([40 + i * 130, 60 + i * 70, 160 + i * 130, 100 + i * 70], fill=(200, 40 * i, 40))
+    processor = ImageProcessor()
+    samples = [
+        (TemplateAnalysis, ImageProcessor.analyze_template.uncached(processor, template, template)),
+        (TemplateAnalysis, processor.analyze_layout_array(np.asarray(template))),
+        (ComplianceResult, TextProcessor.check_forbidden_words.uncached(TextProcessor(), "最好的产品，第一选择")),
+        (DetailPageLayout, AIGenerator.generate_detail_page_layout.uncached(AIGenerator(), "网络创业是新的机遇")),
+    ]
+    roundtrip_ok = all(isinstance(result_type.pack(sample), result_type) and result_type.pack(sample).to_dict() == sample
+                       for result_type, sample in samples)
+    print(f"   与字典无损互转: {'✅' if roundtrip_ok else '❌'}")
+    
+    # 结构不符（多出的字段、numpy 数值）时按原样保存
+    odd_region = dict(samples[0][1], text_regions=[{"x": 1, "y": 2, "width": 3, "height": 4, "area": 12,
+                                                     "aspect_ratio": 0.75, "label": "logo"}])
+    odd_value = dict(samples[2][1], forbidden_words=[np.str_("最好")])
+    fallback_ok = TemplateAnalysis.pack(odd_region) is odd_region and ComplianceResult.pack(odd_value) is odd_value
+    print(f"   结构不符时保留原字典: {'✅' if fallback_ok else '❌'}")
+    
+    shared_analysis_cache.clear()
+    first = processor.analyze_template(template)
+    first["layout_zones"]["header"]["y"] = -1
+    second = processor.analyze_template(template)
+    cached = list(shared_analysis_cache._entries.values())
+    cache_ok = (second["layout_zones"]["header"]["y"] >= 0 and shared_analysis_cache.get_stats()["hits"] == 1
+                and any(isinstance(value, TemplateAnalysis) for value in cached))
+    print(f"   缓存保存紧凑形式、命中返回新字典: {'✅' if cache_ok else '❌'}")
+    
+    return roundtrip_ok and fallback_ok and cache_ok
+
+def test_pipeline():
+    """测试生成流水线"""
+    print("🧪 测试生成流水线...")
+    
+    import tempfile
+    import time
+    from utils.analysis_cache import AnalysisCache
+    from utils.generation_pipeline import build_generation_pipeline
+    from utils.pipeline import Pipeline, PipelineError, release_output
+    
+    calls = []
+    
+    def stage(name, seconds=0.0):
+        def run(*args):
+            calls.append(name)
+            time.sleep(seconds)
+            return (name,) + args
+        return run
+    
+    pipeline = Pipeline("test", cache=AnalysisCache(32))
+    pipeline.add("a", stage("a", 0.2), ["x"])
+    pipeline.add("b", stage("b", 0.2), ["y"])
+    pipeline.add("c", stage("c"), ["a", "b"])
+    pipeline.add("d", stage("d"), ["c"])
+    
+    start = time.perf_counter()
+    run = pipeline.run({"x": 1, "y": 2})
+    parallel_ok = pipeline.plan() == [["a", "b"], ["c"], ["d"]] and time.perf_counter() - start < 0.35
+    print(f"   同一层阶段并行执行: {'✅' if parallel_ok else '❌'}")
+    
+    calls.clear()
+    run = pipeline.run({"x": 1, "y": 3})
+    downstream_ok = calls == ["b", "c", "d"] and run.cached == ["a"] and pipeline.downstream("y") == ["b", "c", "d"]
+    calls.clear()
+    run = pipeline.run({"x": 1, "y": 3}, ["d"])
+    # 目标阶段命中缓存时上游阶段不执行
+    skip_ok = calls == [] and list(run.timings) == ["d"]
+    print(f"   只重新执行变化输入的下游阶段: {'✅' if downstream_ok and skip_ok else '❌'}")
+    
+    errors = 0
+    try:
+        pipeline.run({"x": 1}, ["c"])
+    except PipelineError:
+        errors += 1
+    pipeline.add("e", stage("e"), ["f"]).add("f", stage("f"), ["e"])
+    try:
+        pipeline.plan()
+    except PipelineError:
+        errors += 1
+    print(f"   缺少输入、循环依赖报错: {'✅' if errors == 2 else '❌'}")
+    
+    # 输出为文件的阶段：命中时检查文件还在，被挤出缓存时删除文件
+    output_dir = tempfile.mkdtemp()
+    
+    def write_file(x):
+        path = os.path.join(output_dir, f"{x}.txt")
+        with open(path, "w") as f:
+            f.write(str(x))
+        return path
+    
+    files = Pipeline("files", cache=AnalysisCache(1, on_evict=release_output))
+    files.add("file", write_file, ["x"], is_valid=os.path.exists, release=os.remove)
+    first_path = files.run({"x": 1})["file"]
+    os.remove(first_path)
+    recreated = files.run({"x": 1}).executed == ["file"] and os.path.exists(first_path)
+    files.run({"x": 2})
+    released = not os.path.exists(first_path) and os.listdir(output_dir) == ["2.txt"]
+    print(f"   文件输出失效重算、淘汰时删除: {'✅' if recreated and released else '❌'}")
+    
+    generation = build_generation_pipeline(TextProcessor(), ImageProcessor(), AIGenerator())
+    inputs = {"article_title": "网络创业指南", "article_content": "网络创业是新的机遇，零基础也能快速上手。"}
+    targets = ["compliance", "keywords", "selling_points", "title_variants"]
+    first = generation.run(inputs, targets)
+    second = generation.run(inputs, targets)
+    changed = generation.run(dict(inputs, article_title="网络创业入门"), targets)
+    generation_ok = (second.executed == [] and sorted(changed.executed) == ["compliance", "title_variants"]
+                     and second["keywords"] == first["keywords"] and all(t in first.timings for t in targets))
+    print(f"   文章分析阶段按输入缓存: {'✅' if generation_ok else '❌'}")
+    
+    return (parallel_ok and downstream_ok and skip_ok and errors == 2 and recreated and released
+            and generation_ok)
+
+def test_instrumentation():
+    """测试性能统计"""
+    print("🧪 测试性能统计...")
+    
+    import json
+    import tempfile
+    import requests
+    from api_server import APIServer
+    from utils.instrumentation import Instrumentation, instrumentation
+    
+    stats = Instrumentation()
+    with stats.span("off"):
+        pass
+    stats.incr("off")
+    off_ok = stats.snapshot()["spans"] == {} and stats.snapshot()["counters"] == []
+    print(f"   关闭时不记录: {'✅' if off_ok else '❌'}")
+    
+    log_path = os.path.join(tempfile.mkdtemp(), "metrics.jsonl")
+    stats.enable(log_path)
+    stats.register_collector("cache", lambda: {"hits": 3, "hit_rate": 0.75, "name": "x"}, {"cache": "demo"})
+    for _ in range(3):
+        with stats.span("text.jieba"):
+            pass
+    stats.incr("ai_requests", labels={"kind": "image"})
+    with stats.capture() as captured:
+        stats.observe("image.kmeans", 0.2)
+    snapshot = stats.snapshot()
+    text = stats.to_prometheus()
+    record_ok = (
+        snapshot["spans"]["text.jieba"]["count"] == 3
+        and captured == [("image.kmeans", 0.2, False)]
+        and 'duanju_span_seconds_count{span="text.jieba"} 3' in text
+        and 'duanju_span_seconds_bucket{span="image.kmeans",le="0.25"} 1' in text
+        and 'duanju_ai_requests_total{kind="image"} 1' in text
+        and 'duanju_cache_hit_rate{cache="demo"} 0.75' in text
+    )
+    print(f"   耗时、计数与Prometheus导出: {'✅' if record_ok else '❌'}")
+    
+    stats.flush()
+    with open(log_path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    log_ok = len(lines) == 5 and lines[0]["span"] == "text.jieba" and lines[-1]["type"] == "snapshot"
+    print(f"   JSON日志: {'✅' if log_ok else '❌'}")
+    
+    instrumentation.enable()
+    try:
+        TextProcessor().extract_keywords("性能统计测试文本，记录分词耗时。", 3)
+        with APIServer(port=0, max_workers=2, queue_size=2, warm_up=False) as server:
+            requests.post(server.url + "/api/compliance", json={"text": "测试"}, timeout=30)
+            response = requests.get(server.url + "/metrics", timeout=30)
+    except Exception as e:
+        print(f"   /metrics 接口: ❌ - {e}")
+        return False
+    finally:
+        instrumentation.disable()
+    endpoint_ok = (
+        response.status_code == 200
+        and response.headers["Content-Type"].startswith("text/plain")
+        and 'duanju_span_seconds_count{span="text.jieba"}' in response.text
+        and 'duanju_api_requests{route="/api/compliance"} 1' in response.text
+        and 'duanju_cache_hit_rate{cache="analysis"}' in response.text
+    )
+    print(f"   /metrics 接口: {'✅' if endpoint_ok else '❌'}")
+    
+    return off_ok and record_ok and log_ok and endpoint_ok
+
 def test_integration():
     """集成测试"""
     print("🧪 运行集成测试...")
@@ -146,6 +1326,31 @@ def main():
         ("文本处理器", test_text_processor),
         ("图片处理器", test_image_processor), 
         ("AI生成器", test_ai_generator),
+        ("请求合并", test_request_coalescing),
+        ("对冲生图后端", test_hedged_image_backend),
+        ("模拟OpenAI服务", test_fake_openai_server),
+        ("流式文本优化", test_streaming_text_optimization),
+        ("分析缓存", test_analysis_cache),
+        ("后台任务队列", test_job_queue),
+        ("批量生成", test_batch_pipeline),
+        ("HTTP API服务", test_api_server),
+        ("详情页导出", test_detail_page_exporter),
+        ("图片编解码缓存", test_image_cache),
+        ("会话图片仓库", test_asset_store),
+        ("进程池计算", test_process_offload),
+        ("共享内存传输", test_shm_transport),
+        ("详情页长图", test_detail_page_rasterizer),
+        ("多尺寸导出", test_multi_size_export),
+        ("文字自动排版", test_text_layout),
+        ("主图实时预览", test_preview_render),
+        ("增量渲染", test_incremental_render),
+        ("上传图片解码", test_image_ingest),
+        ("参考样式提取", test_reference_style),
+        ("布局区域检测", test_layout_zones),
+        ("感知哈希", test_perceptual_hash),
+        ("紧凑结果类型", test_result_types),
+        ("生成流水线", test_pipeline),
+        ("性能统计", test_instrumentation),
         ("集成测试", test_integration)
     ]
     
@@ -1,11 +1,103 @@
 import openai
-import requests
 import json
 import base64
+import hashlib
 from typing import Dict, List, Optional
 from PIL import Image
-import io
 from config import AI_MODELS
+from utils.analysis_cache import memoize_analysis
+from utils.instrumentation import instrumentation, timed
+from utils.result_types import DetailPageLayout
+from utils.single_flight import SingleFlight
+from utils.image_backends import (
+    ImageBackend, HedgedImageBackend, create_image_backend, list_image_backends
+)
+
+class TextOptimizationStream:
+    """
+    流式文本优化结果
+    
+    迭代时逐段返回模型生成的文本；每段都会进行违禁词增量检测，
+    发现违禁词且 stop_on_forbidden 为真时立即关闭连接，不再为后续内容付费。
+    此时每段先检测再返回，并保留末尾可能是违禁词开头的几个字符，
+    违禁词的任何部分都不会返回给调用方，也不会出现在 text 中。
+    迭代结束后可读取 text、forbidden_words、aborted 和 error。
+    """
+    
+    def __init__(self, open_stream, scanner, stop_on_forbidden: bool = True):
+        self._open_stream = open_stream
+        self._scanner = scanner
+        self.stop_on_forbidden = stop_on_forbidden
+        self.text = ""
+        self.forbidden_words: List[str] = []
+        self.aborted = False
+        self.finished = False
+        self.error = None
+    
+    def __iter__(self):
+        stream = None
+        # 已检测但暂不返回的文本：下一段可能与它拼成违禁词
+        pending = ""
+        holdback = self._scanner.overlap if self.stop_on_forbidden else 0
+        try:
+            stream = self._open_stream()
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                
+                found = self._scanner.feed(delta)
+                pending += delta
+                if found:
+                    self.forbidden_words.extend(found)
+                    if self.stop_on_forbidden:
+                        self.aborted = True
+                        # 违禁词之前的文本仍然返回
+                        window = pending.lower()
+                        start = min((index for index in (window.find(word.lower()) for word in found) if index >= 0),
+                                    default=0)
+                        if start > 0:
+                            self.text += pending[:start]
+                            yield pending[:start]
+                        break
+                
+                ready = len(pending) - holdback
+                if ready > 0:
+                    text, pending = pending[:ready], pending[ready:]
+                    self.text += text
+                    yield text
+            else:
+                if pending:
+                    self.text += pending
+                    yield pending
+        except Exception as e:
+            self.error = e
+            print(f"GPT流式优化失败: {str(e)}")
+        finally:
+            if stream is not None:
+                self._close(stream)
+            self.finished = True
+    
+    @staticmethod
+    def _close(stream):
+        """关闭底层HTTP连接，提前终止时服务端停止生成"""
+        try:
+            close = getattr(stream, "close", None)
+            if close is None:
+                close = stream.response.close
+            close()
+        except Exception:
+            pass
+    
+    @property
+    def is_compliant(self) -> bool:
+        return not self.forbidden_words
+
+
+# 进程级共享的请求合并器，多个会话/批处理线程的相同请求只发送一次
+_shared_flight = SingleFlight()
 
 class AIGenerator:
     """AI生成器类，负责调用各种AI API生成图片和优化文本"""
@@ -13,11 +105,30 @@ class AIGenerator:
     def __init__(self):
         self.openai_client = None
         self.supported_models = AI_MODELS
+        self._flight = _shared_flight
+        self._key_fingerprint = None
+        self.image_model = "dall-e-3"
+        self.hedge_model = None
+        self._image_backend = None
     
-    def set_openai_key(self, api_key: str):
-        """设置OpenAI API密钥"""
+    def set_openai_key(self, api_key: str, **client_options):
+        """
+        设置OpenAI API密钥
+        
+        Args:
+            api_key: API密钥
+            client_options: 传给 openai.OpenAI 的其他参数，如 base_url、max_retries、timeout
+        """
         openai.api_key = api_key
-        self.openai_client = openai.OpenAI(api_key=api_key)
+        self.openai_client = openai.OpenAI(api_key=api_key, **client_options)
+        # 合并请求时按密钥和服务地址区分，不同账户之间不共享结果
+        identity = f"{api_key}@{client_options.get('base_url', '')}"
+        self._key_fingerprint = hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+        self._image_backend = None
+    
+    def get_coalescing_stats(self) -> Dict[str, int]:
+        """获取请求合并统计（进程级），coalesced 即节省的API调用次数"""
+        return self._flight.get_stats()
     
     def generate_image_prompt(self, article_title: str, content: str, style_preferences: Dict) -> str:
         """
@@ -76,6 +187,60 @@ class AIGenerator:
         
         return full_prompt
     
+    def set_image_backend(self, model: str, hedge_model: Optional[str] = None):
+        """
+        选择生图后端
+        
+        Args:
+            model: 主后端名称，见 utils.image_backends.list_image_backends()
+            hedge_model: 备用后端名称，设置后启用对冲请求
+        """
+        if model not in list_image_backends():
+            raise ValueError(f"未注册的生图后端: {model}")
+        if hedge_model is not None and hedge_model not in list_image_backends():
+            raise ValueError(f"未注册的生图后端: {hedge_model}")
+        self.image_model = model
+        self.hedge_model = hedge_model
+        self._image_backend = None
+    
+    def get_image_backend(self) -> ImageBackend:
+        """获取当前的生图后端（启用对冲时为组合后端）"""
+        if self._image_backend is None:
+            backend = create_image_backend(self.image_model, self.openai_client)
+            if self.hedge_model and self.hedge_model != self.image_model:
+                backend = HedgedImageBackend(
+                    backend, create_image_backend(self.hedge_model, self.openai_client)
+                )
+            self._image_backend = backend
+        return self._image_backend
+    
+    def generate_image(self, prompt: str, size: str = "1024x1024", quality: str = "standard") -> Optional[Image.Image]:
+        """
+        使用当前选择的后端生成图片
+        
+        Args:
+            prompt: 提示词
+            size: 图片尺寸
+            quality: 图片质量
+            
+        Returns:
+            生成的图片或None
+        """
+        backend = self.get_image_backend()
+        
+        key = ("image", self._key_fingerprint, backend.name, prompt, size, quality)
+        def request():
+            instrumentation.incr("ai_requests", labels={"kind": "image", "backend": backend.name})
+            with instrumentation.span("ai.image"):
+                return backend.generate(prompt, size, quality)
+        
+        image, shared = self._flight.do(key, request)
+        
+        # 共享结果时返回副本，避免多个调用方修改同一张图片
+        if shared and image is not None:
+            image = image.copy()
+        return image
+    
     def generate_image_with_dalle(self, prompt: str, size: str = "1024x1024", quality: str = "standard") -> Optional[Image.Image]:
         """
         使用DALL-E生成图片
@@ -91,29 +256,7 @@ class AIGenerator:
         if not self.openai_client:
             raise ValueError("请先设置OpenAI API密钥")
         
-        try:
-            response = self.openai_client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size=size,
-                quality=quality,
-                n=1
-            )
-            
-            # 获取图片URL
-            image_url = response.data[0].url
-            
-            # 下载图片
-            img_response = requests.get(image_url)
-            img_response.raise_for_status()
-            
-            # 转换为PIL Image
-            image = Image.open(io.BytesIO(img_response.content))
-            return image
-            
-        except Exception as e:
-            print(f"DALL-E生成图片失败: {str(e)}")
-            return None
+        return self.generate_image(prompt, size, quality)
     
     def optimize_text_with_gpt(self, text: str, optimization_type: str = "title") -> str:
         """
@@ -129,21 +272,70 @@ class AIGenerator:
         if not self.openai_client:
             raise ValueError("请先设置OpenAI API密钥")
         
+        system_prompt = self._get_optimization_prompt(optimization_type)
+        
+        key = ("chat", self._key_fingerprint, "gpt-3.5-turbo", system_prompt, text)
+        result, _ = self._flight.do(
+            key, lambda: self._request_gpt_completion(system_prompt, text)
+        )
+        return result
+    
+    def optimize_text_with_gpt_stream(self, text: str, optimization_type: str = "title",
+                                      stop_on_forbidden: bool = True) -> "TextOptimizationStream":
+        """
+        使用GPT流式优化文本，边生成边返回，并增量检测违禁词
+        
+        Args:
+            text: 原始文本
+            optimization_type: 优化类型 (title, description, selling_point)
+            stop_on_forbidden: 检测到违禁词时是否立即终止生成
+            
+        Returns:
+            可迭代的流式结果，迭代得到增量文本
+        """
+        if not self.openai_client:
+            raise ValueError("请先设置OpenAI API密钥")
+        
+        from utils.text_processor import TextProcessor
+        scanner = TextProcessor().create_forbidden_scanner()
+        
+        system_prompt = self._get_optimization_prompt(optimization_type)
+        return TextOptimizationStream(
+            lambda: self.openai_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self._build_optimization_messages(system_prompt, text),
+                max_tokens=200,
+                temperature=0.7,
+                stream=True
+            ),
+            scanner,
+            stop_on_forbidden
+        )
+    
+    def _get_optimization_prompt(self, optimization_type: str) -> str:
+        """获取文本优化类型对应的提示语"""
         prompts = {
             "title": "将以下标题优化为更吸引人的电商产品标题，要求简洁有力，突出卖点，避免违禁词：",
             "description": "将以下描述优化为更具吸引力的产品描述，要求突出优势，避免夸大宣传：",
             "selling_point": "将以下内容提炼为3-5个核心卖点，每个卖点不超过15字："
         }
         
-        system_prompt = prompts.get(optimization_type, prompts["title"])
-        
+        return prompts.get(optimization_type, prompts["title"])
+    
+    def _build_optimization_messages(self, system_prompt: str, text: str) -> List[Dict]:
+        """构建文本优化的对话消息"""
+        return [
+            {"role": "system", "content": "你是一个专业的电商文案优化专家，擅长创建吸引人且合规的商品文案。"},
+            {"role": "user", "content": f"{system_prompt}\n\n{text}"}
+        ]
+    
+    @timed("ai.gpt")
+    def _request_gpt_completion(self, system_prompt: str, text: str) -> str:
+        """实际调用GPT接口"""
         try:
             response = self.openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的电商文案优化专家，擅长创建吸引人且合规的商品文案。"},
-                    {"role": "user", "content": f"{system_prompt}\n\n{text}"}
-                ],
+                messages=self._build_optimization_messages(system_prompt, text),
                 max_tokens=200,
                 temperature=0.7
             )
@@ -154,6 +346,7 @@ class AIGenerator:
             print(f"GPT文本优化失败: {str(e)}")
             return text  # 失败时返回原文本
     
+    @memoize_analysis(result_type=DetailPageLayout)
     def generate_detail_page_layout(self, article_content: str) -> Dict:
         """
         生成详情页布局建议
@@ -266,7 +459,7 @@ class AIGenerator:
             prompt = section_prompts.get(section_type, base_prompt)
             
             # 生成图片
-            image = self.generate_image_with_dalle(prompt, size="1024x1024")
+            image = self.generate_image(prompt, size="1024x1024")
             if image:
                 images[section_type] = image
         
@@ -0,0 +1,162 @@
+import copy
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import ANALYSIS_CACHE_SIZE
+from utils.instrumentation import instrumentation
+from utils.single_flight import SingleFlight
+
+
+def _update_digest(digest, value: Any):
+    """把输入值按类型写入摘要，图片和数组按像素内容计算"""
+    if isinstance(value, Image.Image):
+        digest.update(f"<image {value.mode} {value.size}>".encode("utf-8"))
+        digest.update(value.tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"<array {value.dtype} {value.shape}>".encode("utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for key in sorted(value, key=repr):
+            _update_digest(digest, key)
+            _update_digest(digest, value[key])
+        digest.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"[")
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b"]")
+    else:
+        digest.update(repr(value).encode("utf-8"))
+        digest.update(b"\x00")
+
+
+def hash_inputs(*args, **kwargs) -> str:
+    """计算输入参数的内容哈希"""
+    digest = hashlib.sha1()
+    _update_digest(digest, args)
+    _update_digest(digest, kwargs)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """进程级LRU缓存，按输入内容哈希保存分析结果，供所有会话共享"""
+
+    def __init__(self, max_entries: int = 256, on_evict: Callable[[Tuple, Any], None] = None):
+        """
+        Args:
+            max_entries: 最大条目数
+            on_evict: 条目被挤出或清空时的回调 (键, 值)（可选），用于释放值关联的文件等资源；
+                      同一个键写入新值时不调用
+        """
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        """查询缓存，返回 (是否命中, 值)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return True, self._entries[key]
+            self._misses += 1
+            return False, None
+
+    def put(self, key: Tuple, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        self._evict(evicted)
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._entries.items())
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+        self._evict(evicted)
+
+    def _evict(self, evicted):
+        """在锁外调用淘汰回调，回调出错不影响缓存本身"""
+        if self.on_evict is None:
+            return
+        for key, value in evicted:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print(f"释放缓存条目失败: {str(e)}")
+
+    def get_stats(self) -> Dict[str, float]:
+        """获取命中统计"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+            }
+
+
+# 进程级共享实例，Streamlit 重跑脚本和不同会话之间都能复用
+shared_analysis_cache = AnalysisCache(ANALYSIS_CACHE_SIZE)
+instrumentation.register_collector("cache", shared_analysis_cache.get_stats, {"cache": "analysis"})
+
+# 未命中时合并相同输入的并发计算，避免多个请求同时跑同一次k-means
+_analysis_flight = SingleFlight()
+
+
+def memoize_analysis(method: Callable = None, *, result_type: type = None) -> Callable:
+    """
+    分析方法的记忆化装饰器，可以直接使用，也可以指定 result_type 使用
+
+    以方法名、实例的 _memo_token()（若有）和参数内容哈希为键，
+    结果保存在 shared_analysis_cache 中，相同输入的并发未命中只计算一次；
+    返回深拷贝，调用方修改结果不会污染缓存。
+
+    指定 result_type（utils.result_types 中的紧凑结果类型）时，缓存中保存紧凑形式，
+    命中时用 to_dict() 还原为新的字典；结构不符、无法无损转换的结果按原样保存。
+    """
+    if method is None:
+        return functools.partial(memoize_analysis, result_type=result_type)
+
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        token_func = getattr(self, "_memo_token", None)
+        token = token_func() if token_func else None
+        key = (name, token, hash_inputs(*args, **kwargs))
+
+        hit, value = shared_analysis_cache.get(key)
+        instrumentation.incr("analysis_cache_requests", labels={"method": name, "result": "hit" if hit else "miss"})
+        if not hit:
+            def compute():
+                result = method(self, *args, **kwargs)
+                if result_type is not None:
+                    result = result_type.pack(result)
+                shared_analysis_cache.put(key, result)
+                return result
+
+            value, _ = _analysis_flight.do(key, compute)
+        if result_type is not None and isinstance(value, result_type):
+            return value.to_dict()
+        return copy.deepcopy(value)
+
+    wrapper.uncached = method
+    return wrapper
@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from config import ASSET_MEMORY_BUDGET_MB, ASSET_SPILL_DIR, ASSET_RETENTION_SECONDS
+from utils.analysis_cache import hash_inputs
+from utils.instrumentation import instrumentation
+
+
+def image_nbytes(image: Image.Image) -> int:
+    """估算图片在内存中的像素字节数"""
+    return image.width * image.height * len(image.getbands())
+
+
+def prune_directory(directory: str, max_age: float) -> int:
+    """
+    删除目录（含子目录）中超过保留时间未修改的文件
+
+    Args:
+        directory: 目录
+        max_age: 保留时间（秒）
+
+    Returns:
+        删除的文件数量
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    if not os.path.isdir(directory):
+        return removed
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+class AssetStore:
+    """
+    进程级图片资源仓库
+
+    会话中只保存资源键，图片本身由仓库统一管理：最近使用的图片留在内存，
+    总字节数超出预算时把最久未用的图片写入按内容寻址的磁盘目录，需要时再懒加载回来。
+    预算对所有会话共享，并发用户再多内存占用也不会超过上限。
+    """
+
+    def __init__(self, memory_budget: int, spill_dir: str):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self._memory: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._memory_bytes = 0
+        # 正在写盘的图片，写完之前仍可从这里读取
+        self._spilling: Dict[str, Image.Image] = {}
+        # 图片对象到资源键的映射，同一对象重复保存时不再计算哈希
+        self._identity_keys: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "memory_hits": 0, "disk_loads": 0, "spills": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, key[:2], f"{key}.png")
+
+    def put(self, image: Image.Image) -> str:
+        """
+        保存图片
+
+        Args:
+            image: 图片，保存后不应再原地修改
+
+        Returns:
+            资源键（内容哈希），相同内容得到相同的键
+        """
+        with self._lock:
+            key = self._identity_keys.get(id(image))
+        if key is None:
+            key = hash_inputs(image)
+            with self._lock:
+                if id(image) not in self._identity_keys:
+                    self._identity_keys[id(image)] = key
+                    weakref.finalize(image, self._forget_identity, id(image))
+
+        with self._lock:
+            self._stats["puts"] += 1
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return key
+            self._admit(key, image)
+            victims = self._collect_victims()
+        self._spill(victims)
+        return key
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """
+        读取图片，已写盘的图片会重新载入内存
+
+        Args:
+            key: 资源键
+
+        Returns:
+            图片，资源不存在时返回None
+        """
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return image
+            image = self._spilling.get(key)
+            if image is not None:
+                self._stats["memory_hits"] += 1
+                return image
+
+        path = self._path(key)
+        try:
+            with Image.open(path) as source:
+                image = source.copy()
+            # 更新访问时间，prune_disk 按访问时间清理
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"资源加载失败: {str(e)}")
+            return None
+
+        with self._lock:
+            self._stats["disk_loads"] += 1
+            if key not in self._memory:
+                self._admit(key, image)
+            else:
+                image = self._memory[key]
+            victims = self._collect_victims()
+        self._spill(victims)
+        return image
+
+    def _forget_identity(self, image_id: int):
+        with self._lock:
+            self._identity_keys.pop(image_id, None)
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            if key in self._memory or key in self._spilling:
+                return True
+        return os.path.exists(self._path(key))
+
+    def _admit(self, key: str, image: Image.Image):
+        self._memory[key] = image
+        self._memory_bytes += image_nbytes(image)
+
+    def _collect_victims(self) -> List[Tuple[str, Image.Image]]:
+        """在锁内挑出需要写盘的图片，最近加入的一张即使超出预算也保留"""
+        victims = []
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            key, image = self._memory.popitem(last=False)
+            self._memory_bytes -= image_nbytes(image)
+            self._spilling[key] = image
+            victims.append((key, image))
+        return victims
+
+    def _spill(self, victims: List[Tuple[str, Image.Image]]):
+        """在锁外写盘，内容寻址的文件已存在时只更新访问时间"""
+        for key, image in victims:
+            path = self._path(key)
+            try:
+                if os.path.exists(path):
+                    os.utime(path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                    image.save(temp_path, format="PNG", compress_level=1)
+                    os.replace(temp_path, path)
+            except Exception as e:
+                print(f"资源写盘失败: {str(e)}")
+                # 写盘失败时放回内存，宁可暂时超出预算也不丢数据
+                with self._lock:
+                    self._spilling.pop(key, None)
+                    if key not in self._memory:
+                        self._admit(key, image)
+                        self._memory.move_to_end(key, last=False)
+                continue
+            with self._lock:
+                self._spilling.pop(key, None)
+                self._stats["spills"] += 1
+
+    def prune_disk(self, max_age: float) -> int:
+        """
+        删除超过保留时间未访问的磁盘资源
+
+        Args:
+            max_age: 保留时间（秒）
+
+        Returns:
+            删除的文件数量
+        """
+        return prune_directory(self.spill_dir, max_age)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取内存占用和命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["memory_budget"] = self.memory_budget
+        return stats
+
+
+_asset_store = None
+_asset_store_lock = threading.Lock()
+
+
+def get_asset_store() -> AssetStore:
+    """获取进程级共享的资源仓库"""
+    global _asset_store
+    with _asset_store_lock:
+        if _asset_store is None:
+            _asset_store = AssetStore(ASSET_MEMORY_BUDGET_MB * 1024 * 1024, ASSET_SPILL_DIR)
+            # 启动时清理过期的磁盘资源
+            _asset_store.prune_disk(ASSET_RETENTION_SECONDS)
+            instrumentation.register_collector("asset_store", _asset_store.get_stats)
+        return _asset_store
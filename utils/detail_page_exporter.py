@@ -0,0 +1,165 @@
+import html
+import os
+import re
+from typing import Dict, Iterable, TextIO, Tuple
+
+# 页面模板，{sections_html} 处逐段写入章节内容
+PAGE_TEMPLATE = """
+    <!DOCTYPE html>
+    <html lang="zh-CN">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>产品详情页</title>
+        <style>
+            body {{ font-family: 'Microsoft YaHei', sans-serif; margin: 0; padding: 20px; background: #f5f5f5; }}
+            .container {{ max-width: 750px; margin: 0 auto; background: white; }}
+            .section {{ padding: 20px; margin-bottom: 10px; }}
+            .hero {{ background: linear-gradient(135deg, {primary}, {secondary}); color: white; text-align: center; }}
+            .features {{ display: flex; flex-wrap: wrap; gap: 15px; }}
+            .feature-item {{ flex: 1; min-width: 200px; text-align: center; padding: 15px; background: #f9f9f9; border-radius: 8px; }}
+            .benefits {{ padding-left: 20px; }}
+            .process {{ display: flex; justify-content: space-between; }}
+            .process-step {{ text-align: center; flex: 1; }}
+            .guarantee {{ display: flex; justify-content: center; gap: 20px; }}
+            .guarantee-badge {{ padding: 10px 20px; background: {primary}; color: white; border-radius: 20px; }}
+            h2 {{ color: {primary}; border-bottom: 2px solid {primary}; padding-bottom: 10px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            {sections_html}
+        </div>
+    </body>
+    </html>
+    """
+
+# 章节模板：(章节开头, 单条内容, 章节结尾)，单条内容可使用 {index} 和 {content}
+SECTION_TEMPLATES = {
+    "hero": ("", "<h3>🌟 {content}</h3>", ""),
+    "features": ('<div class="features">', '<div class="feature-item">🔥 <strong>{content}</strong></div>', "</div>"),
+    "benefits": ('<ol class="benefits">', "<li>✅ {content}</li>", "</ol>"),
+    "process": ('<div class="process">', '<div class="process-step"><strong>步骤{index}</strong><br>🔄 {content}</div>', "</div>"),
+    "guarantee": ('<div class="guarantee">', '<div class="guarantee-badge">🏆 {content}</div>', "</div>"),
+}
+
+DEFAULT_COLORS = {"primary": "#FF6B35", "secondary": "#333333"}
+
+# 颜色会写入CSS，只接受十六进制颜色，防止样式注入
+_COLOR_PATTERN = re.compile(r"^#[0-9a-fA-F]{3,8}$")
+
+
+class _ListWriter:
+    """把写入的片段收集到列表，render 时一次性拼接"""
+
+    def __init__(self, parts: list):
+        self.write = parts.append
+
+
+class DetailPageExporter:
+    """
+    详情页HTML导出器
+
+    页面与章节模板在创建时编译一次，导出时内容经过HTML转义后逐段写入输出流，
+    不在内存中拼接整页字符串，批量导出大量布局时内存占用保持平稳
+    """
+
+    def __init__(self, page_template: str = PAGE_TEMPLATE, section_templates: Dict = None):
+        # 按 {sections_html} 切分页面模板，头部只剩颜色占位符
+        head, tail = page_template.split("{sections_html}", 1)
+        self._head_template = head
+        self._tail = tail.replace("{{", "{").replace("}}", "}")
+        self._head_cache: Dict[Tuple[str, str], str] = {}
+
+        self._sections = {}
+        for section_type, (opening, item, closing) in (section_templates or SECTION_TEMPLATES).items():
+            self._sections[section_type] = (opening, item.format, closing, "{index}" in item)
+
+    def _head(self, colors: Dict) -> str:
+        primary = self._safe_color(colors.get("primary"), DEFAULT_COLORS["primary"])
+        secondary = self._safe_color(colors.get("secondary"), DEFAULT_COLORS["secondary"])
+        key = (primary, secondary)
+        if key not in self._head_cache:
+            self._head_cache[key] = self._head_template.format(primary=primary, secondary=secondary)
+        return self._head_cache[key]
+
+    @staticmethod
+    def _safe_color(value, default: str) -> str:
+        if isinstance(value, str) and _COLOR_PATTERN.match(value):
+            return value
+        return default
+
+    def write(self, layout: Dict, stream: TextIO):
+        """
+        把详情页写入文本流
+
+        Args:
+            layout: 详情页布局配置
+            stream: 任何带 write 方法的文本流
+        """
+        write = stream.write
+        write(self._head(layout.get("color_scheme", {})))
+
+        escape = html.escape
+        for section in layout["sections"]:
+            section_type = section["type"]
+            # 每个章节先在小列表中拼好再写出，减少对输出流的调用次数
+            parts = [f'<div class="section {escape(section_type)}"><h2>{escape(str(section["title"]))}</h2>']
+
+            compiled = self._sections.get(section_type)
+            if compiled:
+                opening, item_format, closing, numbered = compiled
+                parts.append(opening)
+                if numbered:
+                    parts.extend(item_format(index=index, content=escape(str(content)))
+                                 for index, content in enumerate(section["content"], 1))
+                else:
+                    parts.extend(item_format(content=escape(str(content))) for content in section["content"])
+                parts.append(closing)
+
+            parts.append("</div>")
+            write("".join(parts))
+
+        write(self._tail)
+
+    def render(self, layout: Dict) -> str:
+        """导出为字符串"""
+        parts = []
+        self.write(layout, _ListWriter(parts))
+        return "".join(parts)
+
+    def export_to_file(self, layout: Dict, path: str):
+        """导出到文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            self.write(layout, f)
+
+    def export_many(self, layouts: Iterable[Tuple[str, Dict]], output_dir: str) -> int:
+        """
+        批量导出，layouts 可以是生成器，逐个读取、逐个写出
+
+        Args:
+            layouts: (文件名, 布局) 的可迭代对象
+            output_dir: 输出目录
+
+        Returns:
+            导出的文件数量
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        count = 0
+        for name, layout in layouts:
+            self.export_to_file(layout, os.path.join(output_dir, f"{name}.html"))
+            count += 1
+        return count
+
+
+_default_exporter = DetailPageExporter()
+
+
+def generate_html_detail_page(layout: Dict) -> str:
+    """生成HTML详情页"""
+    return _default_exporter.render(layout)
+
+
+def export_html_detail_page(layout: Dict, path: str):
+    """把HTML详情页直接写入文件"""
+    _default_exporter.export_to_file(layout, path)
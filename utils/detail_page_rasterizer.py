@@ -0,0 +1,425 @@
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from config import IMAGE_SIZES
+from utils.text_layout import load_font
+
+# 单个图块的最大高度，超长章节会按块切分到多个图块中，比它还高的块切成多段
+MAX_TILE_HEIGHT = 1024
+PADDING = 40
+
+# 块：(高度, 绘制函数)，绘制函数接收 (draw, 块在图块中的y坐标)
+Block = Tuple[int, Callable[[ImageDraw.ImageDraw, int], None]]
+
+
+def _hex_to_rgb(color: str, default: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    try:
+        value = color.lstrip("#")
+        if len(value) == 3:
+            value = "".join(c * 2 for c in value)
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    except (AttributeError, ValueError):
+        return default
+
+
+def _line_height(font) -> int:
+    bbox = font.getbbox("国Ag")
+    return bbox[3] - min(bbox[1], 0) + 8
+
+
+def _wrap(text: str, font, max_width: int) -> List[str]:
+    """按字符贪心换行，中文没有空格分词"""
+    lines, current = [], ""
+    for char in str(text):
+        candidate = current + char
+        if current and font.getlength(candidate) > max_width:
+            lines.append(current)
+            current = char
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines or [""]
+
+
+class DetailPageRasterizer:
+    """
+    详情页长图渲染器
+
+    把 generate_detail_page_layout 生成的布局渲染为固定宽度的长图：
+    先在主线程中排版得到每个块的高度，再按块打包成图块在线程池中并行绘制，
+    图块按顺序写入磁盘映射的画布后立即释放，最后由JPEG编码器逐行读取画布，
+    整页再高也不需要把完整画布放在内存中。
+    """
+
+    def __init__(self, width: int = IMAGE_SIZES["detail_banner"][0], max_workers: int = 4,
+                 max_tile_height: int = MAX_TILE_HEIGHT):
+        self.width = width
+        self.max_workers = max_workers
+        self.max_tile_height = max_tile_height
+        self._fonts: Dict[int, object] = {}
+
+    def _font(self, size: int):
+        if size not in self._fonts:
+            self._fonts[size] = load_font(size)
+        return self._fonts[size]
+
+    # ---------- 排版 ----------
+
+    def plan(self, layout: Dict) -> List[Block]:
+        """
+        排版整页，返回按顺序排列的块
+
+        Args:
+            layout: 详情页布局配置
+
+        Returns:
+            块列表
+        """
+        colors = layout.get("color_scheme", {})
+        font_config = layout.get("font_config", {})
+        palette = {
+            "primary": _hex_to_rgb(colors.get("primary"), (255, 107, 53)),
+            "secondary": _hex_to_rgb(colors.get("secondary"), (51, 51, 51)),
+            "accent": _hex_to_rgb(colors.get("accent"), (102, 102, 102)),
+            "background": _hex_to_rgb(colors.get("background"), (255, 255, 255)),
+        }
+        sizes = {
+            "title": font_config.get("title", {}).get("size", 28),
+            "subtitle": font_config.get("subtitle", {}).get("size", 22),
+            "content": font_config.get("content", {}).get("size", 16),
+        }
+
+        planners = {
+            "hero": self._plan_hero,
+            "features": self._plan_features,
+            "benefits": self._plan_benefits,
+            "process": self._plan_process,
+            "guarantee": self._plan_guarantee,
+        }
+        blocks = []
+        for section in layout["sections"]:
+            planner = planners.get(section["type"], self._plan_text)
+            blocks.extend(planner(section, palette, sizes))
+        return blocks
+
+    def _fill(self, color: Tuple[int, int, int], height: int, draw_content=None) -> Block:
+        """带背景色的块"""
+        width = self.width
+
+        def draw_block(draw: ImageDraw.ImageDraw, top: int):
+            draw.rectangle([0, top, width, top + height], fill=color)
+            if draw_content:
+                draw_content(draw, top)
+
+        return height, draw_block
+
+    def _header(self, title: str, palette: Dict, sizes: Dict, text_color=None) -> Block:
+        font = self._font(sizes["title"])
+        lines = _wrap(title, font, self.width - 2 * PADDING)
+        line_height = _line_height(font)
+        height = 30 + len(lines) * line_height + 12 + 4 + 20
+        color = text_color or palette["primary"]
+        width = self.width
+
+        def draw_content(draw, top):
+            y = top + 30
+            for line in lines:
+                draw.text((PADDING, y), line, font=font, fill=color)
+                y += line_height
+            y += 12
+            draw.rectangle([PADDING, y, width - PADDING, y + 3], fill=color)
+
+        if text_color:
+            return height, draw_content
+        return self._fill(palette["background"], height, draw_content)
+
+    def _plan_hero(self, section: Dict, palette: Dict, sizes: Dict) -> List[Block]:
+        font = self._font(sizes["title"] + 8)
+        line_height = _line_height(font)
+        white = (255, 255, 255)
+
+        content_lines = []
+        for content in section["content"]:
+            content_lines.extend(_wrap(content, font, self.width - 2 * PADDING))
+            content_lines.append(None)
+
+        header_height, draw_header = self._header(section["title"], palette, sizes, text_color=white)
+        body_height = sum(line_height if line else 16 for line in content_lines) + PADDING
+        total = header_height + body_height
+        start, end = np.array(palette["primary"], float), np.array(palette["secondary"], float)
+        width = self.width
+
+        def gradient(draw, top, offset, height):
+            # 渐变按整个章节计算，拆成多个块时颜色依然连续
+            for row in range(height):
+                t = (offset + row) / max(total - 1, 1)
+                color = tuple(int(c) for c in start + (end - start) * t)
+                draw.line([(0, top + row), (width, top + row)], fill=color)
+
+        def draw_hero_header(draw, top):
+            gradient(draw, top, 0, header_height)
+            draw_header(draw, top)
+
+        def draw_body(draw, top):
+            gradient(draw, top, header_height, body_height)
+            y = top
+            for line in content_lines:
+                if line is None:
+                    y += 16
+                    continue
+                x = (width - font.getlength(line)) // 2
+                draw.text((x, y), line, font=font, fill=white)
+                y += line_height
+
+        return [(header_height, draw_hero_header), (body_height, draw_body)]
+
+    def _plan_features(self, section: Dict, palette: Dict, sizes: Dict) -> List[Block]:
+        font = self._font(sizes["subtitle"])
+        line_height = _line_height(font)
+        columns = 2
+        gap = 20
+        card_width = (self.width - 2 * PADDING - gap * (columns - 1)) // columns
+
+        blocks = [self._header(section["title"], palette, sizes)]
+        items = list(section["content"])
+        for row_start in range(0, len(items), columns):
+            row = [_wrap(item, font, card_width - 40) for item in items[row_start:row_start + columns]]
+            card_height = max(len(lines) for lines in row) * line_height + 40
+
+            def draw_row(draw, top, row=row, card_height=card_height):
+                for index, lines in enumerate(row):
+                    x = PADDING + index * (card_width + gap)
+                    draw.rounded_rectangle([x, top, x + card_width, top + card_height], radius=12,
+                                           fill=(249, 249, 249), outline=palette["primary"], width=2)
+                    y = top + 20
+                    for line in lines:
+                        draw.text((x + 20, y), line, font=font, fill=palette["secondary"])
+                        y += line_height
+
+            blocks.append(self._fill(palette["background"], card_height + gap, draw_row))
+        return blocks
+
+    def _plan_benefits(self, section: Dict, palette: Dict, sizes: Dict) -> List[Block]:
+        font = self._font(sizes["subtitle"])
+        line_height = _line_height(font)
+        badge = line_height
+        text_left = PADDING + badge + 16
+
+        blocks = [self._header(section["title"], palette, sizes)]
+        for index, item in enumerate(section["content"], 1):
+            lines = _wrap(item, font, self.width - text_left - PADDING)
+
+            def draw_item(draw, top, index=index, lines=lines):
+                draw.ellipse([PADDING, top, PADDING + badge - 4, top + badge - 4], fill=palette["primary"])
+                number = str(index)
+                draw.text((PADDING + (badge - 4 - font.getlength(number)) // 2, top), number,
+                          font=font, fill=(255, 255, 255))
+                y = top
+                for line in lines:
+                    draw.text((text_left, y), line, font=font, fill=palette["secondary"])
+                    y += line_height
+
+            blocks.append(self._fill(palette["background"], len(lines) * line_height + 16, draw_item))
+        return blocks
+
+    def _plan_process(self, section: Dict, palette: Dict, sizes: Dict) -> List[Block]:
+        font = self._font(sizes["content"])
+        number_font = self._font(sizes["subtitle"])
+        line_height = _line_height(font)
+        steps = list(section["content"]) or [""]
+        column_width = (self.width - 2 * PADDING) // len(steps)
+        circle = 56
+        wrapped = [_wrap(step, font, column_width - 10) for step in steps]
+        height = circle + 16 + max(len(lines) for lines in wrapped) * line_height + PADDING
+
+        def draw_steps(draw, top):
+            for index, lines in enumerate(wrapped):
+                center = PADDING + index * column_width + column_width // 2
+                if index:
+                    draw.line([(center - column_width + circle // 2, top + circle // 2),
+                               (center - circle // 2, top + circle // 2)], fill=palette["accent"], width=2)
+                draw.ellipse([center - circle // 2, top, center + circle // 2, top + circle], fill=palette["primary"])
+                number = str(index + 1)
+                draw.text((center - number_font.getlength(number) // 2, top + circle // 4), number,
+                          font=number_font, fill=(255, 255, 255))
+                y = top + circle + 16
+                for line in lines:
+                    draw.text((center - font.getlength(line) // 2, y), line, font=font, fill=palette["secondary"])
+                    y += line_height
+
+        return [self._header(section["title"], palette, sizes), self._fill(palette["background"], height, draw_steps)]
+
+    def _plan_guarantee(self, section: Dict, palette: Dict, sizes: Dict) -> List[Block]:
+        font = self._font(sizes["content"])
+        line_height = _line_height(font)
+        badge_height = line_height + 20
+        gap = 16
+
+        # 徽章按宽度排成多行
+        rows, current, used = [], [], 0
+        for item in section["content"]:
+            text = str(item)
+            badge_width = int(font.getlength(text)) + 48
+            if current and used + badge_width > self.width - 2 * PADDING:
+                rows.append(current)
+                current, used = [], 0
+            current.append((text, badge_width))
+            used += badge_width + gap
+        if current:
+            rows.append(current)
+
+        blocks = [self._header(section["title"], palette, sizes)]
+        for row in rows:
+            row_width = sum(width for _, width in row) + gap * (len(row) - 1)
+
+            def draw_row(draw, top, row=row, row_width=row_width):
+                x = (self.width - row_width) // 2
+                for text, badge_width in row:
+                    draw.rounded_rectangle([x, top, x + badge_width, top + badge_height],
+                                           radius=badge_height // 2, fill=palette["primary"])
+                    draw.text((x + 24, top + 10), text, font=font, fill=(255, 255, 255))
+                    x += badge_width + gap
+
+            blocks.append(self._fill(palette["background"], badge_height + gap, draw_row))
+        blocks.append(self._fill(palette["background"], PADDING))
+        return blocks
+
+    def _plan_text(self, section: Dict, palette: Dict, sizes: Dict) -> List[Block]:
+        """未知类型的章节按普通段落排版"""
+        font = self._font(sizes["content"])
+        line_height = _line_height(font)
+        blocks = [self._header(section["title"], palette, sizes)]
+        for item in section["content"]:
+            lines = _wrap(item, font, self.width - 2 * PADDING)
+
+            def draw_paragraph(draw, top, lines=lines):
+                for offset, line in enumerate(lines):
+                    draw.text((PADDING, top + offset * line_height), line, font=font, fill=palette["secondary"])
+
+            blocks.append(self._fill(palette["background"], len(lines) * line_height + 12, draw_paragraph))
+        return blocks
+
+    # ---------- 绘制与输出 ----------
+
+    def _pack_tiles(self, blocks: List[Block]) -> List[List[Block]]:
+        """
+        把连续的块打包成不超过最大高度的图块
+
+        比最大高度还高的块（例如内容很长的章节正文）切成多段：每段把整个块向上平移后绘制，
+        只保留落在本段内的行。从块中间开始的段总是位于图块顶部，向上越界的部分被图块裁掉，
+        不会覆盖前面的块。
+        """
+        tiles, current, height = [], [], 0
+        for block in blocks:
+            for piece in self._split_block(block):
+                if current and (height + piece[0] > self.max_tile_height or piece[2] > 0):
+                    tiles.append(current)
+                    current, height = [], 0
+                current.append(piece[:2])
+                height += piece[0]
+        if current:
+            tiles.append(current)
+        return tiles
+
+    def _split_block(self, block: Block) -> List[Tuple[int, Callable, int]]:
+        """把块切成不超过最大高度的段，返回 (高度, 绘制函数, 段在块中的起始行)"""
+        block_height, draw_block = block
+        if block_height <= self.max_tile_height:
+            return [(block_height, draw_block, 0)]
+        pieces = []
+        for offset in range(0, block_height, self.max_tile_height):
+            def draw_piece(draw, top, offset=offset):
+                draw_block(draw, top - offset)
+
+            pieces.append((min(self.max_tile_height, block_height - offset), draw_piece, offset))
+        return pieces
+
+    def _render_tile(self, blocks: List[Block]) -> Image.Image:
+        tile = Image.new("RGBX", (self.width, sum(height for height, _ in blocks)), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(tile)
+        top = 0
+        for height, draw_block in blocks:
+            draw_block(draw, top)
+            top += height
+        return tile
+
+    def render_to_file(self, layout: Dict, output_path: str, quality: int = 90) -> Dict:
+        """
+        渲染详情页长图并写入JPEG文件
+
+        Args:
+            layout: 详情页布局配置
+            output_path: 输出路径
+            quality: JPEG质量
+
+        Returns:
+            渲染信息（宽高、图块数、耗时）
+        """
+        started = time.perf_counter()
+        tiles = self._pack_tiles(self.plan(layout))
+        heights = [sum(height for height, _ in tile) for tile in tiles]
+        total_height = sum(heights)
+
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        fd, canvas_path = tempfile.mkstemp(suffix=".canvas", dir=output_dir)
+        os.close(fd)
+        try:
+            canvas = np.memmap(canvas_path, dtype=np.uint8, mode="w+", shape=(total_height, self.width, 4))
+
+            # 最多同时保留 max_workers + 1 个图块，写入画布后立即释放
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="raster") as pool:
+                pending = deque()
+                offsets = np.cumsum([0] + heights[:-1])
+                for tile, offset in zip(tiles, offsets):
+                    pending.append((pool.submit(self._render_tile, tile), offset))
+                    if len(pending) > self.max_workers:
+                        self._write_tile(canvas, *pending.popleft())
+                while pending:
+                    self._write_tile(canvas, *pending.popleft())
+            canvas.flush()
+
+            # JPEG编码器逐行读取磁盘映射的画布
+            page = Image.frombuffer("RGBX", (self.width, total_height), canvas, "raw", "RGBX", 0, 1)
+            page.save(output_path, format="JPEG", quality=quality)
+            del page, canvas
+        finally:
+            os.remove(canvas_path)
+
+        return {
+            "width": self.width,
+            "height": total_height,
+            "tiles": len(tiles),
+            "seconds": time.perf_counter() - started,
+        }
+
+    @staticmethod
+    def _write_tile(canvas: np.memmap, future, offset: int):
+        tile = future.result()
+        canvas[offset:offset + tile.height] = np.asarray(tile)
+
+    def render(self, layout: Dict, quality: int = 90) -> Optional[Image.Image]:
+        """渲染为内存中的图片，适合预览较短的页面"""
+        fd, path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        try:
+            self.render_to_file(layout, path, quality)
+            with Image.open(path) as image:
+                return image.copy()
+        except Exception as e:
+            print(f"详情页长图渲染失败: {str(e)}")
+            return None
+        finally:
+            os.remove(path)
+
+
+def export_detail_page_image(layout: Dict, output_path: str, quality: int = 90) -> Dict:
+    """把详情页布局渲染为JPEG长图"""
+    return DetailPageRasterizer().render_to_file(layout, output_path, quality)
@@ -0,0 +1,268 @@
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+
+class LatencyModel:
+    """
+    延迟分布，支持以下格式：
+        fixed:0.5            固定0.5秒
+        uniform:0.2:0.8      0.2~0.8秒均匀分布
+        lognormal:0.5:0.4    中位数0.5秒、sigma为0.4的对数正态分布
+    """
+
+    def __init__(self, spec: str = "fixed:0"):
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        if self.kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {spec}")
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        if median <= 0:
+            return 0.0
+        return rng.lognormvariate(np.log(median), sigma)
+
+
+class FakeOpenAIConfig:
+    """模拟服务配置"""
+
+    def __init__(self, image_latency: str = "lognormal:0.8:0.3",
+                 chat_latency: str = "lognormal:0.4:0.3",
+                 download_latency: str = "fixed:0.02",
+                 error_rate: float = 0.0,
+                 image_pixels: int = 1024,
+                 chat_reply: str = "专业网络创业指南，从零打造线上生意",
+                 chat_token_latency: str = "fixed:0.02",
+                 chat_chunk_chars: int = 2,
+                 seed: Optional[int] = None):
+        self.image_latency = LatencyModel(image_latency)
+        self.chat_latency = LatencyModel(chat_latency)
+        self.download_latency = LatencyModel(download_latency)
+        self.error_rate = error_rate
+        self.image_pixels = image_pixels
+        self.chat_reply = chat_reply
+        self.chat_token_latency = LatencyModel(chat_token_latency)
+        self.chat_chunk_chars = chat_chunk_chars
+        self.seed = seed
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """请求处理器，server 属性上挂载了 FakeOpenAIServer"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        fake = self.server.fake
+
+        if self.path.endswith("/images/generations"):
+            fake.handle_image_generation(self, body)
+        elif self.path.endswith("/chat/completions"):
+            fake.handle_chat_completion(self, body)
+        else:
+            fake.send_json(self, 404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path.startswith("/files/"):
+            fake.handle_download(self)
+        else:
+            fake.send_json(self, 404, {"error": {"message": "not found"}})
+
+
+class FakeOpenAIServer:
+    """
+    本地模拟OpenAI服务
+
+    用法：
+        server = FakeOpenAIServer(FakeOpenAIConfig(error_rate=0.05))
+        server.start()
+        generator.set_openai_key("sk-fake", base_url=server.base_url, max_retries=0)
+        ...
+        server.stop()
+    """
+
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeOpenAIConfig()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _FakeOpenAIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"images": 0, "chats": 0, "downloads": 0, "errors": 0,
+                       "stream_chunks": 0, "streams_cancelled": 0}
+        self._image_payload = self._build_image_payload(self.config.image_pixels)
+
+    @property
+    def root_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        """传给 openai.OpenAI(base_url=...) 的地址"""
+        return f"{self.root_url}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    @property
+    def payload_bytes(self) -> int:
+        """单张图片下载的字节数"""
+        return len(self._image_payload)
+
+    def _build_image_payload(self, pixels: int) -> bytes:
+        # 随机噪声几乎无法压缩，下载体积与真实生成图接近
+        rng = np.random.default_rng(self.config.seed)
+        noise = rng.integers(0, 256, (pixels, pixels, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(noise).save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _simulate(self, latency: LatencyModel) -> bool:
+        """按延迟分布等待，返回本次请求是否应模拟失败"""
+        with self._rng_lock:
+            delay = latency.sample(self._rng)
+            failed = self._rng.random() < self.config.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            self._count("errors")
+        return failed
+
+    def send_json(self, handler: BaseHTTPRequestHandler, status: int, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_error(self, handler: BaseHTTPRequestHandler):
+        self.send_json(handler, 500, {"error": {"message": "simulated server error", "type": "server_error"}})
+
+    def handle_image_generation(self, handler: BaseHTTPRequestHandler, body: Dict):
+        if self._simulate(self.config.image_latency):
+            return self._send_error(handler)
+        self._count("images")
+        self.send_json(handler, 200, {
+            "created": int(time.time()),
+            "data": [{"url": f"{self.root_url}/files/{uuid.uuid4().hex}.png",
+                      "revised_prompt": body.get("prompt", "")}]
+        })
+
+    def handle_chat_completion(self, handler: BaseHTTPRequestHandler, body: Dict):
+        if self._simulate(self.config.chat_latency):
+            return self._send_error(handler)
+        self._count("chats")
+        if body.get("stream"):
+            return self._stream_chat_completion(handler, body)
+        self.send_json(handler, 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.config.chat_reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def _stream_chat_completion(self, handler: BaseHTTPRequestHandler, body: Dict):
+        """以SSE分块返回补全内容，客户端断开时停止发送"""
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        reply = self.config.chat_reply
+        size = max(1, self.config.chat_chunk_chars)
+        pieces = [reply[i:i + size] for i in range(0, len(reply), size)]
+
+        def event(delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-3.5-turbo"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        try:
+            self._write_sse(handler, event({"role": "assistant", "content": ""}))
+            for piece in pieces:
+                with self._rng_lock:
+                    delay = self.config.chat_token_latency.sample(self._rng)
+                if delay > 0:
+                    time.sleep(delay)
+                self._write_sse(handler, event({"content": piece}))
+                self._count("stream_chunks")
+            self._write_sse(handler, event({}, "stop"))
+            self._write_chunk(handler, b"data: [DONE]\n\n")
+            self._write_chunk(handler, b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self._count("streams_cancelled")
+            handler.close_connection = True
+
+    def _write_sse(self, handler: BaseHTTPRequestHandler, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False)
+        self._write_chunk(handler, f"data: {data}\n\n".encode("utf-8"))
+
+    @staticmethod
+    def _write_chunk(handler: BaseHTTPRequestHandler, data: bytes):
+        handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        handler.wfile.flush()
+
+    def handle_download(self, handler: BaseHTTPRequestHandler):
+        if self._simulate(self.config.download_latency):
+            return self._send_error(handler)
+        self._count("downloads")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "image/png")
+        handler.send_header("Content-Length", str(len(self._image_payload)))
+        handler.end_headers()
+        handler.wfile.write(self._image_payload)
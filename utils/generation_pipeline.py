@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from config import DETAIL_IMAGE_DIR, ASSET_RETENTION_SECONDS
+from utils.analysis_cache import hash_inputs
+from utils.asset_store import get_asset_store, prune_directory
+from utils.detail_page_exporter import generate_html_detail_page
+from utils.detail_page_rasterizer import export_detail_page_image
+from utils.multi_size_export import MultiSizeExporter
+from utils.pipeline import Pipeline
+
+# 渲染结果与是否使用增量渲染会话无关，会话作为输入时使用固定的键
+RENDER_SESSION_KEY = "render_session"
+
+
+def load_template(template_key: str) -> Image.Image:
+    """从资源仓库读取模板图片"""
+    template = get_asset_store().get(template_key)
+    if template is None:
+        raise ValueError("模板图片已过期，请重新上传")
+    return template
+
+
+def load_optional_image(key: Optional[str]) -> Optional[Image.Image]:
+    """读取可选的图片（参考成品），没有或已过期时为None"""
+    return get_asset_store().get(key) if key else None
+
+
+def compose_main_texts(texts: Dict, selling_points: List[str]) -> Dict:
+    """主图文字：标题、副标题加前三个卖点"""
+    texts = dict(texts)
+    if selling_points:
+        texts["selling_points"] = selling_points[:3]
+    return texts
+
+
+def filter_sections(layout: Dict, section_map: Dict[str, bool]) -> Dict:
+    """按选择过滤详情页章节，返回新的布局"""
+    layout = dict(layout)
+    layout["sections"] = [
+        section for section in layout["sections"]
+        if section_map.get(section["type"], True)
+    ]
+    return layout
+
+
+def render_detail_image(layout: Dict) -> Dict:
+    """
+    把详情页布局渲染为JPEG长图，结果包含文件路径
+
+    文件名是布局的内容哈希，相同布局重复导出时覆盖同一个文件；
+    每次导出前按资源仓库的保留时间清理过期的长图。
+    """
+    os.makedirs(DETAIL_IMAGE_DIR, exist_ok=True)
+    prune_directory(DETAIL_IMAGE_DIR, ASSET_RETENTION_SECONDS)
+    path = os.path.join(DETAIL_IMAGE_DIR, f"{hash_inputs(layout)}.jpg")
+    # 先写临时文件再替换，正在下载旧文件的会话不会读到写了一半的长图
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        result = export_detail_page_image(layout, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    result["path"] = path
+    return result
+
+
+def remove_detail_image(result: Dict):
+    """长图结果被挤出缓存时删除文件"""
+    try:
+        os.remove(result["path"])
+    except FileNotFoundError:
+        pass
+
+
+def build_generation_pipeline(text_processor, image_processor, ai_generator) -> Pipeline:
+    """
+    从文章、模板到主图和详情页导出的生成流水线
+
+    外部输入：
+        article_title, article_content: 文章标题和内容
+        template_key, reference_key: 模板和参考成品在资源仓库中的键（可直接作为输入的键）
+        texts, style_config, layout: 主图的标题/副标题、字体样式和使用的模板分析结果
+        render_session: 增量渲染会话（可以为None），键固定为 RENDER_SESSION_KEY
+        section_map: 详情页包含的章节
+
+    Args:
+        text_processor: 文本处理器，违禁词库是缓存键的一部分
+        image_processor: 图片处理器
+        ai_generator: AI生成器
+
+    Returns:
+        流水线
+    """
+    pipeline = Pipeline("generation", salt=text_processor._memo_token())
+
+    # 文章分析
+    pipeline.add("compliance", lambda title, content: text_processor.check_forbidden_words(title + " " + content),
+                 ["article_title", "article_content"])
+    pipeline.add("keywords", lambda content: text_processor.extract_keywords(content, 8), ["article_content"])
+    pipeline.add("selling_points", text_processor.extract_selling_points, ["article_content"])
+    pipeline.add("title_variants", text_processor.generate_title_variants, ["article_title"])
+
+    # 模板分析
+    pipeline.add("template_image", load_template, ["template_key"], cache=False)
+    pipeline.add("reference_image", load_optional_image, ["reference_key"], cache=False)
+    pipeline.add("template_analysis", image_processor.analyze_template, ["template_image", "reference_image"])
+
+    # 主图渲染与多尺寸导出
+    pipeline.add("main_texts", compose_main_texts, ["texts", "selling_points"])
+
+    def render_main_image(template, texts, style_config, layout, render_session):
+        if render_session is not None:
+            image = render_session.render(texts, style_config, layout)
+        else:
+            image = image_processor.render_text_on_template(template, texts, style_config, layout)
+        return get_asset_store().put(image)
+
+    pipeline.add("main_image", render_main_image,
+                 ["template_image", "main_texts", "style_config", "layout", "render_session"],
+                 is_valid=get_asset_store().contains)
+
+    def export_sizes(template, texts, style_config, layout):
+        exporter = MultiSizeExporter()
+        files = exporter.export(image_processor, template, texts, style_config, layout)
+        return {"zip": exporter.to_zip(files), "sizes": {name: exporter.sizes[name] for name in files}}
+
+    pipeline.add("size_exports", export_sizes, ["template_image", "main_texts", "style_config", "layout"])
+
+    # 详情页布局与导出
+    pipeline.add("detail_layout", lambda content, section_map: filter_sections(
+        ai_generator.generate_detail_page_layout(content), section_map), ["article_content", "section_map"])
+    pipeline.add("detail_html", generate_html_detail_page, ["detail_layout"])
+    pipeline.add("detail_json", lambda layout: json.dumps(layout, ensure_ascii=False, indent=2), ["detail_layout"])
+    pipeline.add("detail_image", render_detail_image, ["detail_layout"],
+                 is_valid=lambda result: os.path.exists(result["path"]), release=remove_detail_image)
+    return pipeline
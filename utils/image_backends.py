@@ -0,0 +1,227 @@
+import io
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+import requests
+from PIL import Image
+
+from config import HEDGE_WORKERS
+
+
+class ImageBackend:
+    """生图后端基类，每个服务商实现统一的 generate 接口"""
+
+    name = "base"
+
+    def generate(self, prompt: str, size: str = "1024x1024", quality: str = "standard") -> Optional[Image.Image]:
+        """
+        生成一张图片
+
+        Args:
+            prompt: 提示词
+            size: 图片尺寸
+            quality: 图片质量
+
+        Returns:
+            生成的图片，失败时返回None
+        """
+        raise NotImplementedError
+
+
+class OpenAIImageBackend(ImageBackend):
+    """OpenAI Images 接口后端（DALL-E 2 / DALL-E 3）"""
+
+    def __init__(self, client, model: str = "dall-e-3"):
+        self.client = client
+        self.model = model
+        self.name = model
+
+    def generate(self, prompt: str, size: str = "1024x1024", quality: str = "standard") -> Optional[Image.Image]:
+        if self.client is None:
+            raise ValueError("请先设置OpenAI API密钥")
+
+        params = {"model": self.model, "prompt": prompt, "size": size, "n": 1}
+        # 只有DALL-E 3支持quality参数
+        if self.model == "dall-e-3":
+            params["quality"] = quality
+
+        try:
+            response = self.client.images.generate(**params)
+
+            # 下载图片
+            img_response = requests.get(response.data[0].url)
+            img_response.raise_for_status()
+
+            return Image.open(io.BytesIO(img_response.content))
+
+        except Exception as e:
+            print(f"{self.model}生成图片失败: {str(e)}")
+            return None
+
+
+# 后端注册表：名称 -> 工厂函数(openai_client) -> ImageBackend
+_BACKEND_FACTORIES: Dict[str, Callable[..., ImageBackend]] = {}
+
+
+def register_image_backend(name: str, factory: Callable[..., ImageBackend]):
+    """注册生图后端，factory 接收 openai_client 并返回后端实例"""
+    _BACKEND_FACTORIES[name] = factory
+
+
+def create_image_backend(name: str, openai_client=None) -> ImageBackend:
+    """按名称创建生图后端"""
+    if name not in _BACKEND_FACTORIES:
+        raise ValueError(f"未注册的生图后端: {name}")
+    return _BACKEND_FACTORIES[name](openai_client)
+
+
+def list_image_backends() -> List[str]:
+    """列出所有已注册的生图后端名称"""
+    return list(_BACKEND_FACTORIES.keys())
+
+
+register_image_backend("dall-e-3", lambda client: OpenAIImageBackend(client, "dall-e-3"))
+register_image_backend("dall-e-2", lambda client: OpenAIImageBackend(client, "dall-e-2"))
+
+
+class LatencyTracker:
+    """滑动窗口延迟统计，用于计算对冲请求的截止时间"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回分位数延迟，没有样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+
+# 进程级延迟统计，按后端名称共享，多个会话一起学习p95
+_latency_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    """获取指定后端的共享延迟统计"""
+    with _trackers_lock:
+        if name not in _latency_trackers:
+            _latency_trackers[name] = LatencyTracker()
+        return _latency_trackers[name]
+
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """获取进程级共享的对冲请求线程池，线程数见 HEDGE_WORKERS"""
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+class HedgedImageBackend(ImageBackend):
+    """
+    对冲请求后端：主后端超过p95延迟仍未返回时，向备用后端再发一次请求，
+    取先成功返回的结果。落后的请求无法中途取消，会在后台自然结束。
+    """
+
+    def __init__(self, primary: ImageBackend, secondary: ImageBackend,
+                 quantile: float = 0.95, min_samples: int = 20,
+                 default_deadline: float = 30.0, tracker: Optional[LatencyTracker] = None,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Args:
+            primary: 主后端
+            secondary: 备用后端
+            quantile: 对冲截止时间使用的分位数
+            min_samples: 样本少于该数量时使用默认截止时间
+            default_deadline: 默认截止时间（秒）
+            tracker: 主后端的延迟统计，默认按主后端名称共享
+            executor: 执行请求的线程池，默认使用进程级共享线程池
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.name = f"{primary.name}|{secondary.name}"
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default_deadline = default_deadline
+        self.tracker = tracker or get_latency_tracker(primary.name)
+        self._executor = executor or get_hedge_executor()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "hedged": 0, "secondary_wins": 0}
+
+    def hedge_deadline(self) -> float:
+        """对冲截止时间：样本足够时用主后端的p95延迟，否则用默认值"""
+        if self.tracker.count() < self.min_samples:
+            return self.default_deadline
+        return self.tracker.quantile(self.quantile)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _timed_primary(self, prompt: str, size: str, quality: str) -> Optional[Image.Image]:
+        start = time.perf_counter()
+        try:
+            return self.primary.generate(prompt, size, quality)
+        finally:
+            # 每次调用都记录主后端的延迟：失败、超时和被对冲超过后才完成的请求同样计入，
+            # 否则慢请求越多样本越偏向快的请求，p95偏低
+            self.tracker.record(time.perf_counter() - start)
+
+    def generate(self, prompt: str, size: str = "1024x1024", quality: str = "standard") -> Optional[Image.Image]:
+        self._count("requests")
+        primary = self._executor.submit(self._timed_primary, prompt, size, quality)
+
+        done, _ = wait([primary], timeout=self.hedge_deadline())
+        if done:
+            image = self._result_or_none(primary)
+            if image is not None:
+                return image
+
+        # 主后端超时或失败，发送对冲请求
+        self._count("hedged")
+        secondary = self._executor.submit(self.secondary.generate, prompt, size, quality)
+        pending = {secondary} if done else {primary, secondary}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                image = self._result_or_none(future)
+                if image is not None:
+                    if future is secondary:
+                        self._count("secondary_wins")
+                    return image
+
+        return None
+
+    @staticmethod
+    def _result_or_none(future) -> Optional[Image.Image]:
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"对冲请求失败: {str(e)}")
+            return None
@@ -0,0 +1,105 @@
+import hashlib
+import io
+import threading
+import weakref
+from typing import Dict, Tuple
+
+from PIL import Image
+
+from config import UPLOAD_CACHE_SIZE
+from utils.analysis_cache import AnalysisCache
+from utils.image_ingest import ingest_image
+from utils.instrumentation import instrumentation
+
+# 解码结果按文件内容哈希缓存，Streamlit 重跑时不再重复解码
+_decoded_images = AnalysisCache(UPLOAD_CACHE_SIZE)
+
+# 编码结果按图片对象身份缓存，图片被回收时对应条目随之删除
+_encoded_images: Dict[Tuple[int, str], bytes] = {}
+_encoded_lock = threading.Lock()
+_encode_stats = {"hits": 0, "misses": 0}
+
+
+def ingest_upload(data: bytes) -> Tuple[Image.Image, Dict]:
+    """
+    按预算解码上传的图片字节，相同内容只解码一次
+
+    返回的图片在会话之间共享，调用方不应原地修改
+
+    Args:
+        data: 图片文件内容
+
+    Returns:
+        (RGB工作图片, 解码报告)
+
+    Raises:
+        IngestError: 超出预算或无法解码
+    """
+    key = hashlib.sha1(data).hexdigest()
+    hit, value = _decoded_images.get(key)
+    if hit:
+        return value
+
+    value = ingest_image(data)
+    _decoded_images.put(key, value)
+    return value
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """
+    解码上传的图片字节并转换为工作模式，超大图片按 TEMPLATE_MAX_SIDE 缩小
+
+    Args:
+        data: 图片文件内容
+
+    Returns:
+        RGB图片
+    """
+    return ingest_upload(data)[0]
+
+
+def encode_image(image: Image.Image, format: str = "PNG") -> bytes:
+    """
+    把图片编码为文件字节，同一个图片对象只编码一次
+
+    Args:
+        image: 图片对象，编码后不应再原地修改
+        format: 图片格式
+
+    Returns:
+        编码后的字节
+    """
+    key = (id(image), format)
+    with _encoded_lock:
+        data = _encoded_images.get(key)
+        if data is not None:
+            _encode_stats["hits"] += 1
+            return data
+        _encode_stats["misses"] += 1
+
+    buffer = io.BytesIO()
+    with instrumentation.span("image.encode"):
+        image.save(buffer, format=format)
+    data = buffer.getvalue()
+
+    with _encoded_lock:
+        if key not in _encoded_images:
+            weakref.finalize(image, _forget_encoded, key)
+        _encoded_images[key] = data
+    return data
+
+
+def _forget_encoded(key: Tuple[int, str]):
+    with _encoded_lock:
+        _encoded_images.pop(key, None)
+
+
+def get_image_cache_stats() -> Dict[str, Dict]:
+    """获取解码与编码缓存的命中统计"""
+    with _encoded_lock:
+        encoded = dict(_encode_stats, entries=len(_encoded_images))
+    return {"decoded": _decoded_images.get_stats(), "encoded": encoded}
+
+
+instrumentation.register_collector("cache", _decoded_images.get_stats, {"cache": "upload_decode"})
+instrumentation.register_collector("cache", lambda: get_image_cache_stats()["encoded"], {"cache": "encode"})
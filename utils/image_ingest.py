@@ -0,0 +1,142 @@
+import io
+import time
+import warnings
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps
+
+from config import UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, TEMPLATE_MAX_SIDE
+
+# EXIF 方向标签，5-8 表示宽高需要互换
+_ORIENTATION_TAG = 0x0112
+
+
+class IngestError(ValueError):
+    """上传的图片超出预算或无法解码"""
+
+
+def to_working_mode(image: Image.Image) -> Image.Image:
+    """
+    转换为渲染使用的RGB模式，带透明通道的图片先合成到白色背景上
+
+    Args:
+        image: 原始图片
+
+    Returns:
+        RGB图片
+    """
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _target_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """等比缩小到最长边不超过 max_side"""
+    width, height = size
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def image_buffer_bytes(image: Image.Image) -> int:
+    """PIL 像素缓冲区的字节数，多通道图片按每像素4字节存放"""
+    if image.mode in ("1", "L", "P"):
+        pixel = 1
+    elif image.mode in ("LA", "I;16"):
+        pixel = 2
+    else:
+        pixel = 4
+    return image.width * image.height * pixel
+
+
+def ingest_image(data: bytes, max_side: int = TEMPLATE_MAX_SIDE, max_pixels: int = UPLOAD_MAX_PIXELS,
+                 max_bytes: int = UPLOAD_MAX_BYTES) -> Tuple[Image.Image, Dict]:
+    """
+    安全地解码上传图片：先只读文件头检查预算，再按需要的尺寸解码，只转换一次工作模式
+
+    JPEG 在目标尺寸允许时使用 1/2、1/4、1/8 比例的草稿解码，不分配全分辨率缓冲区；
+    多帧图片（GIF、TIFF等）只取第一帧；带方向信息的手机照片按方向摆正。
+
+    Args:
+        data: 图片文件内容
+        max_side: 工作图片的最长边
+        max_pixels: 原图像素数上限
+        max_bytes: 文件字节数上限
+
+    Returns:
+        (RGB工作图片, 解码报告)，报告包含原始尺寸、解码尺寸、是否草稿解码和像素缓冲区峰值
+
+    Raises:
+        IngestError: 超出预算或不是可识别的图片
+    """
+    start = time.perf_counter()
+    if len(data) > max_bytes:
+        raise IngestError(f"图片文件过大: {len(data) / 1024 / 1024:.1f}MB，上限 {max_bytes / 1024 / 1024:.0f}MB")
+
+    # 像素预算在读出文件头后自行检查，不依赖 PIL 的解压炸弹警告
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        try:
+            source = Image.open(io.BytesIO(data))
+        except Exception as e:
+            raise IngestError(f"无法识别的图片: {str(e)}")
+
+        with source:
+            original_size = source.size
+            if original_size[0] * original_size[1] > max_pixels:
+                raise IngestError(f"图片像素过多: {original_size[0]}×{original_size[1]}，"
+                                  f"上限 {max_pixels / 1_000_000:.0f} 百万像素")
+
+            # 目标尺寸按摆正后的方向计算，草稿解码按文件中的方向请求
+            orientation = source.getexif().get(_ORIENTATION_TAG, 1)
+            rotated = orientation in (5, 6, 7, 8)
+            upright_size = original_size[::-1] if rotated else original_size
+            target = _target_size(upright_size, max_side)
+
+            draft = False
+            if source.format == "JPEG" and target != upright_size:
+                # draft 选择不小于请求尺寸的最小缩小比例，解码时直接得到较小的图片
+                draft = source.draft("RGB", target[::-1] if rotated else target) is not None
+            try:
+                source.load()
+            except Exception as e:
+                raise IngestError(f"图片解码失败: {str(e)}")
+
+            # 统计同时存活的像素缓冲区，得到解码过程的内存峰值
+            decoded_size = source.size
+            live = peak = image_buffer_bytes(source)
+            image = source
+            if orientation != 1:
+                image = ImageOps.exif_transpose(source)
+                live += image_buffer_bytes(image)
+                peak = max(peak, live)
+            if image.size != target:
+                resized = image.resize(target, Image.LANCZOS, reducing_gap=3.0)
+                live += image_buffer_bytes(resized)
+                peak = max(peak, live)
+                if image is not source:
+                    live -= image_buffer_bytes(image)
+                image = resized
+            working = to_working_mode(image)
+            if working is source:
+                # 图片仍然依附于文件对象，复制一份再关闭文件
+                working = source.copy()
+            if working is not image:
+                live += image_buffer_bytes(working)
+                peak = max(peak, live)
+
+    report = {
+        "format": source.format,
+        "original_size": original_size,
+        "decoded_size": decoded_size,
+        "size": working.size,
+        "draft": draft,
+        "file_bytes": len(data),
+        "peak_bytes": peak,
+        "seconds": time.perf_counter() - start,
+    }
+    return working, report
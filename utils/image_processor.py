@@ -1,9 +1,83 @@
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+from PIL import Image, ImageDraw, ImageEnhance
 from typing import Dict, List, Tuple, Optional
 import base64
+import copy
+import functools
 import io
+from config import ANALYSIS_CACHE_SIZE, NEAR_DUPLICATE_MAX_DISTANCE
+from utils.analysis_cache import memoize_analysis
+from utils.instrumentation import instrumentation, timed
+from utils.text_layout import TextLayoutEngine
+from utils.reference_style import extract_reference_style
+from utils.layout_zones import detect_layout_zones
+from utils.perceptual_hash import PerceptualIndex
+from utils.result_types import TemplateAnalysis
+
+# 已分析模板的感知哈希索引，值为不含参考样式的分析结果（TemplateAnalysis 紧凑形式）
+template_index = PerceptualIndex(NEAR_DUPLICATE_MAX_DISTANCE, ANALYSIS_CACHE_SIZE)
+
+
+def scale_template_analysis(analysis: Dict, size: Tuple[int, int]) -> Dict:
+    """
+    把模板分析结果换算到另一个尺寸（同一模板缩放后的副本）
+    
+    Args:
+        analysis: 模板分析结果
+        size: 新的图片尺寸 (宽, 高)
+        
+    Returns:
+        坐标按比例换算后的分析结果副本
+    """
+    width, height = size
+    scale_x, scale_y = width / analysis["width"], height / analysis["height"]
+    scaled = copy.deepcopy(analysis)
+    scaled.update({"width": width, "height": height, "aspect_ratio": width / height})
+    for region in scaled["text_regions"] + list(scaled["layout_zones"].values()):
+        region["x"] = int(round(region["x"] * scale_x))
+        region["y"] = int(round(region["y"] * scale_y))
+        region["width"] = int(round(region["width"] * scale_x))
+        region["height"] = int(round(region["height"] * scale_y))
+    for region in scaled["text_regions"]:
+        region["area"] = region["width"] * region["height"]
+    return scaled
+
+
+def _unpack(value) -> Dict:
+    return value.to_dict() if isinstance(value, TemplateAnalysis) else value
+
+
+def reuse_similar_templates(method):
+    """
+    模板分析的近似重复复用：重新压缩或缩放过的同一模板内容哈希不同，精确缓存无法命中，
+    这里按感知哈希找到已分析过的相似模板，换算其分析结果，只重新提取参考样式
+    
+    放在 memoize_analysis 之下使用，精确缓存未命中时才会执行。
+    """
+    @functools.wraps(method)
+    def wrapper(self, template_image: Image.Image, reference_image: Image.Image = None) -> Dict:
+        width, height = template_image.size
+        signature = template_index.signature(template_image)
+        match = template_index.nearest(
+            template_image, signature,
+            accept=lambda value: abs(_unpack(value)["aspect_ratio"] - width / height) <= 0.01
+        )
+        instrumentation.incr("template_reuse", labels={"result": "hit" if match is not None else "miss"})
+        if match is not None:
+            analysis = scale_template_analysis(_unpack(match["value"]), (width, height))
+            analysis["near_duplicate"] = {"distance": match["distance"]}
+            if reference_image is not None:
+                analysis["reference_style"] = self._extract_style_from_reference(reference_image)
+            return analysis
+        
+        analysis = method(self, template_image, reference_image)
+        template_only = {key: value for key, value in analysis.items() if key != "reference_style"}
+        template_index.add((signature[0], width, height), template_image,
+                           TemplateAnalysis.pack(copy.deepcopy(template_only)), signature)
+        return analysis
+    
+    return wrapper
 
 class ImageProcessor:
     """图片处理类，负责模板分析、样式提取、文字渲染等功能"""
@@ -11,9 +85,11 @@ class ImageProcessor:
     def __init__(self):
         self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
     
+    @memoize_analysis(result_type=TemplateAnalysis)
+    @reuse_similar_templates
     def analyze_template(self, template_image: Image.Image, reference_image: Image.Image = None) -> Dict:
         """
-        分析模板图片的布局和样式
+        分析模板图片的布局和样式，近似重复的模板复用已有结果（带 near_duplicate 字段）
         
         Args:
             template_image: 模板图片
@@ -24,7 +100,20 @@ class ImageProcessor:
         """
         # 转换为numpy数组进行分析
         template_array = np.array(template_image)
+        return self.analyze_template_array(template_array, reference_image)
+    
+    @timed("image.analyze_template")
+    def analyze_template_array(self, template_array: np.ndarray, reference_image: Image.Image = None) -> Dict:
+        """
+        分析模板像素数组，支持3通道RGB和4通道RGBX/RGBA数组
         
+        Args:
+            template_array: 模板像素数组 (高, 宽, 通道)
+            reference_image: 参考成品图片（可选）
+            
+        Returns:
+            包含布局信息的字典
+        """
         # 基础信息
         height, width = template_array.shape[:2]
         analysis_result = {
@@ -55,9 +144,30 @@ class ImageProcessor:
         
         return analysis_result
     
+    def analyze_layout_array(self, template_array: np.ndarray) -> Dict:
+        """
+        只分析版面（文字区域和布局区域），不提取颜色，用于需要快速排版的场景
+        
+        Args:
+            template_array: 模板像素数组 (高, 宽, 通道)
+            
+        Returns:
+            与 analyze_template 结果结构相同、不含 color_palette 的字典
+        """
+        height, width = template_array.shape[:2]
+        return {
+            "width": width,
+            "height": height,
+            "aspect_ratio": width / height,
+            "text_regions": self._detect_text_regions(template_array),
+            "layout_zones": self._analyze_layout_zones(template_array)
+        }
+    
+    @timed("image.text_regions")
     def _detect_text_regions(self, image_array: np.ndarray) -> List[Dict]:
         """检测图片中可能的文字区域"""
-        gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+        conversion = cv2.COLOR_RGBA2GRAY if image_array.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+        gray = cv2.cvtColor(image_array, conversion)
         
         # 使用形态学操作检测文字区域
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
@@ -92,11 +202,11 @@ class ImageProcessor:
         
         return text_regions[:5]  # 返回最大的5个区域
     
+    @timed("image.kmeans")
     def _extract_color_palette(self, image_array: np.ndarray, n_colors: int = 8) -> List[str]:
         """提取图片的主要颜色"""
-        # 重塑数组
-        data = image_array.reshape((-1, 3))
-        data = np.float32(data)
+        # 只取RGB通道并重塑数组
+        data = np.float32(image_array[..., :3]).reshape((-1, 3))
         
         # 使用K-means聚类
         criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
@@ -111,53 +221,18 @@ class ImageProcessor:
         
         return colors
     
+    @timed("image.layout_zones")
     def _analyze_layout_zones(self, image_array: np.ndarray) -> Dict:
-        """分析图片的布局区域"""
-        height, width = image_array.shape[:2]
-        
-        # 定义标准布局区域
-        zones = {
-            "header": {
-                "x": 0, "y": 0, 
-                "width": width, "height": height // 4,
-                "purpose": "标题区域"
-            },
-            "main": {
-                "x": 0, "y": height // 4,
-                "width": width, "height": height // 2,
-                "purpose": "主要内容区域"
-            },
-            "footer": {
-                "x": 0, "y": 3 * height // 4,
-                "width": width, "height": height // 4,
-                "purpose": "底部信息区域"
-            }
-        }
-        
-        return zones
+        """按显著度分析图片的布局区域，文字区域避开商品和图案"""
+        return detect_layout_zones(image_array)
     
+    @timed("image.reference_style")
     def _extract_style_from_reference(self, reference_image: Image.Image) -> Dict:
-        """从参考图片中提取样式信息"""
-        # 这里应该使用OCR技术提取文字样式
-        # 简化版本，返回基础样式信息
-        return {
-            "title_style": {
-                "color": "#FF6B35",
-                "size": 36,
-                "weight": "bold",
-                "position": "top_center"
-            },
-            "subtitle_style": {
-                "color": "#333333",
-                "size": 24,
-                "weight": "normal",
-                "position": "center"
-            },
-            "highlight_color": "#FF6B35",
-            "background_style": "gradient"
-        }
+        """从参考图片中提取样式信息（颜色、字号、位置、背景类型），结果按图片内容缓存"""
+        return extract_reference_style(reference_image)
     
-    def render_text_on_template(self, template: Image.Image, texts: Dict, style_config: Dict) -> Image.Image:
+    def render_text_on_template(self, template: Image.Image, texts: Dict, style_config: Dict,
+                                layout: Dict = None) -> Image.Image:
         """
         在模板上渲染文字
         
@@ -165,82 +240,31 @@ class ImageProcessor:
             template: 模板图片
             texts: 文字内容字典
             style_config: 样式配置
+            layout: 模板分析结果（可选），文字优先排进分析出的文字区域
             
         Returns:
             渲染后的图片
         """
         # 创建副本
         result_image = template.copy()
-        draw = ImageDraw.Draw(result_image)
-        
-        width, height = result_image.size
-        
-        # 渲染标题
-        if "title" in texts:
-            title_style = style_config.get("title", {})
-            font_size = title_style.get("size", 36)
-            font_color = title_style.get("color", "#FF6B35")
-            
-            try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            # 计算文字位置（居中）
-            text = texts["title"]
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            x = (width - text_width) // 2
-            y = height // 6  # 标题放在上方1/6处
-            
-            # 添加文字阴影效果
-            shadow_offset = 2
-            draw.text((x + shadow_offset, y + shadow_offset), text, font=font, fill="#000000")
-            draw.text((x, y), text, font=font, fill=font_color)
-        
-        # 渲染副标题
-        if "subtitle" in texts:
-            subtitle_style = style_config.get("subtitle", {})
-            font_size = subtitle_style.get("size", 24)
-            font_color = subtitle_style.get("color", "#333333")
-            
-            try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            text = texts["subtitle"]
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            
-            x = (width - text_width) // 2
-            y = height // 2  # 副标题放在中间
-            
-            draw.text((x, y), text, font=font, fill=font_color)
-        
-        # 渲染卖点列表
-        if "selling_points" in texts and isinstance(texts["selling_points"], list):
-            point_style = style_config.get("content", {})
-            font_size = point_style.get("size", 18)
-            font_color = point_style.get("color", "#666666")
-            
-            try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            y_start = 2 * height // 3
-            for i, point in enumerate(texts["selling_points"][:3]):  # 最多显示3个卖点
-                text = f"• {point}"
-                x = width // 10
-                y = y_start + i * (font_size + 10)
-                
-                draw.text((x, y), text, font=font, fill=font_color)
-        
+        self.draw_texts(result_image, texts, style_config, layout)
         return result_image
     
+    @timed("image.draw_texts")
+    def draw_texts(self, image: Image.Image, texts: Dict, style_config: Dict, layout: Dict = None):
+        """
+        在图片上原地绘制文字，长文字自动换行并缩小字号以放进所在区域
+        
+        Args:
+            image: 目标图片，会被直接修改
+            texts: 文字内容字典
+            style_config: 样式配置，字号作为上限
+            layout: 模板分析结果（可选）
+        """
+        draw = ImageDraw.Draw(image)
+        for element in TextLayoutEngine().elements(texts, style_config, image.size, layout):
+            element.draw(draw)
+    
     def apply_filters_and_effects(self, image: Image.Image, effects: Dict) -> Image.Image:
         """应用滤镜和视觉效果"""
         result = image.copy()
@@ -0,0 +1,143 @@
+import threading
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+from utils.text_layout import Box, TextElement, TextLayoutEngine
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _union(a: Box, b: Box) -> Box:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def _bounding(boxes: List[Box]) -> Box:
+    if not boxes:
+        return 0, 0, 0, 0
+    return min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+
+def _same_style(a: TextElement, b: TextElement) -> bool:
+    """字号、颜色相同的两个元素，逐行比较即可知道哪些行变了"""
+    return a.placed.block.size == b.placed.block.size and a.color == b.color and a.font_path == b.font_path
+
+
+def merge_rects(rects: List[Box]) -> List[Box]:
+    """合并相交的矩形，直到两两不相交"""
+    merged: List[Box] = []
+    for rect in rects:
+        while True:
+            overlapping = [other for other in merged if _intersects(rect, other)]
+            if not overlapping:
+                break
+            for other in overlapping:
+                merged.remove(other)
+                rect = _union(rect, other)
+        merged.append(rect)
+    return merged
+
+
+class RenderSession:
+    """
+    增量渲染会话：记住每个文字元素的绘制范围，参数变化时只恢复并重画变化的区域
+
+    脏矩形内先用模板像素覆盖，再把与之相交的所有元素按原顺序画到这块裁剪区域上，
+    结果与整张重新渲染逐像素一致。
+    """
+
+    def __init__(self, template: Image.Image, engine: TextLayoutEngine = None):
+        self.template = template
+        self.image = template.copy()
+        self.engine = engine or TextLayoutEngine()
+        self._elements: List[TextElement] = []
+        self._run_bounds: Dict[str, List[Box]] = {}
+        self._lock = threading.RLock()
+
+    def _clip(self, rect: Box) -> Optional[Box]:
+        x0, y0 = max(rect[0], 0), max(rect[1], 0)
+        x1, y1 = min(rect[2], self.image.width), min(rect[3], self.image.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
+
+    def update(self, texts: Dict, style_config: Dict, layout: Dict = None) -> Dict:
+        """
+        按新的参数更新图片
+
+        Args:
+            texts: 文字内容字典
+            style_config: 样式配置
+            layout: 模板分析结果（可选）
+
+        Returns:
+            本次更新的统计：重画的元素、脏矩形和改动的像素数
+        """
+        with self._lock:
+            elements = self.engine.elements(texts, style_config, self.image.size, layout)
+            previous = {element.key: element for element in self._elements}
+            current = {element.key: element for element in elements}
+
+            dirty: List[Box] = []
+            changed = []
+            run_bounds: Dict[str, List[Box]] = {}
+            for key in list(previous) + [key for key in current if key not in previous]:
+                old, new = previous.get(key), current.get(key)
+                if old == new:
+                    run_bounds[key] = self._run_bounds[key]
+                    continue
+                changed.append(key)
+                old_boxes = self._run_bounds.get(key, [])
+                new_boxes = new.run_bounds() if new is not None else []
+                if new is not None:
+                    run_bounds[key] = new_boxes
+                if old is not None and new is not None and _same_style(old, new):
+                    # 字号、颜色不变时只有内容或位置变化的行是脏的
+                    for index in range(max(len(old.runs), len(new.runs))):
+                        old_run = old.runs[index] if index < len(old.runs) else None
+                        new_run = new.runs[index] if index < len(new.runs) else None
+                        if old_run != new_run:
+                            dirty.extend(boxes[index] for boxes in (old_boxes, new_boxes) if index < len(boxes))
+                else:
+                    dirty.extend(old_boxes + new_boxes)
+
+            bounds = {key: _bounding(run_bounds[key]) for key in current}
+            rects = [rect for rect in (self._clip(rect) for rect in merge_rects(dirty)) if rect]
+
+            pixels = 0
+            for rect in rects:
+                # 模板像素覆盖脏区域，再把相交的元素按原顺序画上去
+                region = self.template.crop(rect)
+                draw = ImageDraw.Draw(region)
+                for element in elements:
+                    if _intersects(bounds[element.key], rect):
+                        element.draw(draw, origin=rect[:2])
+                self.image.paste(region, rect[:2])
+                pixels += (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+            self._elements = elements
+            self._run_bounds = run_bounds
+            return {
+                "changed": changed,
+                "dirty_rects": rects,
+                "pixels": pixels,
+                "total_pixels": self.image.width * self.image.height,
+            }
+
+    def render(self, texts: Dict, style_config: Dict, layout: Dict = None) -> Image.Image:
+        """
+        更新并拷贝出结果，拷贝不受之后的更新影响，可以在多个线程中调用
+
+        Args:
+            texts: 文字内容字典
+            style_config: 样式配置
+            layout: 模板分析结果（可选）
+
+        Returns:
+            渲染后的图片
+        """
+        with self._lock:
+            self.update(texts, style_config, layout)
+            return self.image.copy()
@@ -0,0 +1,350 @@
+import contextlib
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import INSTRUMENTATION_ENABLED, INSTRUMENTATION_LOG, INSTRUMENTATION_FLUSH_EVENTS
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = "duanju"
+# 耗时直方图的桶上限（秒）
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _NullSpan:
+    """关闭统计时 span() 返回的空上下文，不做任何事"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """一次计时：退出时把耗时记入所属的统计"""
+
+    __slots__ = ("_owner", "_name", "_start")
+
+    def __init__(self, owner: "Instrumentation", name: str):
+        self._owner = owner
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._owner.observe(self._name, time.perf_counter() - self._start, error=exc[0] is not None)
+        return False
+
+
+class _SpanStats:
+    """单个阶段的耗时统计：次数、总耗时、最大值和直方图"""
+
+    __slots__ = ("count", "errors", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(SPAN_BUCKETS)
+
+    def add(self, seconds: float, error: bool):
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(SPAN_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+def _labels(labels: Optional[Dict[str, Any]]) -> Labels:
+    return tuple(sorted((str(key), str(value)) for key, value in (labels or {}).items()))
+
+
+def _metric_name(*parts: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join((METRIC_PREFIX,) + parts))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class Instrumentation:
+    """
+    进程级性能统计：阶段耗时（span）、计数器，以及按需读取的缓存命中率等指标
+
+    关闭时 span() 返回共享的空上下文、timed() 包装的函数只多一次属性判断，开销可以忽略；
+    打开后每次记录加一次锁。缓存统计由各模块注册采集函数，只在导出时读取，平时没有开销。
+    配置了日志路径时，每次计时还会作为一行JSON写入日志（攒够一批后写入）。
+    """
+
+    def __init__(self, enabled: bool = False, log_path: Optional[str] = None,
+                 flush_events: int = INSTRUMENTATION_FLUSH_EVENTS):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.flush_events = flush_events
+        self._lock = threading.Lock()
+        self._spans: Dict[str, _SpanStats] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._collectors: Dict[Tuple[str, Labels], Callable[[], Dict[str, Any]]] = {}
+        self._events: deque = deque(maxlen=max(flush_events * 4, 1))
+        self._captured: Optional[List[Tuple[str, float, bool]]] = None
+        self.started_at = time.time()
+
+    def enable(self, log_path: Optional[str] = None):
+        """打开统计，log_path 不为空时同时写JSON日志"""
+        if log_path is not None:
+            self.log_path = log_path
+        self.enabled = True
+
+    def disable(self):
+        """关闭统计，已缓冲的日志写入文件"""
+        self.enabled = False
+        self.flush()
+
+    def reset(self):
+        """清空已记录的耗时和计数，注册的采集函数保留"""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._events.clear()
+            self.started_at = time.time()
+
+    def span(self, name: str):
+        """
+        计时上下文
+
+        Args:
+            name: 阶段名称，按 "模块.步骤" 命名，例如 "text.jieba"
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name: str) -> Callable:
+        """函数计时装饰器，与 span() 相同"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        """记录一次已经测得的耗时"""
+        if not self.enabled:
+            return
+        flush = False
+        with self._lock:
+            if self._captured is not None:
+                self._captured.append((name, seconds, error))
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = _SpanStats()
+            stats.add(seconds, error)
+            if self.log_path:
+                self._events.append({"time": round(time.time(), 3), "span": name,
+                                     "ms": round(seconds * 1000, 3), "error": error})
+                flush = len(self._events) >= self.flush_events
+        if flush:
+            self.flush()
+
+    @contextlib.contextmanager
+    def capture(self, enabled: bool = True):
+        """
+        在计算进程中记录本次任务的计时，交给主进程用 replay() 合并
+
+        工作进程每次只执行一个任务，期间按 enabled 打开或关闭统计。
+
+        Yields:
+            (阶段, 耗时, 是否出错) 列表，任务结束后随结果返回主进程
+        """
+        previous = self.enabled
+        captured: List[Tuple[str, float, bool]] = []
+        with self._lock:
+            self._captured = captured
+        self.enabled = enabled
+        try:
+            yield captured
+        finally:
+            self.enabled = previous
+            with self._lock:
+                self._captured = None
+
+    def replay(self, spans: List[Tuple[str, float, bool]]):
+        """合并计算进程返回的计时"""
+        for name, seconds, error in spans:
+            self.observe(name, seconds, error)
+
+    def incr(self, name: str, value: float = 1, labels: Dict[str, Any] = None):
+        """
+        计数器加一（或加 value）
+
+        Args:
+            name: 计数器名称，导出为 <前缀>_<名称>_total
+            value: 增量
+            labels: 标签（可选），例如 {"method": "TextProcessor.extract_keywords"}
+        """
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_collector(self, name: str, func: Callable[[], Dict[str, Any]], labels: Dict[str, Any] = None):
+        """
+        注册按需读取的指标，例如缓存的 get_stats；同名同标签重复注册时替换
+
+        Args:
+            name: 指标组名称，每个数值导出为 <前缀>_<名称>_<键>
+            func: 返回 {键: 数值} 的函数，非数值的项忽略
+            labels: 标签（可选），例如 {"cache": "analysis"}
+        """
+        with self._lock:
+            self._collectors[(name, _labels(labels))] = func
+
+    def _collect(self) -> List[Tuple[str, Labels, Dict[str, float]]]:
+        with self._lock:
+            collectors = list(self._collectors.items())
+        results = []
+        for (name, labels), func in collectors:
+            try:
+                values = func()
+            except Exception as e:
+                print(f"读取指标失败 {name}: {str(e)}")
+                continue
+            numbers = {key: float(value) for key, value in values.items()
+                       if isinstance(value, (int, float)) and not isinstance(value, bool)}
+            results.append((name, labels, numbers))
+        return results
+
+    def snapshot(self) -> Dict:
+        """
+        当前的全部统计
+
+        Returns:
+            {"enabled", "uptime_seconds", "spans", "counters", "collectors"}，
+            spans 按总耗时从大到小排列
+        """
+        with self._lock:
+            spans = {name: stats.to_dict() for name, stats in self._spans.items()}
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in self._counters.items()]
+        collectors = [{"name": name, "labels": dict(labels), "values": values}
+                      for name, labels, values in self._collect()]
+        return {
+            "enabled": self.enabled,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "spans": dict(sorted(spans.items(), key=lambda item: item[1]["total_seconds"], reverse=True)),
+            "counters": counters,
+            "collectors": collectors,
+        }
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        span_metric = _metric_name("span_seconds")
+        with self._lock:
+            spans = [(name, stats.count, stats.total, list(stats.buckets)) for name, stats in self._spans.items()]
+            span_errors = [(name, stats.errors) for name, stats in self._spans.items()]
+            counters = sorted(self._counters.items())
+        if spans:
+            lines.append(f"# HELP {span_metric} 各阶段耗时")
+            lines.append(f"# TYPE {span_metric} histogram")
+            for name, count, total, buckets in sorted(spans):
+                labels = (("span", name),)
+                cumulative = 0
+                for bound, bucket in zip(SPAN_BUCKETS, buckets):
+                    cumulative += bucket
+                    lines.append(f"{span_metric}_bucket{_format_labels(labels, (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{span_metric}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{span_metric}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{span_metric}_count{_format_labels(labels)} {count}")
+            error_metric = _metric_name("span_errors_total")
+            lines.append(f"# TYPE {error_metric} counter")
+            for name, errors in sorted(span_errors):
+                lines.append(f"{error_metric}{_format_labels((('span', name),))} {errors}")
+
+        declared = set()
+        for (name, labels), value in counters:
+            metric = _metric_name(name, "total")
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+
+        gauges: Dict[str, List[str]] = {}
+        for name, labels, values in self._collect():
+            for key, value in values.items():
+                metric = _metric_name(name, key)
+                gauges.setdefault(metric, []).append(f"{metric}{_format_labels(labels)} {value:g}")
+        for metric in sorted(gauges):
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(gauges[metric])
+        return "\n".join(lines) + "\n"
+
+    def flush(self, path: Optional[str] = None) -> Optional[str]:
+        """
+        把缓冲的计时事件和一行汇总写入JSON日志（每行一个JSON对象）
+
+        Args:
+            path: 日志路径，默认使用 log_path
+
+        Returns:
+            写入的路径，没有日志路径时返回None
+        """
+        path = path or self.log_path
+        if not path:
+            return None
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                summary = dict(self.snapshot(), time=round(time.time(), 3), type="snapshot")
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"写入性能日志失败: {str(e)}")
+            return None
+        return path
+
+
+# 进程级共享实例，各模块和页面、API服务使用同一份统计
+instrumentation = Instrumentation(INSTRUMENTATION_ENABLED, INSTRUMENTATION_LOG if INSTRUMENTATION_ENABLED else None)
+
+span = instrumentation.span
+timed = instrumentation.timed
@@ -0,0 +1,185 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from config import JOB_WORKERS, JOB_RETENTION_SECONDS
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """后台任务的状态快照"""
+
+    def __init__(self, kind: str, owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def elapsed(self) -> float:
+        """已运行时间（秒）"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def snapshot(self) -> "Job":
+        copied = Job.__new__(Job)
+        copied.__dict__.update(self.__dict__)
+        return copied
+
+
+class JobStore:
+    """本地任务存储，保存所有任务的状态与产物"""
+
+    def __init__(self, retention_seconds: float = JOB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务快照，不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def update(self, job_id: str, **fields) -> bool:
+        """更新任务字段，返回任务是否存在"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            for key, value in fields.items():
+                setattr(job, key, value)
+            return True
+
+    def list(self, owner: Optional[str] = None) -> List[Job]:
+        """按创建时间倒序列出任务"""
+        with self._lock:
+            jobs = [job.snapshot() for job in self._jobs.values()
+                    if owner is None or job.owner == owner]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def prune(self):
+        """清理超过保留时间的已完成任务"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and (job.finished_at or 0) < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class JobContext:
+    """传给任务函数的上下文，用于汇报进度和检查取消"""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self._store = store
+        self.job_id = job_id
+
+    def set_progress(self, progress: float, message: str = ""):
+        self._store.update(self.job_id, progress=max(0.0, min(1.0, progress)), message=message)
+
+    @property
+    def cancelled(self) -> bool:
+        job = self._store.get(self.job_id)
+        return job is None or job.status == CANCELLED
+
+
+class JobQueue:
+    """
+    后台任务队列：渲染或AI任务提交到线程池执行，状态保存在 JobStore 中，
+    UI 通过任务ID轮询进度和产物，Streamlit 重跑脚本不影响正在执行的任务
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, store: Optional[JobStore] = None):
+        self.store = store or JobStore()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, kind: str, func: Callable[..., Any], *args, owner: Optional[str] = None, **kwargs) -> str:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型，如 render、ai_image、detail_layout
+            func: 任务函数，第一个参数为 JobContext
+            owner: 任务所属会话
+
+        Returns:
+            任务ID
+        """
+        self.store.prune()
+        job = Job(kind, owner)
+        self.store.add(job)
+        self._executor.submit(self._run, job.id, func, args, kwargs)
+        return job.id
+
+    def _run(self, job_id: str, func: Callable[..., Any], args, kwargs):
+        job = self.store.get(job_id)
+        if job is None or job.status == CANCELLED:
+            return
+
+        self.store.update(job_id, status=RUNNING, started_at=time.time())
+        context = JobContext(self.store, job_id)
+        try:
+            result = func(context, *args, **kwargs)
+        except Exception as e:
+            print(f"后台任务失败: {str(e)}")
+            traceback.print_exc()
+            self.store.update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            return
+
+        if context.cancelled:
+            self.store.update(job_id, finished_at=time.time())
+        else:
+            self.store.update(job_id, status=DONE, progress=1.0, result=result, finished_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：排队中的任务不再执行，运行中的任务结果将被丢弃"""
+        job = self.store.get(job_id)
+        if job is None or job.finished:
+            return False
+        return self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[Job]:
+        return self.store.list(owner)
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """获取进程级共享的任务队列，所有会话共用同一个工作线程池"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
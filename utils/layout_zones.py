@@ -0,0 +1,180 @@
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import ZONE_ANALYSIS_MAX_SIDE
+
+# 区域 -> (用途, 候选框中心所在的纵向范围, 候选框高度占图片高度的比例, 偏好的纵向位置)
+ZONE_SPECS = {
+    "header": ("标题区域", (0.0, 0.5), (0.12, 0.16, 0.2, 0.25), 0.0),
+    "main": ("主要内容区域", (0.2, 0.8), (0.15, 0.2, 0.3, 0.4, 0.5), 0.5),
+    "footer": ("底部信息区域", (0.5, 1.0), (0.12, 0.16, 0.2, 0.25), 1.0),
+}
+# 候选框宽度占图片宽度的比例
+WIDTH_FRACTIONS = (0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+# 评分 = 框内平均显著度 + AREA_WEIGHT × (1 - 面积/最大候选面积) + POSITION_WEIGHT × 与偏好位置的距离
+AREA_WEIGHT = 0.15
+POSITION_WEIGHT = 0.05
+# 梯度幅值归一化的下限，纯色模板不会把噪声放大成显著区域
+_EDGE_FLOOR = 40.0
+
+
+def _border_background(lab: np.ndarray) -> np.ndarray:
+    """
+    用边框像素拟合背景：每个通道拟合一个平面，纯色背景和线性渐变背景都能还原，
+    去掉偏差最大的一半边框像素（贴边的商品）后再拟合一次
+    """
+    height, width = lab.shape[:2]
+    ys, xs = np.mgrid[0:height, 0:width]
+    border = np.zeros((height, width), bool)
+    border[[0, -1], :] = True
+    border[:, [0, -1]] = True
+    design = np.stack([xs[border], ys[border], np.ones(int(border.sum()))], axis=1).astype(np.float32)
+    values = lab[border]
+    keep = np.ones(len(values), bool)
+    for _ in range(2):
+        coefficients, *_ = np.linalg.lstsq(design[keep], values[keep], rcond=None)
+        residual = np.abs(values - design @ coefficients).sum(axis=1)
+        keep = residual <= np.median(residual)
+    grid = np.stack([xs, ys, np.ones_like(xs)], axis=-1).astype(np.float32)
+    return grid @ coefficients
+
+
+class SaliencyMap:
+    """
+    显著度图及其积分图：任意矩形内的显著度之和只需查4个值，
+    候选框以数组形式一次性求值
+    """
+
+    def __init__(self, saliency: np.ndarray):
+        self.saliency = saliency
+        self.height, self.width = saliency.shape
+        self.integral = cv2.integral(saliency, sdepth=cv2.CV_64F)
+
+    @classmethod
+    def from_image(cls, image_array: np.ndarray, max_side: int = ZONE_ANALYSIS_MAX_SIDE) -> Tuple["SaliencyMap", float]:
+        """
+        在缩小的图片上计算显著度：边缘密度与偏离边框拟合背景的程度取较大值，范围 0-1
+
+        Args:
+            image_array: 图片像素数组 (高, 宽, 通道)
+            max_side: 计算显著度时的最长边
+
+        Returns:
+            (显著度图, 原图相对显著度图的缩放比例)
+        """
+        height, width = image_array.shape[:2]
+        scale = min(1.0, max_side / max(height, width))
+        rgb = np.ascontiguousarray(image_array[..., :3])
+        if scale < 1.0:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+
+        gray = cv2.GaussianBlur(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY), (3, 3), 0).astype(np.float32)
+        magnitude = cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+        # 边缘在邻域内铺开，纹理和文字形成连续的显著区域
+        window = max(3, min(rgb.shape[:2]) // 24 | 1)
+        edges = cv2.blur(magnitude, (window, window))
+        edges /= max(float(np.percentile(edges, 99)), _EDGE_FLOOR)
+
+        # 与背景差别大的像素（白底上的商品）也是显著的
+        lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB).astype(np.float32)
+        distance = np.linalg.norm(lab - _border_background(lab), axis=2)
+        distance = cv2.blur(distance, (window, window)) / 64.0
+
+        saliency = np.clip(np.maximum(edges, distance), 0.0, 1.0).astype(np.float32)
+        return cls(saliency), 1.0 / scale
+
+    def box_means(self, x0: np.ndarray, y0: np.ndarray, x1: np.ndarray, y1: np.ndarray) -> np.ndarray:
+        """
+        批量计算矩形 [x0, x1) × [y0, y1) 内的平均显著度
+
+        Args:
+            x0, y0, x1, y1: 整数坐标数组
+
+        Returns:
+            每个矩形的平均显著度
+        """
+        integral = self.integral
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return sums / np.maximum((x1 - x0) * (y1 - y0), 1)
+
+
+def _candidates(width: int, height: int, spec, stride: int, top: int = 0,
+                bottom: Optional[int] = None) -> Tuple[np.ndarray, ...]:
+    """
+    生成某个区域的全部候选框（显著度图坐标）：框在 [top, bottom) 的纵向范围内，
+    中心落在区域规定的纵向比例范围内
+    """
+    _, (low, high), heights, _ = spec
+    bottom = height if bottom is None else bottom
+    box_w = np.unique(np.maximum(1, np.round(np.array(WIDTH_FRACTIONS) * width)).astype(np.int64))
+    box_h = np.unique(np.clip(np.round(np.array(heights) * height), 1, max(bottom - top, 1)).astype(np.int64))
+    xs = np.arange(0, width, stride)
+    ys = np.arange(top, bottom, stride)
+
+    w, h, x0, y0 = (grid.ravel() for grid in np.meshgrid(box_w, box_h, xs, ys, indexing="ij"))
+    # 超出右边、下边的候选框移回边界内，贴边的位置也包含在内
+    x0 = np.minimum(x0, width - w)
+    y0 = np.maximum(np.minimum(y0, bottom - h), top)
+    center = (y0 + h / 2) / height
+    keep = (center >= low) & (center <= high)
+    x0, y0, w, h = x0[keep], y0[keep], w[keep], h[keep]
+    return x0, y0, x0 + w, y0 + h
+
+
+def detect_layout_zones(image_array: np.ndarray, max_side: int = ZONE_ANALYSIS_MAX_SIDE,
+                        stride: Optional[int] = None) -> Dict:
+    """
+    按显著度选择标题区、主体区和底部区：在每个区域的候选框中选平均显著度低、
+    面积大的位置，避开商品和图案
+
+    依次确定标题区、底部区和主体区，主体区限制在两者之间，保证从上到下的阅读顺序。
+    纯色模板上结果与固定的上1/4、中1/2、下1/4划分相同。
+
+    Args:
+        image_array: 模板像素数组 (高, 宽, 通道)
+        max_side: 计算显著度时的最长边
+        stride: 候选框的步长（显著度图像素），默认为短边的1/32
+
+    Returns:
+        与 layout_zones 结构相同的区域字典，另有 saliency（框内平均显著度）和 candidates（候选框数量）
+    """
+    height, width = image_array.shape[:2]
+    saliency, scale = SaliencyMap.from_image(image_array, max_side)
+    map_w, map_h = saliency.width, saliency.height
+    stride = stride or max(1, min(map_w, map_h) // 32)
+
+    chosen: Dict[str, Tuple[int, int, int, int, float, int]] = {}
+    for name in ("header", "footer", "main"):
+        spec = ZONE_SPECS[name]
+        if name == "main" and chosen["header"][3] < chosen["footer"][1]:
+            # 主体区夹在标题区和底部区之间，不与两者重叠
+            x0, y0, x1, y1 = _candidates(map_w, map_h, spec, stride, chosen["header"][3], chosen["footer"][1])
+            if not len(x0):
+                x0, y0, x1, y1 = _candidates(map_w, map_h, spec, stride)
+        else:
+            x0, y0, x1, y1 = _candidates(map_w, map_h, spec, stride)
+        area = (x1 - x0) * (y1 - y0)
+        means = saliency.box_means(x0, y0, x1, y1)
+        offset = np.abs((y0 + y1) / 2 / map_h - spec[3])
+        score = means + AREA_WEIGHT * (1.0 - area / area.max()) + POSITION_WEIGHT * offset
+        best = int(np.argmin(score))
+        chosen[name] = (int(x0[best]), int(y0[best]), int(x1[best]), int(y1[best]), float(means[best]), len(score))
+
+    zones = {}
+    for name, (purpose, *_) in ZONE_SPECS.items():
+        x0, y0, x1, y1, mean, count = chosen[name]
+        # 换回原图坐标，贴边的框仍然贴边
+        left, top = int(round(x0 * scale)), int(round(y0 * scale))
+        right = width if x1 == map_w else int(round(x1 * scale))
+        bottom = height if y1 == map_h else int(round(y1 * scale))
+        zones[name] = {
+            "x": left, "y": top,
+            "width": right - left, "height": bottom - top,
+            "purpose": purpose,
+            "saliency": round(mean, 4),
+            "candidates": count,
+        }
+    return zones
@@ -0,0 +1,211 @@
+import io
+import math
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import IMAGE_SIZES
+from utils.text_layout import TextLayoutEngine, scale_style
+
+Bounds = Tuple[float, float, float, float]
+
+_MIME_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+# 裁剪时文字外保留的边距（占渲染图短边的比例）
+TEXT_MARGIN = 0.02
+
+
+def _covers(source: Tuple[int, int], target: Tuple[int, int]) -> bool:
+    """source 裁剪到 target 的宽高比后仍不小于 target，即不需要放大"""
+    scale = max(target[0] / source[0], target[1] / source[1])
+    return scale <= 1.0
+
+
+class MultiSizeExporter:
+    """
+    多尺寸导出：只在最大尺寸上渲染一次，较小的尺寸依次由上一级缩小得到
+
+    各尺寸按面积从大到小排列，每个尺寸从已生成的、能覆盖它且最小的图片缩小并居中裁剪，
+    避免每个尺寸都从全分辨率缩放；全部尺寸在线程池中并行编码。
+    裁剪不会切到文字：裁剪窗口先平移到包含全部文字，文字比窗口还宽（或高）时改为
+    完整缩小并用边缘颜色补边（letterbox）。
+    """
+
+    def __init__(self, sizes: Dict[str, Tuple[int, int]] = None, format: str = "PNG",
+                 max_workers: Optional[int] = None):
+        self.sizes = dict(sizes or IMAGE_SIZES)
+        self.format = format
+        self.max_workers = max_workers or len(self.sizes)
+
+    def master_size(self, template_size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        计算渲染尺寸：保持模板宽高比，刚好能覆盖所有目标尺寸
+
+        Args:
+            template_size: 模板尺寸
+
+        Returns:
+            渲染尺寸
+        """
+        width, height = template_size
+        scale = max(max(w / width, h / height) for w, h in self.sizes.values())
+        return math.ceil(width * scale), math.ceil(height * scale)
+
+    def render_master(self, image_processor, template: Image.Image, texts: Dict,
+                      style_config: Dict, layout: Dict = None) -> Image.Image:
+        """把模板放大到渲染尺寸后渲染一次，字号按同样比例放大，版式与原尺寸一致"""
+        master_size = self.master_size(template.size)
+        scale = master_size[0] / template.width
+        if master_size != template.size:
+            # 放大时使用 BICUBIC，比 LANCZOS 快约三成
+            resample = Image.BICUBIC if scale > 1 else Image.LANCZOS
+            template = template.resize(master_size, resample)
+        return image_processor.render_text_on_template(template, texts, scale_style(style_config, scale), layout)
+
+    def text_bounds(self, texts: Dict, style_config: Dict, template_size: Tuple[int, int],
+                    layout: Dict = None) -> Optional[Bounds]:
+        """
+        计算渲染尺寸上全部文字的范围，与 render_master 的排版一致
+
+        Returns:
+            (x0, y0, x1, y1)，没有文字时为None
+        """
+        master_size = self.master_size(template_size)
+        scale = master_size[0] / template_size[0]
+        elements = TextLayoutEngine().elements(texts, scale_style(style_config, scale), master_size, layout)
+        boxes = [element.bounds() for element in elements if element.runs]
+        if not boxes:
+            return None
+        # 留出少量边距，裁剪边缘不紧贴文字
+        margin = round(min(master_size) * TEXT_MARGIN)
+        return (max(0, min(b[0] for b in boxes) - margin), max(0, min(b[1] for b in boxes) - margin),
+                min(master_size[0], max(b[2] for b in boxes) + margin),
+                min(master_size[1], max(b[3] for b in boxes) + margin))
+
+    def derive(self, master: Image.Image, text_box: Optional[Bounds] = None) -> Dict[str, Image.Image]:
+        """
+        按面积从大到小依次生成各尺寸
+
+        Args:
+            master: 渲染好的最大图
+            text_box: 最大图上文字的范围（可选），裁剪时保证不切到文字
+
+        Returns:
+            尺寸名称到图片的映射
+        """
+        # (图片, 图片上文字的范围)；补边的图片不再作为更小尺寸的来源
+        chain: List[Tuple[Image.Image, Optional[Bounds]]] = [(master, text_box)]
+        images = {}
+        for name, size in sorted(self.sizes.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+            # 从后往前找能覆盖目标尺寸的最小图片，通常就是上一级
+            source, box = next((entry for entry in reversed(chain) if _covers(entry[0].size, size)),
+                               (master, text_box))
+            image, box = self._fit(source, tuple(size), box)
+            if box is None and text_box is not None and source is not master:
+                # 需要补边时从最大图补边，不在已经裁剪过的图上再补
+                image, box = self._fit(master, tuple(size), text_box)
+            images[name] = image
+            if box is not None or text_box is None:
+                chain.append((image, box))
+        return images
+
+    @staticmethod
+    def _fit(source: Image.Image, size: Tuple[int, int],
+             text_box: Optional[Bounds] = None) -> Tuple[Image.Image, Optional[Bounds]]:
+        """
+        缩小并裁剪到目标尺寸，裁剪窗口默认居中，有文字时平移到包含全部文字
+
+        Returns:
+            (图片, 新图上文字的范围)；文字放不进裁剪窗口时返回补边的图片和None
+        """
+        scale = max(size[0] / source.width, size[1] / source.height)
+        crop_width, crop_height = size[0] / scale, size[1] / scale
+        left = (source.width - crop_width) / 2
+        top = (source.height - crop_height) / 2
+        if text_box is not None:
+            x0, y0, x1, y1 = text_box
+            if x1 - x0 > crop_width + 0.5 or y1 - y0 > crop_height + 0.5:
+                return MultiSizeExporter._letterbox(source, size), None
+            left = min(max(left, x1 - crop_width), x0)
+            top = min(max(top, y1 - crop_height), y0)
+
+        if scale == 1.0:
+            left, top = round(left), round(top)
+            image = source.crop((left, top, left + size[0], top + size[1]))
+        else:
+            image = source.resize(size, Image.LANCZOS, box=(left, top, left + crop_width, top + crop_height))
+        if text_box is None:
+            return image, None
+        return image, ((x0 - left) * scale, (y0 - top) * scale, (x1 - left) * scale, (y1 - top) * scale)
+
+    @staticmethod
+    def _letterbox(source: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """完整缩小到目标尺寸以内，居中放置，空白处用补边方向上的边缘平均颜色填充"""
+        scale = min(size[0] / source.width, size[1] / source.height)
+        width = min(size[0], max(1, round(source.width * scale)))
+        height = min(size[1], max(1, round(source.height * scale)))
+        pixels = np.asarray(source)
+        # 上下补边取首末两行，左右补边取首末两列
+        edges = pixels[[0, -1]] if height < size[1] else pixels[:, [0, -1]]
+        color = edges.reshape(-1, *pixels.shape[2:]).mean(axis=0).round().astype(int)
+        canvas = Image.new(source.mode, size, tuple(color.tolist()) if color.ndim else int(color))
+        canvas.paste(source.resize((width, height), Image.LANCZOS),
+                     ((size[0] - width) // 2, (size[1] - height) // 2))
+        return canvas
+
+    def encode_all(self, images: Dict[str, Image.Image]) -> Dict[str, bytes]:
+        """在线程池中并行编码所有尺寸"""
+
+        def encode(image: Image.Image) -> bytes:
+            buffer = io.BytesIO()
+            if self.format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(buffer, format=self.format)
+            return buffer.getvalue()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="encode") as pool:
+            futures = {name: pool.submit(encode, image) for name, image in images.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def export(self, image_processor, template: Image.Image, texts: Dict, style_config: Dict,
+               layout: Dict = None) -> Dict[str, bytes]:
+        """
+        渲染一次并导出全部尺寸
+
+        Args:
+            image_processor: 图片处理器
+            template: 模板图片
+            texts: 文字内容
+            style_config: 样式配置
+            layout: 模板分析结果（可选），区域按渲染尺寸等比换算
+
+        Returns:
+            尺寸名称到编码后字节的映射
+        """
+        _, images = self.render_all(image_processor, template, texts, style_config, layout)
+        return self.encode_all(images)
+
+    def render_all(self, image_processor, template: Image.Image, texts: Dict, style_config: Dict,
+                   layout: Dict = None) -> Tuple[Image.Image, Dict[str, Image.Image]]:
+        """
+        渲染一次并生成全部尺寸，同时返回渲染好的最大图，调用方需要原尺寸主图时由它缩小得到
+
+        Returns:
+            (最大图, 尺寸名称到图片的映射)
+        """
+        master = self.render_master(image_processor, template, texts, style_config, layout)
+        return master, self.derive(master, self.text_bounds(texts, style_config, template.size, layout))
+
+    def file_name(self, name: str, prefix: str = "main_image") -> str:
+        size = self.sizes[name]
+        return f"{prefix}_{name}_{size[0]}x{size[1]}.{_MIME_EXTENSIONS.get(self.format, self.format.lower())}"
+
+    def to_zip(self, files: Dict[str, bytes], prefix: str = "main_image") -> bytes:
+        """把各尺寸打包为zip，图片已压缩，zip中只存储不再压缩"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+            for name, data in files.items():
+                archive.writestr(self.file_name(name, prefix), data)
+        return buffer.getvalue()
@@ -0,0 +1,263 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# 计算哈希用的灰度缩略图边长，pHash 取其DCT左上角 8×8 的低频系数
+_THUMBNAIL_SIDE = 32
+_HASH_SIDE = 8
+# 每个字节中1的个数，数组形式的汉明距离按字节查表求和
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """正交DCT-II矩阵，D @ X @ D.T 即二维DCT，可以对一批缩略图一次计算"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(_THUMBNAIL_SIDE)[:_HASH_SIDE]
+
+
+def thumbnail(image: Image.Image, side: int = _THUMBNAIL_SIDE) -> np.ndarray:
+    """缩小为 side × side 的灰度数组，大图先按整数倍缩小"""
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    array = np.asarray(image.convert("L").resize((side, side), Image.BILINEAR, reducing_gap=2.0))
+    return array.astype(np.float32)
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """把 (N, 64) 的布尔数组打包成 N 个64位整数"""
+    return np.packbits(bits.astype(np.uint8), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def phash_thumbnails(thumbnails: np.ndarray) -> np.ndarray:
+    """
+    批量计算pHash：DCT低频系数与其中位数比较
+
+    Args:
+        thumbnails: (N, 32, 32) 灰度缩略图
+
+    Returns:
+        N 个64位哈希（uint64 数组）
+    """
+    low = _DCT @ thumbnails @ _DCT.T
+    flat = low.reshape(len(thumbnails), -1)
+    # 直流分量只反映整体亮度，不参与中位数
+    median = np.median(flat[:, 1:], axis=1, keepdims=True)
+    return _pack(flat > median)
+
+
+def dhash_thumbnails(thumbnails: np.ndarray) -> np.ndarray:
+    """
+    批量计算dHash：缩小到 9×8 后比较横向相邻像素
+
+    Args:
+        thumbnails: (N, 高, 宽) 灰度缩略图
+
+    Returns:
+        N 个64位哈希（uint64 数组）
+    """
+    resized = np.stack([cv2.resize(thumb, (_HASH_SIDE + 1, _HASH_SIDE), interpolation=cv2.INTER_AREA)
+                        for thumb in thumbnails])
+    return _pack((resized[:, :, 1:] > resized[:, :, :-1]).reshape(len(thumbnails), -1))
+
+
+def phash(image: Image.Image) -> int:
+    """计算单张图片的pHash"""
+    return int(phash_thumbnails(thumbnail(image)[None])[0])
+
+
+def dhash(image: Image.Image) -> int:
+    """计算单张图片的dHash"""
+    return int(dhash_thumbnails(thumbnail(image)[None])[0])
+
+
+def hamming(a: int, b: int) -> int:
+    """两个哈希的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+def hamming_many(query: int, hashes: np.ndarray) -> np.ndarray:
+    """一个哈希与一组哈希的汉明距离"""
+    xor = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(query))
+    return _POPCOUNT[xor.view(np.uint8)].reshape(len(xor), 8).sum(axis=1)
+
+
+class MultiIndexHash:
+    """
+    汉明距离近邻索引（多索引哈希）：64位哈希切成 max_distance + 1 段，每段建一个哈希表。
+    距离不超过 max_distance 的两个哈希至少有一段完全相同（抽屉原理），
+    查询时只需取出各段完全相同的候选，再逐个核对距离。
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        bounds = np.linspace(0, 64, max_distance + 2).astype(int)
+        self._segments = [(int(low), (1 << int(high - low)) - 1) for low, high in zip(bounds[:-1], bounds[1:])]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._segments]
+        self._hashes: List[int] = []
+        self._values: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, hash_value: int, value: Any = None):
+        """加入一个哈希"""
+        slot = len(self._hashes)
+        self._hashes.append(hash_value)
+        self._values.append(value)
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            table.setdefault((hash_value >> shift) & mask, []).append(slot)
+
+    def search(self, hash_value: int, max_distance: Optional[int] = None) -> List[Tuple[int, int, Any]]:
+        """
+        查找距离不超过 max_distance（不能大于建索引时的值）的全部哈希
+
+        Returns:
+            (距离, 哈希, 值) 列表，按距离从小到大排列
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            candidates.update(table.get((hash_value >> shift) & mask, ()))
+        results = []
+        for slot in candidates:
+            distance = hamming(hash_value, self._hashes[slot])
+            if distance <= max_distance:
+                results.append((distance, slot, self._hashes[slot], self._values[slot]))
+        # 距离相同时先加入的在前
+        results.sort(key=lambda result: result[:2])
+        return [(distance, hash_value, value) for distance, _, hash_value, value in results]
+
+
+class PerceptualIndex:
+    """
+    近似重复图片索引：pHash 放进多索引哈希表，查询汉明距离最近的已有图片
+
+    同时比较缩略图的平均颜色，只换了配色的模板不会被当成重复；
+    超出容量时丢弃最早加入的图片并重建索引。
+    """
+
+    def __init__(self, max_distance: int, max_entries: int = 1024, color_tolerance: float = 8.0):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.color_tolerance = color_tolerance
+        # 键 -> (pHash, 平均颜色, 值)
+        self._entries: "OrderedDict[Any, Tuple[int, np.ndarray, Any]]" = OrderedDict()
+        self._index = MultiIndexHash(max_distance)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(image: Image.Image) -> Tuple[int, np.ndarray]:
+        """图片的 (pHash, 平均颜色)"""
+        rgb = image if image.mode == "RGB" else image.convert("RGB")
+        small = rgb.resize((_THUMBNAIL_SIDE, _THUMBNAIL_SIDE), Image.BILINEAR, reducing_gap=2.0)
+        color = np.asarray(small, dtype=np.float32)
+        gray = color @ np.array([0.299, 0.587, 0.114], np.float32)
+        return int(phash_thumbnails(gray[None])[0]), color.reshape(-1, 3).mean(axis=0)
+
+    def add(self, key: Any, image: Image.Image, value: Any = None, signature: Tuple[int, np.ndarray] = None):
+        """
+        加入一张图片
+
+        Args:
+            key: 图片的标识，重复加入同一个键时覆盖
+            image: 图片
+            value: 与图片一起保存的值
+            signature: 已经算好的 signature(image)（可选）
+        """
+        hash_value, color = signature or self.signature(image)
+        with self._lock:
+            rebuild = key in self._entries
+            self._entries[key] = (hash_value, color, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                rebuild = True
+            if rebuild:
+                self._index = MultiIndexHash(self.max_distance)
+                for entry_key, (entry_hash, _, _) in self._entries.items():
+                    self._index.add(entry_hash, entry_key)
+            else:
+                self._index.add(hash_value, key)
+
+    def nearest(self, image: Image.Image, signature: Tuple[int, np.ndarray] = None,
+                accept: Callable[[Any], bool] = None) -> Optional[Dict]:
+        """
+        查找最相近的已有图片
+
+        Args:
+            image: 图片
+            signature: 已经算好的 signature(image)（可选）
+            accept: 对保存的值做额外检查（可选），返回False的图片不算匹配
+
+        Returns:
+            {"key", "distance", "value"}，没有足够相近的图片时返回None
+        """
+        hash_value, color = signature or self.signature(image)
+        with self._lock:
+            for distance, _, key in self._index.search(hash_value, self.max_distance):
+                _, entry_color, value = self._entries[key]
+                if np.abs(entry_color - color).max() <= self.color_tolerance and (accept is None or accept(value)):
+                    return {"key": key, "distance": distance, "value": value}
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index = MultiIndexHash(self.max_distance)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def group_near_duplicates(hashes: Sequence[int], max_distance: int) -> List[List[int]]:
+    """
+    把一组哈希按近似重复分组：每组以最早出现的图片为代表，
+    与代表的距离不超过 max_distance 的后续图片归入该组
+
+    Args:
+        hashes: 哈希列表
+        max_distance: 最大汉明距离
+
+    Returns:
+        包含两张以上图片的分组（下标列表），每组第一个是代表
+    """
+    tree = MultiIndexHash(max_distance)
+    groups: Dict[int, List[int]] = {}
+    for index, hash_value in enumerate(hashes):
+        matches = tree.search(hash_value, max_distance)
+        if matches:
+            groups[matches[0][2]].append(index)
+        else:
+            tree.add(hash_value, index)
+            groups[index] = [index]
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def hash_files(paths: Iterable[str]) -> List[Optional[int]]:
+    """批量计算图片文件的pHash，无法读取的文件为None"""
+    thumbnails, positions = [], []
+    paths = list(paths)
+    for position, path in enumerate(paths):
+        try:
+            with Image.open(path) as image:
+                image.draft("L", (_THUMBNAIL_SIDE * 2, _THUMBNAIL_SIDE * 2))
+                thumbnails.append(thumbnail(image))
+            positions.append(position)
+        except Exception as e:
+            print(f"计算图片哈希失败: {str(e)}")
+    hashes: List[Optional[int]] = [None] * len(paths)
+    if thumbnails:
+        for position, value in zip(positions, phash_thumbnails(np.stack(thumbnails))):
+            hashes[position] = int(value)
+    return hashes
@@ -0,0 +1,320 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+
+from config import PIPELINE_CACHE_SIZE, PIPELINE_WORKERS
+from utils.analysis_cache import AnalysisCache, hash_inputs
+from utils.instrumentation import instrumentation
+from utils.single_flight import SingleFlight
+
+
+class _ReleasableOutput:
+    """带释放函数的阶段输出，缓存条目被淘汰时调用 release(value)"""
+
+    __slots__ = ("value", "release")
+
+    def __init__(self, value: Any, release: Callable[[Any], None]):
+        self.value = value
+        self.release = release
+
+
+def release_output(key: Any, value: Any):
+    """阶段输出缓存的淘汰回调：释放输出关联的资源（例如删除长图文件）"""
+    if isinstance(value, _ReleasableOutput):
+        value.release(value.value)
+
+
+# 进程级共享的阶段输出缓存，所有会话的流水线共用
+shared_pipeline_cache = AnalysisCache(PIPELINE_CACHE_SIZE, on_evict=release_output)
+instrumentation.register_collector("cache", shared_pipeline_cache.get_stats, {"cache": "pipeline"})
+
+# 不同会话同时计算同一个阶段（键相同）时只执行一次
+_stage_flight = SingleFlight()
+
+
+class PipelineError(ValueError):
+    """流水线定义错误：重复的阶段、缺少输入或循环依赖"""
+
+
+class Stage:
+    """
+    流水线中的一个阶段：按 inputs 的顺序接收外部输入或上游阶段的输出，返回一个值
+
+    Args:
+        name: 阶段名称，也是输出的名称
+        func: 阶段函数
+        inputs: 输入名称，可以是外部输入，也可以是其他阶段
+        version: 阶段实现的版本，修改实现后递增，旧的缓存不再命中
+        cache: 是否缓存输出；读取资源仓库这类廉价、结果可能过期的阶段不缓存
+        is_valid: 检查缓存的输出是否仍然可用（可选），例如输出是文件路径时文件是否还在
+        release: 缓存的输出被淘汰时释放其资源（可选），例如删除输出的文件；
+                 需要缓存以 on_evict=release_output 创建，共享缓存默认如此
+    """
+
+    def __init__(self, name: str, func: Callable[..., Any], inputs: Sequence[str] = (), version: int = 1,
+                 cache: bool = True, is_valid: Callable[[Any], bool] = None,
+                 release: Callable[[Any], None] = None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.version = version
+        self.cache = cache
+        self.is_valid = is_valid
+        self.release = release
+
+
+class PipelineRun:
+    """一次运行的结果：各阶段的输出、缓存键和耗时"""
+
+    def __init__(self):
+        self.outputs: Dict[str, Any] = {}
+        self.keys: Dict[str, str] = {}
+        # 阶段 -> {"seconds", "cached", "level"}，只包含本次用到的阶段
+        self.timings: Dict[str, Dict] = {}
+        self.seconds = 0.0
+
+    def __getitem__(self, name: str) -> Any:
+        return self.outputs[name]
+
+    @property
+    def executed(self) -> List[str]:
+        """实际执行了的阶段"""
+        return [name for name, timing in self.timings.items() if not timing["cached"]]
+
+    @property
+    def cached(self) -> List[str]:
+        """直接使用缓存输出的阶段"""
+        return [name for name, timing in self.timings.items() if timing["cached"]]
+
+
+def format_timings(timings: Dict[str, Dict]) -> str:
+    """阶段耗时的简短说明，例如 "selling_points 12ms · main_image 缓存" """
+    parts = []
+    for name, timing in timings.items():
+        parts.append(f"{name} 缓存" if timing["cached"] else f"{name} {timing['seconds'] * 1000:.0f}ms")
+    return " · ".join(parts)
+
+
+class Pipeline:
+    """
+    按依赖关系执行的阶段流水线
+
+    每个阶段的缓存键由阶段名、版本和各输入的键哈希得到，外部输入的键是其内容哈希
+    （调用方也可以直接提供，例如资源仓库的键）。因此只需比较键就能知道哪些阶段的输入变了，
+    不必对上游的大对象重新哈希；输入没变的阶段直接使用缓存，只有变化的输入下游的阶段重新执行，
+    下游全部命中缓存时上游阶段也不会执行。
+
+    依赖层级相同的阶段互不依赖，同一层需要执行的多个阶段在线程池中并行执行。
+    缓存的输出在会话之间共享，阶段函数和调用方都不能原地修改输出。
+    """
+
+    def __init__(self, name: str, salt: Any = None, cache: AnalysisCache = None,
+                 max_workers: int = PIPELINE_WORKERS):
+        """
+        Args:
+            name: 流水线名称，是缓存键的一部分
+            salt: 影响所有阶段结果的额外状态（例如违禁词库），变化后旧的缓存不再命中
+            cache: 阶段输出缓存，默认使用进程级共享缓存
+            max_workers: 同一层并行执行的最大阶段数
+        """
+        self.name = name
+        self.salt = salt
+        self.cache = shared_pipeline_cache if cache is None else cache
+        self.max_workers = max_workers
+        self._stages: Dict[str, Stage] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, func: Callable[..., Any], inputs: Sequence[str] = (), **options) -> "Pipeline":
+        """
+        添加阶段，参数见 Stage
+
+        Raises:
+            PipelineError: 阶段名称重复
+        """
+        with self._lock:
+            if name in self._stages:
+                raise PipelineError(f"阶段重复: {name}")
+            self._stages[name] = Stage(name, func, inputs, **options)
+        return self
+
+    def stage(self, name: str, inputs: Sequence[str] = (), **options) -> Callable:
+        """add 的装饰器形式"""
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            self.add(name, func, inputs, **options)
+            return func
+        return decorator
+
+    @property
+    def stages(self) -> List[str]:
+        return list(self._stages)
+
+    def external_inputs(self, targets: Iterable[str] = None) -> List[str]:
+        """计算 targets（默认全部阶段）需要的外部输入"""
+        needed = set()
+        for level in self.plan(targets):
+            for name in level:
+                needed.update(i for i in self._stages[name].inputs if i not in self._stages)
+        return sorted(needed)
+
+    def downstream(self, name: str) -> List[str]:
+        """直接或间接依赖某个输入或阶段的全部阶段，即它变化后需要重新执行的阶段"""
+        affected = {name}
+        for level in self.plan():
+            for stage in level:
+                if affected.intersection(self._stages[stage].inputs):
+                    affected.add(stage)
+        affected.discard(name)
+        return [stage for stage in self._stages if stage in affected]
+
+    def plan(self, targets: Iterable[str] = None) -> List[List[str]]:
+        """
+        按依赖层级排列 targets（默认全部阶段）及其上游阶段
+
+        Returns:
+            层级列表，每层的阶段只依赖前面各层的阶段
+
+        Raises:
+            PipelineError: 未知的目标阶段或存在循环依赖
+        """
+        targets = list(self._stages) if targets is None else list(targets)
+        depth: Dict[str, int] = {}
+        visiting = set()
+
+        def visit(name: str) -> int:
+            if name in depth:
+                return depth[name]
+            if name in visiting:
+                raise PipelineError(f"循环依赖: {name}")
+            visiting.add(name)
+            upstream = [visit(i) for i in self._stages[name].inputs if i in self._stages]
+            visiting.discard(name)
+            depth[name] = max(upstream, default=-1) + 1
+            return depth[name]
+
+        for target in targets:
+            if target not in self._stages:
+                raise PipelineError(f"未知的阶段: {target}")
+            visit(target)
+
+        levels: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        # 同一层内保持添加顺序
+        for name in self._stages:
+            if name in depth:
+                levels[depth[name]].append(name)
+        return levels
+
+    def run(self, inputs: Dict[str, Any], targets: Iterable[str] = None, keys: Dict[str, str] = None,
+            progress: Callable[[float, str], None] = None) -> PipelineRun:
+        """
+        运行流水线，得到 targets（默认全部阶段）的输出
+
+        Args:
+            inputs: 外部输入的值
+            targets: 需要的阶段
+            keys: 外部输入已知的内容键（可选），提供后不再对该输入求哈希
+            progress: 进度回调 (0-1 的进度, 说明)，每完成一个阶段调用一次（可选）
+
+        Returns:
+            运行结果，outputs 包含目标阶段和本次执行过的上游阶段的输出
+
+        Raises:
+            PipelineError: 缺少外部输入或依赖关系有误
+        """
+        start = time.perf_counter()
+        levels = self.plan(targets)
+        targets = set(self._stages if targets is None else targets)
+        keys = dict(keys or {})
+        run = PipelineRun()
+
+        # 先只用键自上而下推出每个阶段的缓存键，不需要任何阶段的输出
+        for level in levels:
+            for name in level:
+                stage = self._stages[name]
+                input_keys = []
+                for input_name in stage.inputs:
+                    if input_name in self._stages:
+                        input_keys.append(run.keys[input_name])
+                        continue
+                    if input_name not in inputs:
+                        raise PipelineError(f"阶段 {name} 缺少输入: {input_name}")
+                    if input_name not in keys:
+                        keys[input_name] = hash_inputs(inputs[input_name])
+                    input_keys.append(keys[input_name])
+                run.keys[name] = hash_inputs(self.name, self.salt, name, stage.version, input_keys)
+
+        # 再自下而上确定需要执行的阶段：目标阶段和执行阶段的输入需要输出值，其中未命中缓存的才执行
+        needed = set(targets)
+        pending: Dict[int, List[str]] = {}
+        for depth in range(len(levels) - 1, -1, -1):
+            for name in levels[depth]:
+                if name not in needed:
+                    continue
+                if self._lookup(name, run):
+                    run.timings[name] = {"seconds": 0.0, "cached": True, "level": depth}
+                    continue
+                pending.setdefault(depth, []).append(name)
+                needed.update(i for i in self._stages[name].inputs if i in self._stages)
+
+        total = sum(len(names) for names in pending.values())
+        done = 0
+        for depth in sorted(pending):
+            names = pending[depth]
+            if len(names) > 1 and self.max_workers > 1:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(names)),
+                                        thread_name_prefix="stage") as pool:
+                    futures = {pool.submit(self._execute, name, inputs, run): name for name in names}
+                    for future in as_completed(futures):
+                        self._record(futures[future], future.result(), depth, run)
+                        done += 1
+                        if progress:
+                            progress(done / total, futures[future])
+            else:
+                for name in names:
+                    self._record(name, self._execute(name, inputs, run), depth, run)
+                    done += 1
+                    if progress:
+                        progress(done / total, name)
+
+        run.seconds = time.perf_counter() - start
+        # 耗时按层级、添加顺序排列
+        order = {name: index for index, name in enumerate(self._stages)}
+        run.timings = dict(sorted(run.timings.items(), key=lambda item: (item[1]["level"], order[item[0]])))
+        return run
+
+    def _lookup(self, name: str, run: PipelineRun) -> bool:
+        """查询阶段输出缓存，命中且仍然可用时写入 run.outputs"""
+        stage = self._stages[name]
+        if not stage.cache:
+            return False
+        hit, value = self.cache.get(("pipeline", run.keys[name]))
+        if isinstance(value, _ReleasableOutput):
+            value = value.value
+        if not hit or (stage.is_valid is not None and not stage.is_valid(value)):
+            return False
+        run.outputs[name] = value
+        return True
+
+    def _execute(self, name: str, inputs: Dict[str, Any], run: PipelineRun):
+        """执行一个阶段，返回 (输出, 耗时)"""
+        stage = self._stages[name]
+        args = [run.outputs[i] if i in self._stages else inputs[i] for i in stage.inputs]
+
+        def compute():
+            started = time.perf_counter()
+            value = stage.func(*args)
+            if stage.cache:
+                entry = value if stage.release is None else _ReleasableOutput(value, stage.release)
+                self.cache.put(("pipeline", run.keys[name]), entry)
+            return value, time.perf_counter() - started
+
+        if not stage.cache:
+            return compute()
+        return _stage_flight.do(run.keys[name], compute)[0]
+
+    @staticmethod
+    def _record(name: str, result, depth: int, run: PipelineRun):
+        value, seconds = result
+        run.outputs[name] = value
+        run.timings[name] = {"seconds": seconds, "cached": False, "level": depth}
+        instrumentation.observe(f"pipeline.{name}", seconds)
@@ -0,0 +1,127 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import PREVIEW_MAX_SIDE, PREVIEW_DEBOUNCE_SECONDS
+from utils.analysis_cache import AnalysisCache
+from utils.image_processor import ImageProcessor
+from utils.text_layout import scale_style
+
+
+class PreviewRenderer:
+    """
+    主图实时预览：在缩小的模板上排版和渲染，字号按同样比例缩小
+
+    预览只做排版需要的文字区域检测，跳过k-means取色；在脚本线程中直接渲染，
+    不经过进程池，拖动滑块时几毫秒即可出图。
+    """
+
+    def __init__(self, max_side: int = PREVIEW_MAX_SIDE, cache_size: int = 8):
+        self.max_side = max_side
+        self._processor = ImageProcessor()
+        # 模板资源键 -> (缩小的模板, 版面分析)
+        self._templates = AnalysisCache(cache_size)
+
+    def prepare(self, template_key: str, template: Image.Image) -> Tuple[Image.Image, Dict]:
+        """
+        缩小模板并分析版面，同一模板只处理一次
+
+        Args:
+            template_key: 模板在资源仓库中的键
+            template: 模板图片
+
+        Returns:
+            (缩小的模板, 版面分析)
+        """
+        hit, value = self._templates.get((template_key, self.max_side))
+        if hit:
+            return value
+
+        preview = template.copy()
+        preview.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+        if preview.mode != "RGB":
+            preview = preview.convert("RGB")
+        layout = self._processor.analyze_layout_array(np.asarray(preview))
+        self._templates.put((template_key, self.max_side), (preview, layout))
+        return preview, layout
+
+    def render(self, template_key: str, template: Image.Image, texts: Dict, style_config: Dict,
+               layout: Dict = None) -> Image.Image:
+        """
+        渲染预览图
+
+        Args:
+            template_key: 模板在资源仓库中的键
+            template: 全分辨率模板
+            texts: 文字内容字典
+            style_config: 全分辨率下的样式配置
+            layout: 完整的模板分析结果（可选），有则优先使用
+
+        Returns:
+            低分辨率预览图
+        """
+        preview, preview_layout = self.prepare(template_key, template)
+        scale = preview.width / template.width
+        return self._processor.render_text_on_template(
+            preview, texts, scale_style(style_config, scale), layout or preview_layout
+        )
+
+
+_preview_renderer = None
+_preview_renderer_lock = threading.Lock()
+
+
+def get_preview_renderer() -> PreviewRenderer:
+    """获取进程级共享的预览渲染器，缩小的模板在会话间复用"""
+    global _preview_renderer
+    with _preview_renderer_lock:
+        if _preview_renderer is None:
+            _preview_renderer = PreviewRenderer()
+        return _preview_renderer
+
+
+class RenderDebouncer:
+    """
+    渲染参数的防抖：参数连续 delay 秒没有变化后才允许提交全分辨率渲染，
+    同一组参数只提交一次
+    """
+
+    def __init__(self, delay: float = PREVIEW_DEBOUNCE_SECONDS):
+        self.delay = delay
+        self.signature: Optional[str] = None
+        self.changed_at = 0.0
+        self.submitted: Optional[str] = None
+
+    def observe(self, signature: str, now: float = None) -> bool:
+        """
+        记录当前参数
+
+        Args:
+            signature: 参数的内容哈希
+            now: 当前时间，默认 time.monotonic()
+
+        Returns:
+            是否应该现在提交全分辨率渲染
+        """
+        now = time.monotonic() if now is None else now
+        if signature != self.signature:
+            self.signature = signature
+            self.changed_at = now
+            return False
+        if self.submitted == signature or now - self.changed_at < self.delay:
+            return False
+        self.submitted = signature
+        return True
+
+    def mark_submitted(self, signature: str):
+        """这组参数已经手动提交过，不再自动提交"""
+        self.signature = signature
+        self.submitted = signature
+
+    @property
+    def waiting(self) -> bool:
+        """参数还在防抖等待中，需要稍后再检查"""
+        return self.signature is not None and self.submitted != self.signature
@@ -0,0 +1,139 @@
+import atexit
+import multiprocessing
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import PROCESS_POOL_WORKERS
+from utils.analysis_cache import memoize_analysis
+from utils.image_processor import ImageProcessor, reuse_similar_templates
+from utils.instrumentation import instrumentation
+from utils.result_types import TemplateAnalysis
+from utils.shm_transport import ImageDescriptor, SharedImage, attach, release_owned_segments, sweep_orphaned_segments
+
+# 工作进程内的处理器，进程启动时创建一次
+_worker_processor = None
+
+
+def _init_worker():
+    global _worker_processor
+    _worker_processor = ImageProcessor()
+
+
+def _analyze_in_worker(template: ImageDescriptor, reference: Optional[ImageDescriptor],
+                       instrument: bool = False) -> Tuple[Dict, List]:
+    # 主进程打开了性能统计时，工作进程中的计时随结果一起返回
+    with instrumentation.capture(instrument) as spans, attach(template) as source:
+        reference_image = None
+        if reference is not None:
+            with attach(reference) as attached:
+                reference_image = attached.image.convert(reference.mode)
+        # 直接在共享内存的数组视图上分析，不拷贝模板像素
+        return _worker_processor.analyze_template_array(source.array, reference_image), spans
+
+
+def _render_in_worker(template: ImageDescriptor, output: ImageDescriptor, texts: Dict, style_config: Dict,
+                      layout: Optional[Dict], instrument: bool = False) -> List:
+    # 模板像素复制到父进程预先分配的输出段后直接在上面绘制，结果不经过pickle返回
+    with instrumentation.capture(instrument) as spans, \
+            attach(template) as source, attach(output, writable=True) as target:
+        target.image.paste(source.image)
+        _worker_processor.draw_texts(target.image, texts, style_config, layout)
+    return spans
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取进程级共享的计算进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 清理之前崩溃的进程遗留的共享内存段
+            sweep_orphaned_segments()
+            # 使用spawn启动，避免在多线程的Streamlit进程中fork
+            _pool = ProcessPoolExecutor(
+                max_workers=PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _reset_pool():
+    """进程池损坏（工作进程崩溃）时丢弃，下次使用时重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+    release_owned_segments()
+
+
+atexit.register(shutdown_process_pool)
+
+
+class OffloadedImageProcessor(ImageProcessor):
+    """
+    把模板分析和文字渲染放到共享进程池执行的图片处理器
+
+    CPU密集的k-means、形态学和绘制不再占用Streamlit脚本线程的GIL，
+    图片像素经共享内存传给工作进程；进程池不可用时退回当前线程执行。
+    """
+
+    @memoize_analysis(result_type=TemplateAnalysis)
+    @reuse_similar_templates
+    def analyze_template(self, template_image: Image.Image, reference_image: Image.Image = None) -> Dict:
+        """在进程池中分析模板，结果与 ImageProcessor.analyze_template 相同"""
+        # 分析需要 (高, 宽, 通道) 数组，灰度等其他模式先转为RGB
+        if template_image.mode not in ("RGB", "RGBA"):
+            template_image = template_image.convert("RGB")
+        try:
+            with ExitStack() as segments:
+                template = segments.enter_context(SharedImage.from_image(template_image))
+                reference = None
+                if reference_image is not None:
+                    reference = segments.enter_context(SharedImage.from_image(reference_image)).descriptor
+                with instrumentation.span("offload.analyze_template"):
+                    analysis, spans = get_process_pool().submit(
+                        _analyze_in_worker, template.descriptor, reference, instrumentation.enabled
+                    ).result()
+                instrumentation.replay(spans)
+                return analysis
+        except BrokenProcessPool as e:
+            print(f"进程池执行失败，改为本地分析: {str(e)}")
+            _reset_pool()
+            return self.analyze_template_array(np.array(template_image), reference_image)
+
+    def render_text_on_template(self, template: Image.Image, texts: Dict, style_config: Dict,
+                                layout: Dict = None) -> Image.Image:
+        """在进程池中渲染文字，结果与 ImageProcessor.render_text_on_template 相同"""
+        try:
+            with SharedImage.from_image(template) as source, \
+                    SharedImage(source.descriptor.size, source.descriptor.mode) as output:
+                with instrumentation.span("offload.render"):
+                    spans = get_process_pool().submit(
+                        _render_in_worker, source.descriptor, output.descriptor, texts, style_config, layout,
+                        instrumentation.enabled
+                    ).result()
+                instrumentation.replay(spans)
+                return output.to_image()
+        except BrokenProcessPool as e:
+            print(f"进程池执行失败，改为本地渲染: {str(e)}")
+            _reset_pool()
+            return super().render_text_on_template(template, texts, style_config, layout)
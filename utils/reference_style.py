@@ -0,0 +1,287 @@
+import copy
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import STYLE_ANALYSIS_MAX_SIDE, STYLE_EXTRACTION_BUDGET
+from utils.analysis_cache import AnalysisCache, hash_inputs
+from utils.instrumentation import instrumentation
+
+# 无法从参考图中识别出文字时使用的样式
+DEFAULT_REFERENCE_STYLE = {
+    "title_style": {
+        "color": "#FF6B35",
+        "size": 36,
+        "weight": "bold",
+        "position": "top_center"
+    },
+    "subtitle_style": {
+        "color": "#333333",
+        "size": 24,
+        "weight": "normal",
+        "position": "center"
+    },
+    "highlight_color": "#FF6B35",
+    "background_style": "gradient"
+}
+
+# 提取结果按参考图内容哈希缓存
+_style_cache = AnalysisCache(64)
+instrumentation.register_collector("cache", _style_cache.get_stats, {"cache": "reference_style"})
+
+
+def _hex(color) -> str:
+    return "#{:02x}{:02x}{:02x}".format(*(int(round(c)) for c in color[:3]))
+
+
+def _downsample(image: Image.Image, max_side: int) -> np.ndarray:
+    """缩小到最长边不超过 max_side 的RGB数组，先整数倍缩小再插值"""
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    scale = min(1.0, max_side / max(image.size))
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return np.asarray(image)
+
+
+def _background(pixels: np.ndarray) -> Dict:
+    """按4位量化颜色直方图判断背景：单色、渐变或图片"""
+    quantized = ((pixels[..., 0] >> 4).astype(np.int32) << 8) | ((pixels[..., 1] >> 4).astype(np.int32) << 4) \
+        | (pixels[..., 2] >> 4)
+    counts = np.bincount(quantized.ravel(), minlength=4096)
+    top = int(counts.argmax())
+    share = counts[top] / quantized.size
+    color = pixels[quantized == top].mean(axis=0)
+
+    if share > 0.5:
+        kind = "solid"
+    else:
+        # 亮度能被一个平面很好拟合时认为是渐变；文字像素是离群点，
+        # 去掉残差最大的20%后重新拟合，只用剩下的像素判断
+        luminance = pixels[::2, ::2].astype(np.float32) @ np.array([0.299, 0.587, 0.114], np.float32)
+        ys, xs = np.mgrid[0:luminance.shape[0], 0:luminance.shape[1]]
+        design = np.stack([xs.ravel(), ys.ravel(), np.ones(xs.size)], axis=1).astype(np.float32)
+        values = luminance.ravel()
+        keep = np.ones(values.size, bool)
+        for _ in range(2):
+            coefficients, *_ = np.linalg.lstsq(design[keep], values[keep], rcond=None)
+            residual = np.abs(values - design @ coefficients)
+            keep = residual <= np.percentile(residual, 80)
+        variance = values[keep].var()
+        explained = 1.0 - residual[keep].var() / variance if variance > 1e-6 else 1.0
+        kind = "gradient" if explained > 0.8 and variance > 4.0 else "image"
+    return {"color": _hex(color), "style": kind, "share": float(share)}
+
+
+def _text_lines(pixels: np.ndarray) -> List[Dict]:
+    """
+    检测文字行：与局部背景差异大的像素横向连接成行，再用连通域统计筛选
+
+    Returns:
+        文字行列表，按行高从大到小排列
+    """
+    height, width = pixels.shape[:2]
+    # 每个通道与中值滤波得到的局部背景比较，取最大差异，彩色文字也能检出
+    kernel = max(3, min(31, (min(height, width) // 12) | 1))
+    background = cv2.medianBlur(np.ascontiguousarray(pixels), kernel)
+    difference = cv2.absdiff(pixels, background).max(axis=2)
+    threshold, _ = cv2.threshold(difference, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    ink = (difference > max(threshold, 40)).astype(np.uint8)
+    if not ink.any():
+        return []
+
+    gap = max(3, width // 40)
+    joined = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (gap, 3)))
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(joined, connectivity=8)
+
+    # 按连通域一次性统计墨迹像素数、边缘像素数和颜色；颜色按与背景的差异加权，
+    # 缩小后文字边缘的抗锯齿像素偏向背景色，权重较低
+    mask = ink > 0
+    ink_labels = labels[mask]
+    ink_counts = np.bincount(ink_labels, minlength=count)
+    edges = mask & (cv2.erode(ink, np.ones((3, 3), np.uint8)) == 0)
+    edge_counts = np.bincount(labels[edges], minlength=count)
+    weights = difference[mask].astype(np.float64) ** 4
+    weight_sums = np.bincount(ink_labels, weights=weights, minlength=count)
+    ink_pixels = pixels[mask].astype(np.float64)
+    color_sums = np.stack([np.bincount(ink_labels, weights=ink_pixels[:, c] * weights, minlength=count)
+                           for c in range(3)], axis=1)
+
+    pieces = []
+    for label in range(1, count):
+        x, y, w, h, _ = stats[label]
+        if h < max(4, height * 0.02) or h > height * 0.3:
+            continue
+        pieces.append({
+            "box": [int(x), int(y), int(x + w), int(y + h)],
+            "ink": int(ink_counts[label]),
+            "edge": int(edge_counts[label]),
+            "weight": float(weight_sums[label]),
+            "color_sum": color_sums[label],
+        })
+
+    lines = []
+    for piece in _merge_same_line(pieces):
+        x0, y0, x1, y1 = piece["box"]
+        w, h = x1 - x0, y1 - y0
+        fill = piece["ink"] / float(w * h)
+        # 文字行：宽不小于高、墨迹既不稀疏也不是实心色块
+        if w < h or not 0.08 <= fill <= 0.75:
+            continue
+        lines.append({
+            "x": x0, "y": y0, "width": w, "height": h,
+            "center": ((x0 + x1) / 2, (y0 + y1) / 2),
+            "color": piece["color_sum"] / max(piece["weight"], 1e-6),
+            "stroke": _stroke_width(piece["ink"], piece["edge"]),
+        })
+    lines.sort(key=lambda line: line["height"], reverse=True)
+    return lines
+
+
+def _stroke_width(ink: int, edge: int) -> float:
+    """笔画近似为细长条：面积 = 宽 × 长，宽度不小于2时边缘像素约为 2 × 长；全是边缘像素时宽1像素"""
+    ratio = ink / max(edge, 1)
+    return 1.0 if ratio < 1.1 else 2.0 * ratio
+
+
+def _merge_same_line(pieces: List[Dict]) -> List[Dict]:
+    """把同一行中被词间距断开的片段合并：垂直方向大部分重叠、水平间距不超过行高"""
+    pieces.sort(key=lambda piece: piece["box"][0])
+    merged: List[Dict] = []
+    for piece in pieces:
+        x0, y0, x1, y1 = piece["box"]
+        for line in merged:
+            lx0, ly0, lx1, ly1 = line["box"]
+            overlap = min(y1, ly1) - max(y0, ly0)
+            line_height = max(y1 - y0, ly1 - ly0)
+            if overlap >= 0.6 * min(y1 - y0, ly1 - ly0) and x0 - lx1 <= line_height:
+                line["box"] = [min(x0, lx0), min(y0, ly0), max(x1, lx1), max(y1, ly1)]
+                line["ink"] += piece["ink"]
+                line["edge"] += piece["edge"]
+                line["weight"] += piece["weight"]
+                line["color_sum"] = line["color_sum"] + piece["color_sum"]
+                break
+        else:
+            merged.append(dict(piece))
+    return merged
+
+
+def _position(center, size) -> str:
+    x_ratio, y_ratio = center[0] / size[0], center[1] / size[1]
+    vertical = "top" if y_ratio < 1 / 3 else "bottom" if y_ratio > 2 / 3 else "center"
+    horizontal = "left" if x_ratio < 0.4 else "right" if x_ratio > 0.6 else "center"
+    if vertical == "center" and horizontal == "center":
+        return "center"
+    return f"{vertical}_{horizontal}"
+
+
+def _sample_color(image: Image.Image, line: Dict, scale: float):
+    """
+    在原图上重新取文字颜色：缩小后细笔画与背景混合，颜色偏淡
+
+    只裁出这一行的区域，以边框像素的中值为背景，取差异最大的一部分像素的平均色
+    """
+    box = (int(line["x"] * scale), int(line["y"] * scale),
+           int((line["x"] + line["width"]) * scale) + 1, int((line["y"] + line["height"]) * scale) + 1)
+    crop = image.crop(box)
+    if crop.mode != "RGB":
+        crop = crop.convert("RGB")
+    region = np.asarray(crop).astype(np.int16)
+    pixels = region.reshape(-1, 3)
+    border = np.concatenate([region[0], region[-1], region[:, 0], region[:, -1]])
+    difference = np.abs(pixels - np.median(border, axis=0)).max(axis=1)
+    if difference.max() < 40:
+        return line["color"]
+    return pixels[difference >= 0.8 * difference.max()].mean(axis=0)
+
+
+def _line_style(line: Dict, shape, scale: float) -> Dict:
+    height, width = shape[:2]
+    # 行的墨迹高度约为字号的0.85倍（中文字形几乎占满字身）
+    size = max(8, int(round(line["height"] * scale / 0.85)))
+    return {
+        "color": _hex(line["color"]),
+        "size": size,
+        "size_ratio": round(line["height"] / height, 4),
+        # 常规字重的笔画宽度约为墨迹高度的0.12，粗体约0.22
+        "weight": "bold" if line["stroke"] / line["height"] > 0.17 else "normal",
+        "position": _position(line["center"], (width, height)),
+    }
+
+
+def _saturation(color) -> float:
+    high, low = max(color), min(color)
+    return (high - low) / high if high > 0 else 0.0
+
+
+def extract_reference_style(image: Image.Image, budget: float = STYLE_EXTRACTION_BUDGET,
+                            max_side: int = STYLE_ANALYSIS_MAX_SIDE) -> Dict:
+    """
+    从参考成品中估计标题、副标题的颜色、字号、粗细、位置以及背景类型
+
+    在缩小的副本上用量化颜色直方图和连通域统计完成，全部为向量化计算；
+    超出时间预算时停止后续步骤，未完成的部分使用默认样式（complete 为 False）。
+    预算从缩小开始计算；结果按缩略图的内容哈希缓存，大图不需要对全部像素求哈希。
+
+    Args:
+        image: 参考成品图片
+        budget: 时间预算（秒）
+        max_side: 分析用缩略图的最长边
+
+    Returns:
+        样式字典，结构与 DEFAULT_REFERENCE_STYLE 相同，另有 background_color 和 complete
+    """
+    deadline = time.perf_counter() + budget
+    style = copy.deepcopy(DEFAULT_REFERENCE_STYLE)
+    style["complete"] = False
+
+    try:
+        pixels = _downsample(image, max_side)
+        key = (hash_inputs(pixels), image.size)
+        hit, cached = _style_cache.get(key)
+        if hit:
+            return copy.deepcopy(cached)
+        scale = image.width / pixels.shape[1]
+        if time.perf_counter() > deadline:
+            return style
+
+        background = _background(pixels)
+        style["background_style"] = background["style"]
+        style["background_color"] = background["color"]
+        if time.perf_counter() > deadline:
+            return style
+
+        lines = _text_lines(pixels)
+        if time.perf_counter() > deadline:
+            return style
+        if lines:
+            title = lines[0]
+            if scale > 1.0:
+                for line in lines[:5]:
+                    # 超出预算时停止在原图上取色，其余行保留缩略图上的颜色
+                    if time.perf_counter() > deadline:
+                        break
+                    line["color"] = _sample_color(image, line, scale)
+            style["title_style"] = _line_style(title, pixels.shape, scale)
+            # 副标题：明显比标题小的最大文字行
+            subtitle = next((line for line in lines[1:] if line["height"] <= title["height"] * 0.85), None)
+            if subtitle is not None:
+                style["subtitle_style"] = _line_style(subtitle, pixels.shape, scale)
+            # 强调色：饱和度最高的文字颜色
+            style["highlight_color"] = _hex(max((line["color"] for line in lines[:5]), key=_saturation))
+        if time.perf_counter() > deadline:
+            return style
+        style["complete"] = True
+    except Exception as e:
+        print(f"参考样式提取失败: {str(e)}")
+        return style
+
+    # 因超出预算而不完整的结果不会走到这里，不缓存，下次有机会完整计算
+    _style_cache.put(key, copy.deepcopy(style))
+    return style
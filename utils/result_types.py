@@ -0,0 +1,334 @@
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 缓存中保存的紧凑结果类型：用 __slots__ 和 numpy 数组代替嵌套字典，
+# to_dict() 还原出与原来完全相同的字典，调用方不需要改动
+
+_HEX_COLOR = re.compile(r"#[0-9a-f]{6}")
+_REGION_KEYS = {"x", "y", "width", "height", "area", "aspect_ratio"}
+_ZONE_KEYS = {"x", "y", "width", "height", "purpose", "saliency", "candidates"}
+_INT32_MIN, _INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+# 相同结构的字典共用同一个键元组
+_key_tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+class CompactError(ValueError):
+    """结果的结构与紧凑类型不符，无法无损转换"""
+
+
+def _shared_keys(keys) -> Tuple[str, ...]:
+    keys = tuple(sys.intern(key) if isinstance(key, str) else key for key in keys)
+    return _key_tuples.setdefault(keys, keys)
+
+
+def _is_int(value) -> bool:
+    return type(value) is int
+
+
+class Record:
+    """字典的紧凑形式：键元组在相同结构的记录间共享，值存为元组"""
+
+    __slots__ = ("keys", "values")
+
+    def __init__(self, keys: Tuple[str, ...], values: Tuple):
+        self.keys = keys
+        self.values = values
+
+    def to_dict(self) -> Dict:
+        return {key: thaw(value) for key, value in zip(self.keys, self.values)}
+
+
+def freeze(value: Any) -> Any:
+    """
+    把JSON结构的值（字典、列表、字符串、数字、布尔、None）转为不可变的紧凑形式：
+    字典转为 Record，列表转为元组
+
+    Raises:
+        CompactError: 含有元组或其他类型的值，还原时无法区分
+    """
+    if isinstance(value, dict):
+        return Record(_shared_keys(value), tuple(freeze(item) for item in value.values()))
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    if value is None or type(value) in (str, int, float, bool):
+        return value
+    raise CompactError(f"不支持的值类型: {type(value).__name__}")
+
+
+def thaw(value: Any) -> Any:
+    """freeze 的逆操作，每次返回新的字典和列表"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+# 每行一个区域的结构化数组，一个条目的全部区域只占一个数组对象
+REGION_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("width", "<i4"), ("height", "<i4"), ("aspect_ratio", "<f8")])
+ZONE_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("width", "<i4"), ("height", "<i4"),
+                       ("saliency", "<f8"), ("candidates", "<i8")])
+
+
+def _valid_box(item: Dict) -> bool:
+    return all(_is_int(item[key]) and _INT32_MIN <= item[key] <= _INT32_MAX for key in ("x", "y", "width", "height"))
+
+
+class RegionTable:
+    """文字区域列表，存为 REGION_DTYPE 结构化数组；面积由宽×高得到，不单独保存"""
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+
+    @classmethod
+    def from_dicts(cls, regions: List[Dict]) -> "RegionTable":
+        for region in regions:
+            if set(region) != _REGION_KEYS or type(region["aspect_ratio"]) is not float or not _valid_box(region) \
+                    or not _is_int(region["area"]) or region["area"] != region["width"] * region["height"]:
+                raise CompactError("文字区域的结构不符")
+        return cls(np.array([(r["x"], r["y"], r["width"], r["height"], r["aspect_ratio"]) for r in regions],
+                            dtype=REGION_DTYPE))
+
+    def to_dicts(self) -> List[Dict]:
+        return [{"x": x, "y": y, "width": width, "height": height, "area": width * height, "aspect_ratio": aspect_ratio}
+                for x, y, width, height, aspect_ratio in self.rows.tolist()]
+
+
+class ZoneTable:
+    """布局区域，存为 ZONE_DTYPE 结构化数组；显著度缺失时为 NaN，候选框数量缺失时为 -1"""
+
+    __slots__ = ("names", "purposes", "rows")
+
+    def __init__(self, names: Tuple[str, ...], purposes: Tuple[Optional[str], ...], rows: np.ndarray):
+        self.names = names
+        self.purposes = purposes
+        self.rows = rows
+
+    @classmethod
+    def from_dict(cls, zones: Dict[str, Dict]) -> "ZoneTable":
+        for zone in zones.values():
+            if not {"x", "y", "width", "height"} <= set(zone) <= _ZONE_KEYS or not _valid_box(zone) \
+                    or ("saliency" in zone and (type(zone["saliency"]) is not float or zone["saliency"] != zone["saliency"])) \
+                    or ("candidates" in zone and (not _is_int(zone["candidates"]) or not 0 <= zone["candidates"] < 2 ** 63)) \
+                    or ("purpose" in zone and type(zone["purpose"]) is not str):
+                raise CompactError("布局区域的结构不符")
+        values = list(zones.values())
+        rows = np.array([(z["x"], z["y"], z["width"], z["height"], z.get("saliency", np.nan), z.get("candidates", -1))
+                         for z in values], dtype=ZONE_DTYPE)
+        return cls(_shared_keys(zones), _shared_keys(z.get("purpose") for z in values), rows)
+
+    def to_dict(self) -> Dict[str, Dict]:
+        zones = {}
+        for name, purpose, (x, y, width, height, saliency, candidates) in zip(self.names, self.purposes,
+                                                                               self.rows.tolist()):
+            zone = {"x": x, "y": y, "width": width, "height": height}
+            if purpose is not None:
+                zone["purpose"] = purpose
+            if saliency == saliency:
+                zone["saliency"] = saliency
+            if candidates >= 0:
+                zone["candidates"] = candidates
+            zones[name] = zone
+        return zones
+
+
+class Palette:
+    """颜色调色板，存为 uint8 数组 (N, 3)，还原为小写的 #rrggbb 字符串"""
+
+    __slots__ = ("colors",)
+
+    def __init__(self, colors: np.ndarray):
+        self.colors = colors
+
+    @classmethod
+    def from_hex(cls, colors: List[str]) -> "Palette":
+        if not all(type(color) is str and _HEX_COLOR.fullmatch(color) for color in colors):
+            raise CompactError("颜色不是小写的 #rrggbb 格式")
+        data = bytes.fromhex("".join(color[1:] for color in colors))
+        # 拷贝一份，不保留对 bytes 和重塑前数组的引用
+        return cls(np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).copy())
+
+    def to_hex(self) -> List[str]:
+        return ["#{:02x}{:02x}{:02x}".format(*color) for color in self.colors.tolist()]
+
+
+class CompactResult:
+    """紧凑结果类型的基类"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "CompactResult":
+        raise NotImplementedError
+
+    def to_dict(self) -> Dict:
+        raise NotImplementedError
+
+    @classmethod
+    def pack(cls, result: Any) -> Any:
+        """
+        尽量转为紧凑类型：不能无损转换时原样返回
+
+        Args:
+            result: 分析结果字典
+
+        Returns:
+            紧凑结果或原来的字典
+        """
+        if not isinstance(result, dict):
+            return result
+        try:
+            return cls.from_dict(result)
+        except CompactError:
+            return result
+
+
+def _extras(result: Dict, known) -> Optional[Record]:
+    extra = {key: value for key, value in result.items() if key not in known}
+    return freeze(extra) if extra else None
+
+
+def _with_extras(result: Dict, extras: Optional[Record]) -> Dict:
+    if extras is not None:
+        result.update(extras.to_dict())
+    return result
+
+
+class TemplateAnalysis(CompactResult):
+    """analyze_template / analyze_layout_array 的结果"""
+
+    __slots__ = ("width", "height", "aspect_ratio", "text_regions", "color_palette", "layout_zones", "extras")
+
+    _KNOWN = ("width", "height", "aspect_ratio", "text_regions", "color_palette", "layout_zones")
+
+    def __init__(self, width: int, height: int, aspect_ratio: float, text_regions: RegionTable,
+                 color_palette: Optional[Palette], layout_zones: ZoneTable, extras: Optional[Record] = None):
+        self.width = width
+        self.height = height
+        self.aspect_ratio = aspect_ratio
+        self.text_regions = text_regions
+        self.color_palette = color_palette
+        self.layout_zones = layout_zones
+        self.extras = extras
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "TemplateAnalysis":
+        if not _is_int(result.get("width")) or not _is_int(result.get("height")) \
+                or type(result.get("aspect_ratio")) is not float \
+                or not isinstance(result.get("text_regions"), list) or not isinstance(result.get("layout_zones"), dict):
+            raise CompactError("模板分析结果的结构不符")
+        palette = result.get("color_palette")
+        if palette is not None and not isinstance(palette, list):
+            raise CompactError("颜色调色板不是列表")
+        return cls(
+            result["width"], result["height"], result["aspect_ratio"],
+            RegionTable.from_dicts(result["text_regions"]),
+            Palette.from_hex(palette) if palette is not None else None,
+            ZoneTable.from_dict(result["layout_zones"]),
+            _extras(result, cls._KNOWN),
+        )
+
+    def to_dict(self) -> Dict:
+        result = {
+            "width": self.width,
+            "height": self.height,
+            "aspect_ratio": self.aspect_ratio,
+            "text_regions": self.text_regions.to_dicts(),
+        }
+        if self.color_palette is not None:
+            result["color_palette"] = self.color_palette.to_hex()
+        result["layout_zones"] = self.layout_zones.to_dict()
+        return _with_extras(result, self.extras)
+
+
+class ComplianceResult(CompactResult):
+    """check_forbidden_words 的结果，has_forbidden 由违禁词列表得到"""
+
+    __slots__ = ("forbidden_words", "suggestion")
+
+    def __init__(self, forbidden_words: Tuple[str, ...], suggestion: Record):
+        self.forbidden_words = forbidden_words
+        self.suggestion = suggestion
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "ComplianceResult":
+        if set(result) != {"has_forbidden", "forbidden_words", "suggestion"} \
+                or not isinstance(result["forbidden_words"], list) or not isinstance(result["suggestion"], dict) \
+                or result["has_forbidden"] is not (len(result["forbidden_words"]) > 0):
+            raise CompactError("违禁词检测结果的结构不符")
+        return cls(freeze(result["forbidden_words"]), freeze(result["suggestion"]))
+
+    @property
+    def has_forbidden(self) -> bool:
+        return len(self.forbidden_words) > 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "has_forbidden": self.has_forbidden,
+            "forbidden_words": thaw(self.forbidden_words),
+            "suggestion": self.suggestion.to_dict(),
+        }
+
+
+class DetailSection:
+    """详情页的一个章节"""
+
+    __slots__ = ("type", "title", "content", "style", "extras")
+
+    _KNOWN = ("type", "title", "content", "style")
+
+    def __init__(self, type: str, title: str, content: Tuple, style: str, extras: Optional[Record] = None):
+        self.type = type
+        self.title = title
+        self.content = content
+        self.style = style
+        self.extras = extras
+
+    @classmethod
+    def from_dict(cls, section: Dict) -> "DetailSection":
+        if not isinstance(section, dict) or tuple(section)[:4] != cls._KNOWN \
+                or not isinstance(section["content"], list):
+            raise CompactError("详情页章节的结构不符")
+        return cls(freeze(section["type"]), freeze(section["title"]), freeze(section["content"]),
+                   freeze(section["style"]), _extras(section, cls._KNOWN))
+
+    def to_dict(self) -> Dict:
+        section = {"type": self.type, "title": self.title, "content": thaw(self.content), "style": self.style}
+        return _with_extras(section, self.extras)
+
+
+class DetailPageLayout(CompactResult):
+    """generate_detail_page_layout 的结果"""
+
+    __slots__ = ("sections", "color_scheme", "font_config", "extras")
+
+    _KNOWN = ("sections", "color_scheme", "font_config")
+
+    def __init__(self, sections: Tuple[DetailSection, ...], color_scheme: Record, font_config: Record,
+                 extras: Optional[Record] = None):
+        self.sections = sections
+        self.color_scheme = color_scheme
+        self.font_config = font_config
+        self.extras = extras
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "DetailPageLayout":
+        if tuple(result)[:3] != cls._KNOWN or not isinstance(result["sections"], list) \
+                or not isinstance(result["color_scheme"], dict) or not isinstance(result["font_config"], dict):
+            raise CompactError("详情页布局的结构不符")
+        return cls(tuple(DetailSection.from_dict(section) for section in result["sections"]),
+                   freeze(result["color_scheme"]), freeze(result["font_config"]), _extras(result, cls._KNOWN))
+
+    def to_dict(self) -> Dict:
+        result = {
+            "sections": [section.to_dict() for section in self.sections],
+            "color_scheme": self.color_scheme.to_dict(),
+            "font_config": self.font_config.to_dict(),
+        }
+        return _with_extras(result, self.extras)
@@ -0,0 +1,213 @@
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# 共享内存段名前缀，段名中带有创建进程的pid，便于清理崩溃后遗留的段
+SEGMENT_PREFIX = "djimg_"
+_SHM_DIR = "/dev/shm"
+
+# 逻辑模式 -> (内存布局, 通道数)；RGB 按 PIL 内部的4字节 RGBX 布局存放，
+# 工作进程可以直接把共享内存映射为 PIL 图片读写，不需要额外拷贝
+_LAYOUTS = {
+    "RGB": ("RGBX", 4),
+    "RGBA": ("RGBA", 4),
+    "L": ("L", 1),
+}
+
+
+class ImageDescriptor(NamedTuple):
+    """共享内存图片的描述信息，跨进程传递时只序列化这几个字段"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    mode: str
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.shape[1], self.shape[0]
+
+    @property
+    def layout(self) -> str:
+        return _LAYOUTS[self.mode][0]
+
+
+def _map_image(segment: shared_memory.SharedMemory, descriptor: ImageDescriptor, writable: bool) -> Image.Image:
+    """把共享内存映射为 PIL 图片（不拷贝）"""
+    layout = descriptor.layout
+    image = Image.frombuffer(layout, descriptor.size, segment.buf, "raw", layout, 0, 1)
+    if writable:
+        # frombuffer 得到的图片默认只读，写入前会先拷贝；关闭只读标记后绘制直接落在共享内存中
+        image.readonly = 0
+    return image
+
+
+def _map_array(segment: shared_memory.SharedMemory, descriptor: ImageDescriptor) -> np.ndarray:
+    return np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=segment.buf)
+
+
+def _release(segment: shared_memory.SharedMemory):
+    try:
+        segment.close()
+    except BufferError:
+        # 调用方仍持有映射出的数组或图片，等其回收后由操作系统释放映射
+        pass
+
+
+# 本进程创建且尚未释放的段，进程退出时兜底释放
+_owned_segments: Dict[str, shared_memory.SharedMemory] = {}
+_owned_lock = threading.Lock()
+
+
+class SharedImage:
+    """
+    由父进程创建并负责释放的共享内存图片
+
+    作为上下文管理器使用，离开作用域时无论工作进程是否崩溃都会释放共享内存段
+    """
+
+    def __init__(self, size: Tuple[int, int], mode: str = "RGB"):
+        if mode not in _LAYOUTS:
+            raise ValueError(f"不支持的共享图片模式: {mode}")
+        channels = _LAYOUTS[mode][1]
+        width, height = size
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        name = f"{SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self._segment = shared_memory.SharedMemory(name=name, create=True, size=max(width * height * channels, 1))
+        self.descriptor = ImageDescriptor(self._segment.name, shape, np.dtype(np.uint8).str, mode)
+        with _owned_lock:
+            _owned_segments[self._segment.name] = self._segment
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "SharedImage":
+        """创建共享内存段并写入图片像素，其他模式统一转为RGB"""
+        if image.mode not in _LAYOUTS:
+            image = image.convert("RGB")
+        shared = cls(image.size, image.mode)
+        target = _map_image(shared._segment, shared.descriptor, writable=True)
+        target.paste(image)
+        del target
+        return shared
+
+    @property
+    def array(self) -> np.ndarray:
+        """共享内存上的数组视图（不拷贝）"""
+        return _map_array(self._segment, self.descriptor)
+
+    def to_image(self) -> Image.Image:
+        """拷贝出一张独立的图片，释放共享内存后仍然有效"""
+        mapped = _map_image(self._segment, self.descriptor, writable=False)
+        image = mapped.convert(self.descriptor.mode)
+        del mapped
+        return image
+
+    def close(self):
+        """释放共享内存段，可重复调用"""
+        with _owned_lock:
+            segment = _owned_segments.pop(self.descriptor.name, None)
+        if segment is None:
+            return
+        _release(segment)
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SharedImage":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AttachedImage:
+    """工作进程中挂载的共享内存图片，image 与 array 都直接指向共享内存"""
+
+    def __init__(self, segment: shared_memory.SharedMemory, descriptor: ImageDescriptor, writable: bool):
+        self.descriptor = descriptor
+        self.image = _map_image(segment, descriptor, writable)
+        self.array = _map_array(segment, descriptor)
+
+
+@contextmanager
+def attach(descriptor: ImageDescriptor, writable: bool = False) -> Iterator[AttachedImage]:
+    """
+    在工作进程中按描述信息挂载共享内存图片
+
+    Args:
+        descriptor: 父进程传来的描述信息
+        writable: 是否直接在共享内存上绘制
+
+    Yields:
+        挂载的图片，RGB 图片的 image 为 RGBX 布局、array 为4通道
+    """
+    segment = shared_memory.SharedMemory(name=descriptor.name)
+    attached = AttachedImage(segment, descriptor, writable)
+    try:
+        yield attached
+    finally:
+        attached.image = None
+        attached.array = None
+        _release(segment)
+
+
+def release_owned_segments():
+    """释放本进程创建的所有共享内存段"""
+    with _owned_lock:
+        segments = list(_owned_segments.values())
+        _owned_segments.clear()
+    for segment in segments:
+        _release(segment)
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def sweep_orphaned_segments(shm_dir: str = _SHM_DIR) -> int:
+    """
+    清理创建进程已经不存在的共享内存段（例如父进程被强制杀死后遗留的段）
+
+    Args:
+        shm_dir: 共享内存目录，非Linux系统上不存在时直接返回
+
+    Returns:
+        清理的段数量
+    """
+    removed = 0
+    if not os.path.isdir(shm_dir):
+        return removed
+    for name in os.listdir(shm_dir):
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        pid = _segment_pid(name)
+        if pid is None or _pid_alive(pid):
+            continue
+        try:
+            os.remove(os.path.join(shm_dir, name))
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def _segment_pid(name: str) -> Optional[int]:
+    try:
+        return int(name[len(SEGMENT_PREFIX):].split("_", 1)[0])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
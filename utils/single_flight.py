@@ -0,0 +1,81 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """一次正在进行中的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """进程级请求合并器：相同key的并发调用只执行一次，所有调用方共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行或加入一次调用
+
+        Args:
+            key: 请求标识，相同key的并发请求会被合并
+            func: 实际执行请求的无参函数
+
+        Returns:
+            (结果, 是否为合并得到的共享结果)
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """当前正在进行中的请求数量"""
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取合并统计：总调用数、实际执行数、合并命中数"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["in_flight"] = self.in_flight()
+        return stats
+
+    def reset_stats(self):
+        """重置统计计数"""
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
@@ -0,0 +1,464 @@
+import math
+import threading
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import ImageFont
+
+from config import FONT_CANDIDATES, MIN_FONT_SIZE
+from utils.instrumentation import span
+
+# 字形宽度在该字号下测量一次，其他字号按比例换算
+REFERENCE_SIZE = 256
+# 不能出现在行首的标点，换行时挂到上一行末尾
+_NO_LINE_START = set("，。、；：！？）》」』】”’,.;:!?)%")
+LINE_SPACING = 1.2
+
+Box = Tuple[int, int, int, int]
+
+
+@lru_cache(maxsize=1)
+def resolve_font_path() -> Optional[str]:
+    """
+    按 FONT_CANDIDATES 顺序查找第一个可加载的字体
+
+    Returns:
+        字体路径，都不可用时返回None（使用Pillow默认字体）
+    """
+    with span("font.resolve"):
+        for path in FONT_CANDIDATES:
+            try:
+                ImageFont.truetype(path, 12)
+                return path
+            except OSError:
+                continue
+    return None
+
+
+@lru_cache(maxsize=256)
+def load_font(size: int, font_path: Optional[str] = None):
+    """
+    加载指定字号的字体，同一字号只加载一次
+
+    Args:
+        size: 字号
+        font_path: 字体路径，默认使用 resolve_font_path 的结果
+
+    Returns:
+        字体对象
+    """
+    path = font_path or resolve_font_path()
+    if path:
+        try:
+            # 同一字号只有第一次会执行到这里，计时即字体加载的开销
+            with span("font.load"):
+                return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow 10.1 之前的默认字体是固定字号的位图字体
+        return ImageFont.load_default()
+
+
+class GlyphMetrics:
+    """
+    单个字体的字形宽度缓存
+
+    每个字符只在 REFERENCE_SIZE 下用 getlength 测量一次，其他字号按比例换算，
+    试排一个候选字号只需要查表求和，不再反复调用 textbbox。
+    """
+
+    def __init__(self, font_path: Optional[str] = None):
+        self.font_path = font_path
+        self._font = load_font(REFERENCE_SIZE, font_path)
+        # 位图默认字体不能缩放，所有字号的宽度都相同
+        self.scalable = isinstance(self._font, ImageFont.FreeTypeFont)
+        self._advances: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        ascent, descent = self._font.getmetrics()
+        self._line_height = (ascent + descent) / REFERENCE_SIZE if self.scalable else ascent + descent
+
+    def _scale(self, size: int) -> float:
+        return size / REFERENCE_SIZE if self.scalable else 1.0
+
+    def _reference_advance(self, char: str) -> float:
+        width = self._advances.get(char)
+        if width is None:
+            width = self._font.getlength(char)
+            with self._lock:
+                self._advances[char] = width
+        return width
+
+    def advance(self, char: str, size: int) -> float:
+        """字符在指定字号下的前进宽度"""
+        return self._reference_advance(char) * self._scale(size)
+
+    def text_width(self, text: str, size: int) -> float:
+        """文字宽度（不含字距调整，误差在最终绘制前校正）"""
+        advances = self._advances
+        total = 0.0
+        for char in text:
+            width = advances.get(char)
+            if width is None:
+                width = self._reference_advance(char)
+            total += width
+        return total * self._scale(size)
+
+    def line_height(self, size: int) -> int:
+        """指定字号的行高"""
+        if not self.scalable:
+            return int(self._line_height * LINE_SPACING)
+        return int(self._line_height * size * LINE_SPACING + 0.5)
+
+    def wrap(self, text: str, size: int, max_width: float) -> List[str]:
+        """
+        贪心换行：中文逐字换行，英文单词尽量不拆开；行首标点挂到上一行末尾
+
+        Args:
+            text: 文字
+            size: 字号
+            max_width: 最大行宽
+
+        Returns:
+            各行文字
+        """
+        limit = max_width / self._scale(size)
+        lines: List[str] = []
+        current, current_width = "", 0.0
+        # 当前行最后一个空格之后的位置，英文单词溢出时从这里断行
+        word_start = 0
+        for char in str(text):
+            if char == "\n":
+                lines.append(current.rstrip())
+                current, current_width, word_start = "", 0.0, 0
+                continue
+            width = self._advances.get(char)
+            if width is None:
+                width = self._reference_advance(char)
+            if current and current_width + width > limit and char not in _NO_LINE_START and not char.isspace():
+                if char.isascii() and char.isalnum() and 0 < word_start < len(current):
+                    # 把未写完的英文单词整体移到下一行
+                    lines.append(current[:word_start].rstrip())
+                    current = current[word_start:]
+                    current_width = sum(self._advances[c] for c in current)
+                else:
+                    lines.append(current.rstrip())
+                    current, current_width = "", 0.0
+                word_start = 0
+                current += char
+                current_width += width
+                continue
+            current += char
+            current_width += width
+            if char.isspace() or not char.isascii():
+                word_start = len(current)
+        if current.strip():
+            lines.append(current.rstrip())
+        return lines
+
+
+@lru_cache(maxsize=8)
+def get_glyph_metrics(font_path: Optional[str] = None) -> GlyphMetrics:
+    """获取字体的字形宽度缓存，每个字体进程内只有一份"""
+    return GlyphMetrics(font_path or resolve_font_path())
+
+
+def scale_style(style_config: Dict, scale: float) -> Dict:
+    """
+    按比例缩放样式配置中的字号，用于在缩放后的模板上保持相同版式
+
+    Args:
+        style_config: 样式配置
+        scale: 缩放比例
+
+    Returns:
+        新的样式配置
+    """
+    scaled = {}
+    for key, style in style_config.items():
+        style = dict(style)
+        if "size" in style:
+            style["size"] = max(1, round(style["size"] * scale))
+        scaled[key] = style
+    return scaled
+
+
+class TextBlock(NamedTuple):
+    """排好的一段文字"""
+    size: int
+    lines: List[str]
+    line_height: int
+
+    @property
+    def height(self) -> int:
+        return len(self.lines) * self.line_height
+
+
+def fit_text(paragraphs: List[str], box_width: int, box_height: int, max_size: int,
+             min_size: int = MIN_FONT_SIZE, metrics: GlyphMetrics = None) -> TextBlock:
+    """
+    二分查找能放进区域的最大字号
+
+    Args:
+        paragraphs: 段落列表，每段单独换行
+        box_width: 区域宽度
+        box_height: 区域高度
+        max_size: 字号上限（用户设置的字号）
+        min_size: 字号下限，仍放不下时按下限排版，超出部分由调用方裁掉
+        metrics: 字形宽度缓存
+
+    Returns:
+        排版结果
+    """
+    metrics = metrics or get_glyph_metrics()
+    min_size = min(min_size, max_size)
+
+    def layout(size: int) -> TextBlock:
+        lines = []
+        for paragraph in paragraphs:
+            lines.extend(metrics.wrap(paragraph, size, box_width))
+        return TextBlock(size, lines, metrics.line_height(size))
+
+    def fits(block: TextBlock) -> bool:
+        if block.height > box_height:
+            return False
+        # 单个字符比区域还宽时 wrap 无法再拆
+        return all(metrics.text_width(line, block.size) <= box_width for line in block.lines)
+
+    best = layout(min_size)
+    if not metrics.scalable:
+        return best
+    low, high = min_size + 1, max_size
+    while low <= high:
+        middle = (low + high) // 2
+        block = layout(middle)
+        if fits(block):
+            best, low = block, middle + 1
+        else:
+            high = middle - 1
+
+    # 缓存宽度不含字距调整，用真实字体校正一次，通常不需要缩小
+    while best.size > min_size:
+        font = load_font(best.size, metrics.font_path)
+        if all(font.getlength(line) <= box_width for line in best.lines):
+            break
+        best = layout(best.size - 1)
+    return best
+
+
+class PlacedText(NamedTuple):
+    """放置到图片上的文字块"""
+    key: str
+    block: TextBlock
+    box: Box
+    align: str
+
+
+# 样式配置中没有颜色时使用的默认颜色
+DEFAULT_COLORS = {"title": "#FF6B35", "subtitle": "#333333", "selling_points": "#666666"}
+
+
+class TextElement(NamedTuple):
+    """
+    确定了颜色和每行坐标、可以直接绘制的文字元素
+
+    两个元素相等即绘制结果完全相同，增量渲染据此判断哪些元素需要重画
+    """
+    placed: PlacedText
+    color: str
+    runs: Tuple[Tuple[int, int, str], ...]
+    font_path: Optional[str]
+
+    @property
+    def key(self) -> str:
+        return self.placed.key
+
+    @property
+    def shadow_offset(self) -> int:
+        """标题带阴影，其他文字没有"""
+        return max(2, self.placed.block.size // 18) if self.key == "title" else 0
+
+    def run_bounds(self) -> List[Box]:
+        """每一行绘制会改动的像素范围 (x0, y0, x1, y1)，包含阴影"""
+        font = load_font(self.placed.block.size, self.font_path)
+        offset = self.shadow_offset
+        boxes = []
+        for x, y, line in self.runs:
+            left, top, right, bottom = font.getbbox(line)
+            boxes.append((x + math.floor(left), y + math.floor(top),
+                          x + math.ceil(right) + offset + 1, y + math.ceil(bottom) + offset + 1))
+        return boxes
+
+    def bounds(self) -> Box:
+        """整个元素绘制会改动的像素范围"""
+        boxes = self.run_bounds()
+        if not boxes:
+            return 0, 0, 0, 0
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def draw(self, draw, origin: Tuple[int, int] = (0, 0)):
+        """
+        绘制到画布上
+
+        Args:
+            draw: ImageDraw 对象
+            origin: 画布左上角在整张图中的坐标，画布是局部裁剪区域时使用
+        """
+        font = load_font(self.placed.block.size, self.font_path)
+        offset = self.shadow_offset
+        for x, y, line in self.runs:
+            x, y = x - origin[0], y - origin[1]
+            if offset:
+                # 添加文字阴影效果
+                draw.text((x + offset, y + offset), line, font=font, fill="#000000")
+            draw.text((x, y), line, font=font, fill=self.color)
+
+
+def _scaled_regions(analysis: Optional[Dict], image_size: Tuple[int, int]) -> Tuple[Dict[str, Box], List[Box]]:
+    """把分析结果中的区域换算到当前图片尺寸，宽高比不一致（分析的不是这张模板）时忽略"""
+    width, height = image_size
+    if not analysis or not analysis.get("width") or not analysis.get("height"):
+        return {}, []
+    if abs(analysis["width"] / analysis["height"] - width / height) > 0.01:
+        return {}, []
+    scale_x = width / analysis["width"]
+    scale_y = height / analysis["height"]
+
+    def scale(region: Dict) -> Box:
+        return (int(region["x"] * scale_x), int(region["y"] * scale_y),
+                int(region["width"] * scale_x), int(region["height"] * scale_y))
+
+    zones = {name: scale(zone) for name, zone in analysis.get("layout_zones", {}).items()}
+    regions = [scale(region) for region in analysis.get("text_regions", [])]
+    return zones, regions
+
+
+def _inset(box: Box, margin_x: int, margin_y: int) -> Box:
+    x, y, w, h = box
+    return x + margin_x, y + margin_y, max(w - 2 * margin_x, 1), max(h - 2 * margin_y, 1)
+
+
+class TextLayoutEngine:
+    """
+    主图文字排版：标题、副标题、卖点分别放进模板的标题区、主体区和底部区，
+    优先使用分析出的文字区域，自动换行并缩小字号直到放得下
+    """
+
+    # 文字 -> (布局区域, 默认字号, 对齐方式)
+    SLOTS = {
+        "title": ("header", 36, "center"),
+        "subtitle": ("main", 24, "center"),
+        "selling_points": ("footer", 18, "left"),
+    }
+
+    def __init__(self, metrics: GlyphMetrics = None, min_size: int = MIN_FONT_SIZE):
+        self.metrics = metrics or get_glyph_metrics()
+        self.min_size = min_size
+
+    def boxes(self, image_size: Tuple[int, int], analysis: Dict = None) -> Dict[str, Box]:
+        """
+        计算各文字的排版区域
+
+        Args:
+            image_size: 图片尺寸
+            analysis: analyze_template 的结果（可选）
+
+        Returns:
+            文字键到区域 (x, y, 宽, 高) 的映射
+        """
+        width, height = image_size
+        zones, regions = _scaled_regions(analysis, image_size)
+        if not zones:
+            zones = {
+                "header": (0, 0, width, height // 4),
+                "main": (0, height // 4, width, height // 2),
+                "footer": (0, 3 * height // 4, width, height // 4),
+            }
+
+        boxes = {}
+        for key, (zone_name, _, _) in self.SLOTS.items():
+            zone = zones.get(zone_name)
+            if zone is None:
+                continue
+            # 中心落在该区域内的最大文字区域，足够容纳文字时优先使用
+            zx, zy, zw, zh = zone
+            candidates = [r for r in regions
+                          if zx <= r[0] + r[2] / 2 < zx + zw and zy <= r[1] + r[3] / 2 < zy + zh
+                          and r[2] >= zw // 3]
+            box = max(candidates, key=lambda r: r[2] * r[3]) if candidates else zone
+            boxes[key] = _inset(box, max(box[2] // 20, 4), max(box[3] // 10, 2))
+        return boxes
+
+    def layout(self, texts: Dict, style_config: Dict, image_size: Tuple[int, int],
+               analysis: Dict = None) -> List[PlacedText]:
+        """
+        排版所有文字
+
+        Args:
+            texts: 文字内容字典
+            style_config: 样式配置，size 作为字号上限
+            image_size: 图片尺寸
+            analysis: analyze_template 的结果（可选）
+
+        Returns:
+            排好的文字块列表
+        """
+        boxes = self.boxes(image_size, analysis)
+        placed = []
+        for key, (_, default_size, align) in self.SLOTS.items():
+            if key not in texts or key not in boxes:
+                continue
+            if key == "selling_points":
+                if not isinstance(texts[key], list):
+                    continue
+                paragraphs = [f"• {point}" for point in texts[key][:3]]
+                style = style_config.get("content", {})
+            else:
+                paragraphs = [str(texts[key])]
+                style = style_config.get(key, {})
+            box = boxes[key]
+            block = fit_text(paragraphs, box[2], box[3], style.get("size", default_size),
+                             self.min_size, self.metrics)
+            placed.append(PlacedText(key, block, box, align))
+        return placed
+
+    def elements(self, texts: Dict, style_config: Dict, image_size: Tuple[int, int],
+                 analysis: Dict = None) -> List[TextElement]:
+        """
+        排版并确定每行的绘制坐标
+
+        Args:
+            texts: 文字内容字典
+            style_config: 样式配置
+            image_size: 图片尺寸
+            analysis: analyze_template 的结果（可选）
+
+        Returns:
+            按绘制顺序排列的文字元素
+        """
+        elements = []
+        for placed in self.layout(texts, style_config, image_size, analysis):
+            style_key = "content" if placed.key == "selling_points" else placed.key
+            color = style_config.get(style_key, {}).get("color", DEFAULT_COLORS[placed.key])
+            font = load_font(placed.block.size, self.metrics.font_path)
+
+            box_x, box_y, box_width, box_height = placed.box
+            # 最小字号仍放不下时只绘制区域内的行
+            visible = max(1, min(len(placed.block.lines), box_height // placed.block.line_height))
+            lines = placed.block.lines[:visible]
+            # 在区域内垂直居中
+            y = box_y + (box_height - len(lines) * placed.block.line_height) // 2
+
+            runs = []
+            for line in lines:
+                if placed.align == "center":
+                    x = box_x + (box_width - int(font.getlength(line))) // 2
+                else:
+                    x = box_x
+                runs.append((x, y, line))
+                y += placed.block.line_height
+            elements.append(TextElement(placed, color, tuple(runs), self.metrics.font_path))
+        return elements
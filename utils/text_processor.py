@@ -2,6 +2,68 @@ import re
 import jieba
 from typing import List, Dict, Tuple
 from config import FORBIDDEN_WORDS
+from utils.analysis_cache import memoize_analysis
+from utils.instrumentation import span, timed
+from utils.result_types import ComplianceResult
+
+def parse_article(text: str, default_title: str = "") -> Dict[str, str]:
+    """
+    解析文章文本，支持 demo/sample_article.txt 的"标题：…/内容：…"格式
+    
+    Args:
+        text: 文章全文
+        default_title: 没有"标题："行时使用的标题
+        
+    Returns:
+        包含 title 和 content 的字典
+    """
+    title = default_title
+    lines = text.strip().splitlines()
+    if lines and lines[0].startswith("标题："):
+        title = lines[0][len("标题："):].strip()
+        lines = lines[1:]
+    
+    content = "\n".join(lines).strip()
+    if content.startswith("内容："):
+        content = content[len("内容："):].strip()
+    
+    return {"title": title, "content": content}
+
+
+class ForbiddenWordScanner:
+    """增量违禁词扫描器，用于流式文本：每次只检查新片段及其前面可能跨片段的尾部"""
+    
+    def __init__(self, forbidden_words):
+        self._words = {word.lower(): word for word in forbidden_words}
+        self._overlap = max((len(word) for word in self._words), default=1) - 1
+        self._tail = ""
+        self.found_words: List[str] = []
+    
+    def feed(self, chunk: str) -> List[str]:
+        """
+        输入新的文本片段
+        
+        Args:
+            chunk: 新到达的文本片段
+            
+        Returns:
+            本次新发现的违禁词列表
+        """
+        window = self._tail + chunk.lower()
+        new_words = []
+        for word_lower, word in self._words.items():
+            if word not in self.found_words and word_lower in window:
+                new_words.append(word)
+        
+        self.found_words.extend(new_words)
+        self._tail = window[-self._overlap:] if self._overlap else ""
+        return new_words
+    
+    @property
+    def overlap(self) -> int:
+        """可能跨片段的最大长度：已检查文本末尾这么多字符可能是下一段中违禁词的开头"""
+        return self._overlap
+
 
 class TextProcessor:
     """文本处理类，负责违禁词检测、关键词提取等功能"""
@@ -9,8 +71,11 @@ class TextProcessor:
     def __init__(self):
         self.forbidden_words = set(FORBIDDEN_WORDS)
         # 初始化jieba分词
-        jieba.initialize()
+        with span("text.jieba_init"):
+            jieba.initialize()
     
+    @memoize_analysis(result_type=ComplianceResult)
+    @timed("text.check_forbidden_words")
     def check_forbidden_words(self, text: str) -> Dict[str, List[str]]:
         """
         检测文本中的违禁词
@@ -34,6 +99,14 @@ class TextProcessor:
             "suggestion": self._get_replacement_suggestions(found_words)
         }
     
+    def _memo_token(self) -> int:
+        """缓存键的一部分，违禁词库变化后旧的分析结果不再命中"""
+        return hash(frozenset(self.forbidden_words))
+    
+    def create_forbidden_scanner(self) -> ForbiddenWordScanner:
+        """创建用于流式文本的增量违禁词扫描器"""
+        return ForbiddenWordScanner(self.forbidden_words)
+    
     def _get_replacement_suggestions(self, forbidden_words: List[str]) -> Dict[str, str]:
         """为违禁词提供替换建议"""
         suggestions = {
@@ -61,6 +134,8 @@ class TextProcessor:
         
         return result
     
+    @memoize_analysis
+    @timed("text.extract_keywords")
     def extract_keywords(self, text: str, top_k: int = 10) -> List[str]:
         """
         从文本中提取关键词
@@ -73,7 +148,8 @@ class TextProcessor:
             关键词列表
         """
         # 使用jieba进行分词
-        words = jieba.cut(text)
+        with span("text.jieba"):
+            words = list(jieba.cut(text))
         
         # 过滤停用词和标点符号
         stop_words = {
@@ -96,6 +172,8 @@ class TextProcessor:
         
         return [word for word, freq in sorted_words[:top_k]]
     
+    @memoize_analysis
+    @timed("text.generate_title_variants")
     def generate_title_variants(self, original_title: str) -> List[str]:
         """
         根据原标题生成多个变体，用于主图设计
@@ -126,6 +204,7 @@ class TextProcessor:
         
         return variants
     
+    @memoize_analysis
     def optimize_for_image_text(self, text: str, max_length: int = 20) -> str:
         """
         优化文本用于图片显示
@@ -154,6 +233,8 @@ class TextProcessor:
         
         return text
     
+    @memoize_analysis
+    @timed("text.extract_selling_points")
     def extract_selling_points(self, content: str) -> List[str]:
         """
         从文章内容中提取卖点